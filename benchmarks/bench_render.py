@@ -0,0 +1,53 @@
+# Preview row materialization: the old iterrows() path vs render_rows().
+#
+#   python benchmarks/bench_render.py              # 10k, 100k, 1M rows
+#   python benchmarks/bench_render.py 5000 50000   # custom sizes
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import render_rows  # noqa: E402
+
+
+def make_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    floats = rng.random(n) * 1000
+    floats[::11] = np.nan
+    ids = rng.integers(0, 10_000, n).astype("float64")
+    ids[::13] = np.nan
+    text = np.array(["north", "south", "east", "west", None], dtype=object)[rng.integers(0, 5, n)]
+    return pd.DataFrame({
+        "id": np.arange(n),
+        "customer": ids,
+        "amount": floats,
+        "date": pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 2000, n), unit="D"),
+        "region": text,
+        "note": ["lorem ipsum " * (1 + i % 30) for i in range(n)],
+    })
+
+
+def iterrows_path(df):
+    return [list(row) for _, row in df.iterrows()]
+
+
+def timed(fn, df):
+    t0 = time.perf_counter()
+    fn(df)
+    return time.perf_counter() - t0
+
+
+def main(sizes):
+    print(f"{'rows':>10} {'iterrows s':>12} {'render_rows s':>14} {'speedup':>9}")
+    for n in sizes:
+        df = make_frame(n)
+        old = timed(iterrows_path, df)
+        new = timed(render_rows, df)
+        print(f"{n:>10,} {old:>12.3f} {new:>14.3f} {old / new:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,379 @@
+# Headless timings of the operation paths behind the window, on synthetic data (workbook.py):
+# opening and parsing workbooks, VLOOKUP (exact and fuzzy), compare, row diff, concatenation, unique values,
+# stacking, preview rendering / sort / filter and export. Each case records its best wall time over
+# --repeat runs and, from one extra run under tracemalloc, the peak memory it allocated
+# (Python and NumPy allocations; Arrow buffers aren't seen). Results are written as JSON;
+# --baseline compares them with an earlier file and exits 1 when a case got slower or hungrier.
+#
+#   python benchmarks/suite.py                                # 10k, 100k, 1M rows
+#   python benchmarks/suite.py --rows 100000 --cases vlookup compare -o after.json --baseline before.json
+#   python benchmarks/suite.py --key-cardinality 5000 --duplicate-rate 0.2 --text-width 60
+#
+# Cases reading or writing .xlsx only run up to --max-excel-rows (a million-row workbook takes
+# minutes through openpyxl); generated workbooks are kept in --data-dir and reused.
+import argparse
+import datetime
+import gc
+import importlib.metadata
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+from engine import (  # noqa: E402
+    DiskCache, FrameView, KeyIndexCache, SheetCache, SheetRegistry, compact_frame, export_frame, pick_engine,
+    render_rows, run_compare, run_concat, run_diff, run_stack, run_unique, run_vlookup,
+)
+from workbook import KEY_COLUMN, make_lookup, make_sheet, write_workbook  # noqa: E402
+
+RESULTS_VERSION = 1
+DEFAULT_ROWS = (10_000, 100_000, 1_000_000)
+MAX_EXCEL_ROWS = 100_000
+TOLERANCE = 0.15            # slower / bigger than the baseline by more than this is a regression
+NOISE_SECONDS = 0.005       # differences below these never count
+NOISE_BYTES = 1024 * 1024
+SHEET = "Data"
+STACK_PARTS = 4             # stack: the main sheet split into this many workbooks
+RENDER_BLOCK = 600          # rows the preview grid materializes around the visible window
+EXCEL_CASES = ("open", "parse", "parse_cached", "export_xlsx")
+DIFF_CHANGE_RATE = 0.01     # diff: share of rows edited, and of rows dropped / added, in the new version
+
+
+# The data for one row count; workbooks on disk are only written when an Excel case asks.
+class Fixture:
+    def __init__(self, rows, shape, data_dir, compact):
+        self.rows = rows
+        self.shape = shape
+        self.data_dir = data_dir
+        self.compact = compact
+        self.tmp = tempfile.mkdtemp(prefix="abg-bench-")
+        cardinality = shape["key_cardinality"] or rows
+        self.main = self._ready(make_sheet(rows, shape["cols"], shape["key_cardinality"], shape["text_width"]))
+        self.lookup = self._ready(make_lookup(cardinality, shape["duplicate_rate"], max(2, shape["cols"] // 2),
+                                              shape["text_width"]))
+        self.registry = self.new_registry()
+        self.registry.attach("main", SHEET, self.main)
+        self.registry.attach("lookup", SHEET, self.lookup)
+        step = -(-rows // STACK_PARTS)
+        self.parts = [(f"part{i}", SHEET) for i in range(STACK_PARTS)]
+        for i, (path, sheet) in enumerate(self.parts):
+            self.registry.attach(path, sheet, self.main.iloc[i * step:(i + 1) * step])
+        self._workbook = None
+        self._disk_cache = None
+
+    # sheets held as the app holds them after a load
+    def _ready(self, df):
+        return compact_frame(df)[0] if self.compact else df
+
+    def new_registry(self, disk_cache=None):
+        return SheetRegistry(SheetCache(1 << 62), disk_cache, compact=self.compact)
+
+    @property
+    def workbook(self):
+        if self._workbook is None:
+            s = self.shape
+            name = (f"main-{self.rows}r-{s['cols']}c-k{s['key_cardinality'] or 'all'}-w{s['text_width']}.xlsx")
+            path = os.path.join(self.data_dir, name)
+            if not os.path.isfile(path):
+                print(f"  writing {path} ...", flush=True)
+                write_workbook(path, {SHEET: make_sheet(self.rows, s["cols"], s["key_cardinality"], s["text_width"])})
+            self._workbook = path
+        return self._workbook
+
+    @property
+    def disk_cache(self):
+        if self._disk_cache is None:
+            self._disk_cache = DiskCache(os.path.join(self.tmp, "cache"), 1 << 62)
+            registry = self.new_registry(self._disk_cache)
+            registry.open(self.workbook)
+            registry.get(self.workbook, SHEET)
+        return self._disk_cache
+
+    def out(self, name):
+        return os.path.join(self.tmp, name)
+
+    def close(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+
+# ---------- Cases ----------
+# Each takes the fixture, does its untimed setup and returns the call to time.
+def case_open(fx):
+    registry = fx.new_registry()
+    return lambda: registry.open(fx.workbook)
+
+
+def case_parse(fx):
+    registry = fx.new_registry()
+    registry.open(fx.workbook)
+    return lambda: registry.get(fx.workbook, SHEET)
+
+
+def case_parse_cached(fx):
+    registry = fx.new_registry(fx.disk_cache)
+    registry.open(fx.workbook)
+    return lambda: registry.get(fx.workbook, SHEET)
+
+
+def _vlookup(fx, key_indexes):
+    return run_vlookup(fx.registry, "main", SHEET, [KEY_COLUMN], "lookup", SHEET, [KEY_COLUMN],
+                       key_indexes=key_indexes)
+
+
+def case_vlookup(fx):
+    return lambda: _vlookup(fx, KeyIndexCache())
+
+
+# a repeat VLOOKUP against the same lookup sheet reuses its key index
+def case_vlookup_warm(fx):
+    key_indexes = KeyIndexCache()
+    _vlookup(fx, key_indexes)
+    return lambda: _vlookup(fx, key_indexes)
+
+
+# trigram blocking and scoring over the lookup keys, in a process pool from FUZZY_PARALLEL_MIN keys
+def case_vlookup_fuzzy(fx):
+    return lambda: run_vlookup(fx.registry, "main", SHEET, [KEY_COLUMN], "lookup", SHEET, [KEY_COLUMN],
+                               mode="fuzzy")
+
+
+def case_compare(fx):
+    return lambda: run_compare(fx.registry, "main", SHEET, [KEY_COLUMN], "lookup", SHEET, [KEY_COLUMN],
+                               normalize=("numeric_text",))
+
+
+# the main sheet against a next version of itself with a few edited, dropped and added rows
+def case_diff(fx):
+    new = fx.main.copy()
+    n = max(1, int(len(new) * DIFF_CHANGE_RATE))
+    edited = "Note" if "Note" in new.columns else new.columns[-1]
+    new[edited] = new[edited].astype(object)
+    new.iloc[::max(1, len(new) // n), new.columns.get_loc(edited)] = "edited"
+    added = new.iloc[:n].copy()
+    added[KEY_COLUMN] = added[KEY_COLUMN].astype(str) + "+"
+    fx.registry.attach("main_new", SHEET, fx._ready(pd.concat([new.iloc[n:], added], ignore_index=True)))
+    return lambda: run_diff(fx.registry, "main", SHEET, [KEY_COLUMN], "main_new", SHEET)
+
+
+def case_concat(fx):
+    cols = [KEY_COLUMN] + [c for c in ("Region", "Amount", "Date") if c in fx.main.columns]
+    return lambda: run_concat(fx.registry, "main", SHEET, cols, sep=" ")
+
+
+def case_unique(fx):
+    return lambda: run_unique(fx.registry, "main", SHEET, KEY_COLUMN, counts=True, sort="frequency")
+
+
+def case_stack(fx):
+    return lambda: run_stack(fx.registry, fx.parts)
+
+
+def case_render(fx):
+    starts = [fx.rows * i // 10 for i in range(10)]
+    return lambda: [render_rows(fx.main, start, start + RENDER_BLOCK) for start in starts]
+
+
+def case_view_sort(fx):
+    return lambda: FrameView(fx.main).set_sort(0)
+
+
+def case_view_filter(fx):
+    def run():
+        view = FrameView(fx.main)
+        view.set_filter(list(fx.main.columns).index("Region") if "Region" in fx.main.columns else 0, "=north")
+        view.set_search("K0000")
+    return run
+
+
+def case_export_csv(fx):
+    return lambda: export_frame(fx.main, fx.out("out.csv.gz"))
+
+
+def case_export_xlsx(fx):
+    return lambda: export_frame(fx.main, fx.out("out.xlsx"))
+
+
+CASES = {
+    "open": case_open,
+    "parse": case_parse,
+    "parse_cached": case_parse_cached,
+    "vlookup": case_vlookup,
+    "vlookup_warm": case_vlookup_warm,
+    "vlookup_fuzzy": case_vlookup_fuzzy,
+    "compare": case_compare,
+    "diff": case_diff,
+    "concat": case_concat,
+    "unique": case_unique,
+    "stack": case_stack,
+    "render": case_render,
+    "view_sort": case_view_sort,
+    "view_filter": case_view_filter,
+    "export_csv": case_export_csv,
+    "export_xlsx": case_export_xlsx,
+}
+
+
+# ---------- Running ----------
+def measure(setup, fx, repeat, memory):
+    times = []
+    for _ in range(repeat):
+        fn = setup(fx)
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    peak = None
+    if memory:
+        fn = setup(fx)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {"seconds": min(times), "runs": times, "peak_bytes": peak}
+
+
+def _version(name):
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def _commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(HERE),
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def environment(shape, compact):
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "excel_engine": pick_engine("x.xlsx"),
+        "compact": compact,
+        "shape": shape,
+        "packages": {p: _version(p) for p in ("pandas", "numpy", "pyarrow", "openpyxl", "python-calamine")},
+    }
+
+
+def run_suite(sizes, cases, shape, repeat=3, memory=True, compact=True, max_excel_rows=MAX_EXCEL_ROWS,
+              data_dir=None):
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), "abg-bench-data")
+    results = []
+    for rows in sizes:
+        print(f"{rows:,} rows", flush=True)
+        fx = Fixture(rows, shape, data_dir, compact)
+        try:
+            for name in cases:
+                entry = {"case": name, "rows": rows}
+                if name in EXCEL_CASES and rows > max_excel_rows:
+                    entry["skipped"] = f"over --max-excel-rows {max_excel_rows:,}"
+                    print(f"  {name:<14} skipped ({entry['skipped']})", flush=True)
+                else:
+                    entry.update(measure(CASES[name], fx, repeat, memory))
+                    print(f"  {name:<14} {_seconds(entry['seconds']):>10} {_megabytes(entry['peak_bytes']):>10}",
+                          flush=True)
+                results.append(entry)
+        finally:
+            fx.close()
+    return {"version": RESULTS_VERSION, "environment": environment(shape, compact), "results": results}
+
+
+def _seconds(s):
+    return "-" if s is None else f"{s * 1000:,.1f} ms" if s < 1 else f"{s:,.2f} s"
+
+
+def _megabytes(b):
+    return "-" if b is None else f"{b / 1024 ** 2:,.1f} MB"
+
+
+# [(case, rows, what, old, new, ratio, regressed)] for the cases both runs measured
+def compare_results(baseline, current, tolerance=TOLERANCE):
+    old = {(r["case"], r["rows"]): r for r in baseline["results"] if "seconds" in r}
+    rows = []
+    for r in current["results"]:
+        base = old.get((r["case"], r["rows"]))
+        if base is None or "seconds" not in r:
+            continue
+        for what, noise in (("seconds", NOISE_SECONDS), ("peak_bytes", NOISE_BYTES)):
+            a, b = base.get(what), r.get(what)
+            if a is None or b is None:
+                continue
+            ratio = b / a if a else float("inf") if b else 1.0
+            regressed = ratio > 1 + tolerance and b - a > noise
+            rows.append((r["case"], r["rows"], what, a, b, ratio, regressed))
+    return rows
+
+
+def print_comparison(rows):
+    fmt = {"seconds": _seconds, "peak_bytes": _megabytes}
+    print(f"{'case':<14} {'rows':>10} {'':<6} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for case, n, what, a, b, ratio, regressed in rows:
+        label = "time" if what == "seconds" else "memory"
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{case:<14} {n:>10,} {label:<6} {fmt[what](a):>10} {fmt[what](b):>10} {ratio:>6.2f}x{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the ABG-Excel operations on synthetic workbooks.")
+    parser.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS))
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--cols", type=int, default=8, help="columns of the main sheet, Key included")
+    parser.add_argument("--key-cardinality", type=int, help="distinct keys (default: one per row)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="extra lookup rows repeating keys")
+    parser.add_argument("--text-width", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case; the best counts")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--no-compact", action="store_true", help="hold sheets as parsed, without compaction")
+    parser.add_argument("--max-excel-rows", type=int, default=MAX_EXCEL_ROWS)
+    parser.add_argument("--data-dir", help="where generated workbooks are kept (default: a temp folder)")
+    parser.add_argument("-o", "--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="earlier results to compare with; exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help=f"default {TOLERANCE:.0%}")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        if baseline.get("version") != RESULTS_VERSION:
+            parser.error(f"{args.baseline} is not a results file of this suite")
+    shape = {"cols": args.cols, "key_cardinality": args.key_cardinality, "duplicate_rate": args.duplicate_rate,
+             "text_width": args.text_width}
+    results = run_suite(args.rows, args.cases, shape, max(1, args.repeat), not args.no_memory,
+                        not args.no_compact, args.max_excel_rows, args.data_dir)
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(results, fh, indent=2)
+    print(f"results written to {args.output}")
+    if baseline is None:
+        return 0
+    if baseline["environment"].get("shape") != shape:
+        print("note: the baseline was run on a different shape", file=sys.stderr)
+    rows = compare_results(baseline, results, args.tolerance)
+    print_comparison(rows)
+    regressions = sum(1 for row in rows if row[-1])
+    print(f"{regressions} regression(s)" if regressions else "no regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
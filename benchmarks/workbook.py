@@ -0,0 +1,143 @@
+# Synthetic workbooks of a chosen shape, for the benchmark suite (and for trying the app on
+# data too big to share). Everything is drawn from a seeded generator, so the same arguments
+# always give the same cells.
+#
+#   python benchmarks/workbook.py sales.xlsx --rows 100000 --cols 12 --sheets 3
+#   python benchmarks/workbook.py keys.csv --rows 1000000 --key-cardinality 50000 --text-width 40
+#   python benchmarks/workbook.py ref.xlsx --lookup --rows 50000 --duplicate-rate 0.05
+#
+# A main sheet has a text Key column drawn from key_cardinality distinct keys (every row its own
+# key by default) followed by payload columns of mixed kinds. A lookup sheet holds each key once,
+# shifted so ~10% of the main sheet's keys are missing from it, plus duplicate_rate extra rows
+# repeating keys. .csv writes one file per sheet (name_<sheet>.csv when there are several).
+import argparse
+import os
+import string
+
+import numpy as np
+import pandas as pd
+
+KEY_COLUMN = "Key"
+REGIONS = ("north", "south", "east", "west", "central", "export", "online", "retail")
+PAYLOAD_KINDS = ("region", "amount", "date", "note", "qty", "code", "flag")
+LOOKUP_MISSING = 0.1        # share of main keys the lookup sheet lacks
+TEXT_POOL = 4096            # distinct note texts; drawing from a pool keeps generation fast
+
+
+def key_text(codes):
+    return pd.Series(codes).map("K{:09d}".format).to_numpy(dtype=object)
+
+
+def _text_pool(rng, width, size=TEXT_POOL):
+    letters = np.array(list(string.ascii_lowercase + "     "))
+    chars = rng.choice(letters, (size, max(1, width)))
+    return np.array(["".join(row).strip() or "x" for row in chars], dtype=object)
+
+
+def _payload(kind, n, rng, text_width):
+    if kind == "region":
+        return np.array(REGIONS, dtype=object)[rng.integers(0, len(REGIONS), n)]
+    if kind == "amount":
+        values = np.round(rng.gamma(2.0, 250.0, n), 2)
+        values[rng.random(n) < 0.05] = np.nan
+        return values
+    if kind == "date":
+        return pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 2500, n), unit="D")
+    if kind == "note":
+        return _text_pool(rng, text_width)[rng.integers(0, TEXT_POOL, n)]
+    if kind == "qty":
+        return rng.integers(1, 500, n)
+    if kind == "code":
+        return key_text(rng.integers(0, 1000, n))
+    return rng.random(n) < 0.3
+
+
+def _payload_columns(n, cols, rng, text_width):
+    out = {}
+    for i in range(max(0, cols)):
+        kind = PAYLOAD_KINDS[i % len(PAYLOAD_KINDS)]
+        name = kind.capitalize() if i < len(PAYLOAD_KINDS) else f"{kind.capitalize()}{i // len(PAYLOAD_KINDS) + 1}"
+        out[name] = _payload(kind, n, rng, text_width)
+    return out
+
+
+# cols counts every column, Key included
+def make_sheet(rows, cols=8, key_cardinality=None, text_width=12, seed=0):
+    rng = np.random.default_rng(seed)
+    if key_cardinality is None or key_cardinality >= rows:
+        codes = rng.permutation(rows)
+    else:
+        codes = rng.integers(0, max(1, key_cardinality), rows)
+    return pd.DataFrame({KEY_COLUMN: key_text(codes), **_payload_columns(rows, cols - 1, rng, text_width)})
+
+
+def make_lookup(key_cardinality, duplicate_rate=0.0, cols=4, text_width=12, seed=1):
+    rng = np.random.default_rng(seed)
+    shift = int(key_cardinality * LOOKUP_MISSING)
+    codes = np.arange(shift, key_cardinality + shift)
+    extra = int(round(len(codes) * duplicate_rate))
+    if extra:
+        codes = np.concatenate([codes, rng.choice(codes, extra)])
+    codes = rng.permutation(codes)
+    return pd.DataFrame({KEY_COLUMN: key_text(codes), **_payload_columns(len(codes), cols - 1, rng, text_width)})
+
+
+def _excel_values(df):
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+
+# sheets: {name: DataFrame}
+def write_workbook(path, sheets):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    if path.lower().endswith(".csv"):
+        stem = path[:-4]
+        for name, df in sheets.items():
+            df.to_csv(path if len(sheets) == 1 else f"{stem}_{name}.csv", index=False)
+        return
+    import openpyxl
+    tmp = path + ".part"
+    wb = openpyxl.Workbook(write_only=True)
+    for name, df in sheets.items():
+        ws = wb.create_sheet(name)
+        ws.append([str(c) for c in df.columns])
+        for start in range(0, len(df), 50_000):
+            for row in _excel_values(df.iloc[start:start + 50_000]):
+                ws.append(row)
+    wb.save(tmp)
+    os.replace(tmp, path)
+
+
+def make_workbook(path, rows, cols=8, sheets=1, key_cardinality=None, duplicate_rate=0.0, text_width=12,
+                  seed=0, lookup=False):
+    frames = {}
+    for i in range(sheets):
+        if lookup:
+            df = make_lookup(key_cardinality or rows, duplicate_rate, cols, text_width, seed + i)
+        else:
+            df = make_sheet(rows, cols, key_cardinality, text_width, seed + i)
+        frames["Data" if sheets == 1 else f"Data{i + 1}"] = df
+    write_workbook(path, frames)
+    return frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic workbook for benchmarks.")
+    parser.add_argument("output", help=".xlsx or .csv")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--cols", type=int, default=8, help="columns per sheet, Key included")
+    parser.add_argument("--sheets", type=int, default=1)
+    parser.add_argument("--key-cardinality", type=int, help="distinct keys (default: one per row)")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="lookup sheets: extra rows repeating keys")
+    parser.add_argument("--text-width", type=int, default=12, help="characters in the Note columns")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lookup", action="store_true", help="write lookup sheets (each key once) instead")
+    args = parser.parse_args(argv)
+    make_workbook(args.output, args.rows, args.cols, args.sheets, args.key_cardinality, args.duplicate_rate,
+                  args.text_width, args.seed, args.lookup)
+    print(f"wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,584 @@
+# Command-line front end for the ABG-Excel operations; needs no display.
+#
+#   python cli.py vlookup orders.xlsx::Orders --lookup customers.xlsx --keys CustID --fetch Name Region -o out.xlsx
+#   python cli.py compare ledger.xlsx bank.xlsx::Statement --cols Ref --fail-on-diff -o diff.csv
+#   python cli.py vlookup orders.xlsx --lookup crm.xlsx --keys Customer --mode fuzzy --threshold 0.85 -o out.xlsx
+#   python cli.py diff yesterday.xlsx today.xlsx --keys OrderID -o changes.csv
+#   python cli.py unique data/*.xlsx --column Region -o "out/{stem}_regions.csv"
+#   python cli.py unique sales.xlsx --column Region Product --counts --sort frequency -o combos.csv
+#   python cli.py distinct data/*.xlsx --columns CustID --top 50 -o top_customers.csv
+#   python cli.py stack regions/*.xlsx --sheet "Sales*" -o all_regions.xlsx
+#   python cli.py concat data/*.xlsx --cols First Last --sep " " -o "out/{stem}.xlsx"
+#   python cli.py export book.xlsx::Sheet1 -o sheet1.csv.gz
+#   python cli.py run nightly.json
+#   python cli.py pipeline daily.json --source orders=today/orders.xlsx
+#   python cli.py vlookup big.xlsx --lookup ref.xlsx --keys ID -o out.csv.gz --out-of-core
+#
+# A sheet is FILE::SHEET, or just FILE for its first sheet. With several inputs the output
+# needs a {stem} placeholder. Jobs run side by side in worker processes (--workers).
+# A job file holds the same jobs as JSON, relative paths taken from the file's folder:
+#
+#   {"workers": 4, "jobs": [
+#       {"op": "vlookup", "main": "orders.xlsx::Orders", "lookup": "customers.xlsx",
+#        "keys": ["CustID"], "fetch": ["Name"], "output": "out/orders.xlsx"},
+#       {"op": "compare", "a": "ledger.xlsx", "b": "bank.xlsx", "cols": ["Ref"],
+#        "output": "out/diff.csv", "fail_on_diff": true}]}
+#
+# --out-of-core (or "out_of_core": true on a job, or ABG_OUT_OF_CORE=1) runs the operations in
+# DuckDB over sheets spilled to Parquet, for workbooks that don't fit in memory; each worker
+# process gets its own ABG_QUERY_MEMORY_MB. Fuzzy matching (--mode fuzzy) runs in memory either way.
+#
+# A pipeline file is a chain of steps recorded in the window (Pipeline > Save Recorded Steps);
+# replaying it re-runs only the steps whose inputs changed since the cached results.
+#
+# Exit codes: 0 ok, 1 a job failed, 2 bad arguments or job file, 3 missing file/sheet/column,
+# 4 differences found with --fail-on-diff, 130 interrupted.
+import argparse
+import atexit
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+
+from engine import (
+    APPROX_DIRECTIONS, DUPLICATE_POLICIES, NORMALIZE_OPTIONS, PARSE_PROCESSES, STACK_SOURCE_COLUMN, UNIQUE_SORTS,
+    DIFF_LAYOUTS, FUZZY_THRESHOLD, describe_compare, describe_diff, describe_distinct, describe_match, describe_stack, export_frame,
+    match_sheets, open_registry, run_compare, run_concat, run_diff, run_distinct_stats, run_stack, run_unique,
+    run_vlookup,
+)
+from outofcore import OUT_OF_CORE, open_out_of_core
+from pipeline import Pipeline, PipelineError, PipelineRunner
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INPUT = 3
+EXIT_DIFFERENCES = 4
+EXIT_INTERRUPTED = 130
+
+LOOKUP_MODES = ("exact",) + tuple(APPROX_DIRECTIONS) + ("fuzzy",)
+COMPARE_MODES = ("exact", "fuzzy")
+NORMALIZE_NAMES = tuple(opt for opt, _label in NORMALIZE_OPTIONS)
+
+# {op: (required fields, optional fields with defaults)}
+JOB_FIELDS = {
+    "vlookup": (("main", "lookup", "keys", "output"),
+                {"lookup_keys": None, "fetch": None, "mode": "exact", "policy": "first",
+                 "normalize": [], "threshold": FUZZY_THRESHOLD, "fail_on_diff": False}),
+    # numbers as text by default, like the Compare dialog
+    "compare": (("a", "b", "cols", "output"),
+                {"cols_b": None, "normalize": ["numeric_text"], "include_both": False,
+                 "whole_rows": False, "mode": "exact", "threshold": FUZZY_THRESHOLD, "fail_on_diff": False}),
+    # a is the old version, b the new one; cols defaults to every column both have
+    "diff": (("a", "b", "keys", "output"),
+             {"keys_b": None, "cols": None, "normalize": [], "layout": "cells", "fail_on_diff": False}),
+    # column: one name or a list for distinct combinations
+    "unique": (("input", "column", "output"), {"counts": False, "sort": "appearance"}),
+    # approximate distinct count and top values over every input sheet together
+    "distinct": (("inputs", "columns", "output"), {"top": 20}),
+    # inputs are FILE::SHEET, or FILE for its sheets matching sheet (a name or pattern; "" = first)
+    "stack": (("inputs", "output"), {"sheet": "", "source_column": STACK_SOURCE_COLUMN}),
+    "concat": (("input", "cols", "output"),
+               {"name": "Concatenated", "sep": " ", "prefix": "", "suffix": "",
+                "formats": {}, "skip_empty": False}),
+    "export": (("input", "output"), {}),
+}
+PATH_FIELDS = ("main", "lookup", "a", "b", "input", "output")
+
+
+class UsageError(ValueError):
+    pass
+
+
+class InputError(Exception):
+    pass
+
+
+# ---------- Jobs ----------
+def make_job(job, base_dir=""):
+    if not isinstance(job, dict):
+        raise UsageError(f"A job must be an object, got {job!r}")
+    op = job.get("op")
+    if op not in JOB_FIELDS:
+        raise UsageError(f"Unknown op {op!r}; expected one of {', '.join(JOB_FIELDS)}")
+    required, optional = JOB_FIELDS[op]
+    missing = [f for f in required if job.get(f) in (None, "", [])]
+    if missing:
+        raise UsageError(f"{op}: missing {', '.join(missing)}")
+    unknown = set(job) - set(required) - set(optional) - {"op", "out_of_core"}
+    if unknown:
+        raise UsageError(f"{op}: unknown field(s) {', '.join(sorted(unknown))}")
+    out = {"op": op, "out_of_core": OUT_OF_CORE, **optional, **job}
+    for field in PATH_FIELDS:
+        if field in out:
+            out[field] = os.path.join(base_dir, out[field])
+    if "inputs" in out:
+        out["inputs"] = [os.path.join(base_dir, p) for p in out["inputs"]]
+    modes = COMPARE_MODES if op == "compare" else LOOKUP_MODES
+    if out.get("mode", "exact") not in modes:
+        raise UsageError(f"{op}: mode must be one of {', '.join(modes)}")
+    if not 0 < out.get("threshold", FUZZY_THRESHOLD) <= 1:
+        raise UsageError(f"{op}: threshold must be above 0 and at most 1")
+    if out.get("policy", "first") not in DUPLICATE_POLICIES:
+        raise UsageError(f"{op}: policy must be one of {', '.join(DUPLICATE_POLICIES)}")
+    bad = set(out.get("normalize", ())) - set(NORMALIZE_NAMES)
+    if bad:
+        raise UsageError(f"{op}: unknown normalize option(s) {', '.join(sorted(bad))}")
+    if out.get("sort", "appearance") not in UNIQUE_SORTS:
+        raise UsageError(f"{op}: sort must be one of {', '.join(UNIQUE_SORTS)}")
+    if op == "vlookup" and len(out["lookup_keys"] or out["keys"]) != len(out["keys"]):
+        raise UsageError("vlookup: keys and lookup_keys need the same number of columns")
+    if op == "compare" and len(out["cols_b"] or out["cols"]) != len(out["cols"]):
+        raise UsageError("compare: cols and cols_b need the same number of columns")
+    if op == "diff" and len(out["keys_b"] or out["keys"]) != len(out["keys"]):
+        raise UsageError("diff: keys and keys_b need the same number of columns")
+    if out.get("layout", "cells") not in DIFF_LAYOUTS:
+        raise UsageError(f"{op}: layout must be one of {', '.join(DIFF_LAYOUTS)}")
+    return out
+
+
+def load_job_file(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise UsageError(f"Cannot read job file {path}: {e}")
+    workers = None
+    if isinstance(data, dict):
+        workers = data.get("workers")
+        data = data.get("jobs")
+    if not isinstance(data, list) or not data:
+        raise UsageError(f"{path}: expected a non-empty list of jobs")
+    base_dir = os.path.dirname(os.path.abspath(path))
+    return [make_job(job, base_dir) for job in data], workers
+
+
+def job_label(job):
+    source = job.get("main") or job.get("a") or job.get("input") or " ".join(job.get("inputs", ()))
+    return f"{job['op']} {source} -> {job['output']}"
+
+
+# ---------- Running ----------
+_registry = None    # one per worker process, reused by every job it runs
+_out_of_core = None
+
+
+def _worker_registry():
+    global _registry
+    if _registry is None:
+        _registry = open_registry()
+    return _registry
+
+
+def _worker_out_of_core():
+    global _out_of_core
+    if _out_of_core is None:
+        _out_of_core = open_out_of_core()
+        atexit.register(_out_of_core.close)
+    return _out_of_core
+
+
+def _sheet(registry, spec):
+    path, _sep, sheet = spec.partition("::")
+    if not os.path.isfile(path):
+        raise InputError(f"File not found: {path}")
+    if path not in registry:
+        registry.open(path)
+    sheets = registry.sheet_names(path)
+    if not sheet:
+        if not sheets:
+            raise InputError(f"No sheets in {path}")
+        sheet = sheets[0]
+    elif sheet not in sheets:
+        raise InputError(f"No sheet {sheet!r} in {path}")
+    return path, sheet
+
+
+def _stack_sources(registry, specs, pattern):
+    sources = []
+    for spec in specs:
+        path, sheet = _sheet(registry, spec)
+        if "::" in spec:
+            sources.append((path, sheet))
+            continue
+        found = match_sheets(registry, [path], pattern)
+        if not found:
+            raise InputError(f"No sheet matching {pattern!r} in {path}")
+        sources.extend(found)
+    return sources
+
+
+def _need_columns(registry, path, sheet, cols):
+    have = set(registry.columns(path, sheet))
+    missing = [c for c in cols if c not in have]
+    if missing:
+        raise InputError(f"{os.path.basename(path)}::{sheet} has no column(s) {', '.join(map(str, missing))}")
+
+
+def _export(df, path, sheet_name="Result"):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    return export_frame(df, path, sheet_name=sheet_name)
+
+
+# returns (exit code, message); runs in a worker process
+def run_job(job):
+    registry = _worker_registry()
+    op = job["op"]
+    ops = _worker_out_of_core() if job.get("out_of_core") else None
+    run = {"vlookup": run_vlookup, "compare": run_compare, "unique": run_unique, "concat": run_concat}
+    if ops is not None:
+        run = {"vlookup": ops.run_vlookup, "compare": ops.run_compare, "unique": ops.run_unique,
+               "concat": ops.run_concat}
+    if job.get("mode") == "fuzzy":
+        # fuzzy matching works on the distinct keys in memory
+        run.update(vlookup=run_vlookup, compare=run_compare)
+    differences = False
+    if op == "vlookup":
+        fp_main, sh_main = _sheet(registry, job["main"])
+        fp_lookup, sh_lookup = _sheet(registry, job["lookup"])
+        keys_lookup = job["lookup_keys"] or job["keys"]
+        _need_columns(registry, fp_main, sh_main, job["keys"])
+        _need_columns(registry, fp_lookup, sh_lookup, keys_lookup + (job["fetch"] or []))
+        out, stats = run["vlookup"](
+            registry, fp_main, sh_main, job["keys"], fp_lookup, sh_lookup, keys_lookup, job["fetch"],
+            job["mode"], job["policy"], job["normalize"], threshold=job["threshold"])
+        message = describe_match(stats)
+        differences = stats["matched"] < stats["rows"]
+    elif op == "compare":
+        fp_a, sh_a = _sheet(registry, job["a"])
+        fp_b, sh_b = _sheet(registry, job["b"])
+        cols_b = job["cols_b"] or job["cols"]
+        _need_columns(registry, fp_a, sh_a, job["cols"])
+        _need_columns(registry, fp_b, sh_b, cols_b)
+        out, counts = run["compare"](
+            registry, fp_a, sh_a, job["cols"], fp_b, sh_b, cols_b, job["normalize"],
+            job["include_both"], job["whole_rows"], mode=job["mode"], threshold=job["threshold"])
+        message = describe_compare(counts)
+        differences = bool(counts["only_a"] or counts["only_b"])
+    elif op == "diff":
+        # in memory either way; only the rows whose hash changed are compared cell by cell
+        fp_a, sh_a = _sheet(registry, job["a"])
+        fp_b, sh_b = _sheet(registry, job["b"])
+        keys_b = job["keys_b"] or job["keys"]
+        _need_columns(registry, fp_a, sh_a, job["keys"] + (job["cols"] or []))
+        _need_columns(registry, fp_b, sh_b, keys_b + (job["cols"] or []))
+        out, stats = run_diff(registry, fp_a, sh_a, job["keys"], fp_b, sh_b, keys_b, job["cols"],
+                              job["normalize"], job["layout"])
+        message = describe_diff(stats)
+        differences = bool(stats["added"] or stats["removed"] or stats["changed"])
+    elif op == "unique":
+        fp, sh = _sheet(registry, job["input"])
+        cols = [job["column"]] if isinstance(job["column"], str) else job["column"]
+        _need_columns(registry, fp, sh, cols)
+        out = run["unique"](registry, fp, sh, job["column"], counts=job["counts"], sort=job["sort"])
+        message = f"{len(out):,} unique value(s)"
+    elif op == "distinct":
+        sources = [_sheet(registry, spec) for spec in job["inputs"]]
+        for fp, sh in sources:
+            _need_columns(registry, fp, sh, job["columns"])
+        out, stats = run_distinct_stats(registry, sources, job["columns"], job["top"],
+                                        chunks=None if ops is None else ops.iter_chunks)
+        message = describe_distinct(stats)
+    elif op == "stack":
+        # stacked in memory either way; the sheets parse side by side in a pool of their own
+        sources = _stack_sources(registry, job["inputs"], job["sheet"])
+        with ProcessPoolExecutor(max(1, min(PARSE_PROCESSES, len(sources)))) as parsers:
+            registry.parse_executor = parsers
+            try:
+                out, report = run_stack(registry, sources, job["source_column"])
+            finally:
+                registry.parse_executor = None
+        message = describe_stack(report)
+    elif op == "concat":
+        fp, sh = _sheet(registry, job["input"])
+        _need_columns(registry, fp, sh, job["cols"])
+        out = run["concat"](
+            registry, fp, sh, job["cols"], job["name"], sep=job["sep"], prefix=job["prefix"],
+            suffix=job["suffix"], formats=job["formats"], skip_empty=job["skip_empty"])
+        message = f"{len(out):,} row(s)"
+    else:
+        fp, sh = _sheet(registry, job["input"])
+        out = registry.get(fp, sh) if ops is None else ops.sheet(registry, fp, sh)
+        message = f"{len(out):,} row(s)"
+    sheets = _export(out, job["output"], sh if op in ("export", "concat") else "Result")
+    if sheets > 1:
+        message += f", {sheets} sheets"
+    if differences and job.get("fail_on_diff"):
+        return EXIT_DIFFERENCES, message
+    return EXIT_OK, message
+
+
+def _run_job_safely(job):
+    try:
+        return run_job(job)
+    except InputError as e:
+        return EXIT_INPUT, str(e)
+    except Exception as e:
+        return EXIT_FAILED, f"{type(e).__name__}: {e}"
+
+
+def overall_code(codes):
+    for code in (EXIT_FAILED, EXIT_INPUT, EXIT_DIFFERENCES):
+        if code in codes:
+            return code
+    return EXIT_OK
+
+
+STATUS_TEXT = {EXIT_OK: "ok", EXIT_FAILED: "FAILED", EXIT_INPUT: "MISSING INPUT", EXIT_DIFFERENCES: "DIFFERENCES"}
+
+
+def run_jobs(jobs, workers=PARSE_PROCESSES, quiet=False):
+    codes = []
+
+    def finished(job, code, message):
+        codes.append(code)
+        if code != EXIT_OK or not quiet:
+            stream = sys.stdout if code == EXIT_OK else sys.stderr
+            print(f"[{len(codes)}/{len(jobs)}] {STATUS_TEXT[code]}: {job_label(job)}: {message}", file=stream, flush=True)
+
+    workers = max(1, min(workers or 1, len(jobs)))
+    if workers == 1:
+        for job in jobs:
+            finished(job, *_run_job_safely(job))
+        return overall_code(codes)
+    pool = ProcessPoolExecutor(workers)
+    try:
+        futures = {pool.submit(_run_job_safely, job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                code, message = future.result()
+            except Exception as e:     # the worker itself died
+                code, message = EXIT_FAILED, f"{type(e).__name__}: {e}"
+            finished(futures[future], code, message)
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return overall_code(codes)
+
+
+# ---------- Arguments ----------
+def _expand_inputs(specs):
+    out = []
+    for spec in specs:
+        path, sep, sheet = spec.partition("::")
+        # Windows shells leave wildcards to the program
+        matches = sorted(glob.glob(path)) if glob.has_magic(path) else [path]
+        out.extend(p + sep + sheet for p in matches or [path])
+    return out
+
+
+def _per_input(parser, args, field, **job):
+    inputs = _expand_inputs(args.inputs)
+    if len(inputs) > 1 and "{stem}" not in args.output:
+        parser.error("several inputs need {stem} in --output")
+    jobs = []
+    for spec in inputs:
+        stem = os.path.splitext(os.path.basename(spec.partition("::")[0]))[0]
+        jobs.append({"op": args.op, field: spec, "output": args.output.replace("{stem}", stem), **job})
+    return jobs
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--workers", type=int, default=None,
+                        help=f"worker processes for several jobs (default {PARSE_PROCESSES})")
+    common.add_argument("-q", "--quiet", action="store_true", help="only report jobs that did not succeed")
+    common.add_argument("--out-of-core", action="store_true",
+                        help="run in DuckDB over sheets spilled to Parquet (needs duckdb)")
+
+    parser = argparse.ArgumentParser(
+        prog="abg-excel", description="Run ABG-Excel operations without the window.",
+        epilog="Exit codes: 0 ok, 1 a job failed, 2 bad arguments, 3 missing file/sheet/column, "
+               "4 differences found with --fail-on-diff.")
+    sub = parser.add_subparsers(dest="op", required=True)
+
+    p = sub.add_parser("vlookup", parents=[common], help="add lookup columns to one or more main sheets")
+    p.add_argument("inputs", nargs="+", metavar="MAIN", help="main sheet(s), FILE or FILE::SHEET")
+    p.add_argument("--lookup", required=True, help="lookup sheet, FILE or FILE::SHEET")
+    p.add_argument("--keys", nargs="+", required=True, help="key column(s) of the main sheet")
+    p.add_argument("--lookup-keys", nargs="+", help="key column(s) of the lookup sheet (default: --keys)")
+    p.add_argument("--fetch", nargs="+", help="lookup columns to bring over (default: all but the keys)")
+    p.add_argument("--mode", choices=LOOKUP_MODES, default="exact")
+    p.add_argument("--policy", choices=DUPLICATE_POLICIES, default="first", help="duplicate lookup keys")
+    p.add_argument("--normalize", nargs="*", choices=NORMALIZE_NAMES, default=[])
+    p.add_argument("--threshold", type=float, default=FUZZY_THRESHOLD,
+                   help=f"--mode fuzzy: lowest match score, 0-1 (default {FUZZY_THRESHOLD})")
+    p.add_argument("--fail-on-diff", action="store_true", help="exit 4 when some rows find no match")
+    p.add_argument("-o", "--output", required=True)
+
+    p = sub.add_parser("compare", parents=[common], help="values only in A, only in B (and in both)")
+    p.add_argument("a", help="sheet A, FILE or FILE::SHEET")
+    p.add_argument("b", help="sheet B, FILE or FILE::SHEET")
+    p.add_argument("--cols", nargs="+", required=True, help="column(s) of A")
+    p.add_argument("--cols-b", nargs="+", help="column(s) of B (default: --cols)")
+    p.add_argument("--normalize", nargs="*", choices=NORMALIZE_NAMES, default=None,
+                   help="default: numeric_text")
+    p.add_argument("--include-both", action="store_true")
+    p.add_argument("--whole-rows", action="store_true", help="output whole rows with a Side column")
+    p.add_argument("--mode", choices=COMPARE_MODES, default="exact",
+                   help="fuzzy: values scoring at least --threshold count as the same")
+    p.add_argument("--threshold", type=float, default=FUZZY_THRESHOLD)
+    p.add_argument("--fail-on-diff", action="store_true", help="exit 4 when the sides differ")
+    p.add_argument("-o", "--output", required=True)
+
+    p = sub.add_parser("diff", parents=[common], help="rows added, removed and changed between two versions")
+    p.add_argument("a", help="old version, FILE or FILE::SHEET")
+    p.add_argument("b", help="new version, FILE or FILE::SHEET")
+    p.add_argument("--keys", nargs="+", required=True, help="key column(s) matching the rows")
+    p.add_argument("--keys-b", nargs="+", help="key column(s) of the new version (default: --keys)")
+    p.add_argument("--cols", nargs="+", help="columns to compare (default: every column both have)")
+    p.add_argument("--normalize", nargs="*", choices=NORMALIZE_NAMES, default=[], help="applied to the keys")
+    p.add_argument("--layout", choices=DIFF_LAYOUTS, default="cells",
+                   help="cells: one line per changed cell; rows: whole rows with the changed column names")
+    p.add_argument("--fail-on-diff", action="store_true", help="exit 4 when the versions differ")
+    p.add_argument("-o", "--output", required=True)
+
+    p = sub.add_parser("unique", parents=[common], help="distinct values of a column (or combinations of several)")
+    p.add_argument("inputs", nargs="+", metavar="INPUT")
+    p.add_argument("--column", nargs="+", required=True)
+    p.add_argument("--counts", action="store_true", help="add a Count column")
+    p.add_argument("--sort", choices=UNIQUE_SORTS, default="appearance")
+    p.add_argument("-o", "--output", required=True)
+
+    p = sub.add_parser("distinct", parents=[common],
+                       help="approximate distinct count and most frequent values across sheets, streamed")
+    p.add_argument("inputs", nargs="+", metavar="INPUT")
+    p.add_argument("--columns", nargs="+", required=True)
+    p.add_argument("--top", type=int, default=20, help="most frequent values to list (default 20)")
+    p.add_argument("-o", "--output", required=True)
+
+    p = sub.add_parser("stack", parents=[common], help="append the same sheet of many workbooks into one")
+    p.add_argument("inputs", nargs="+", metavar="INPUT", help="FILE (sheets picked by --sheet) or FILE::SHEET")
+    p.add_argument("--sheet", default="", help="sheet name or pattern such as 'Sales*' (default: first sheet)")
+    p.add_argument("--source-column", default=STACK_SOURCE_COLUMN, help="column naming each row's workbook")
+    p.add_argument("-o", "--output", required=True)
+
+    p = sub.add_parser("concat", parents=[common], help="add a column joining other columns")
+    p.add_argument("inputs", nargs="+", metavar="INPUT")
+    p.add_argument("--cols", nargs="+", required=True)
+    p.add_argument("--name", default="Concatenated", help="result column name")
+    p.add_argument("--sep", default=" ")
+    p.add_argument("--prefix", default="")
+    p.add_argument("--suffix", default="")
+    p.add_argument("--format", action="append", default=[], metavar="COLUMN=FORMAT",
+                   help='e.g. Date=%%d/%%m/%%Y or Amount={:,.2f}; repeatable')
+    p.add_argument("--skip-empty", action="store_true")
+    p.add_argument("-o", "--output", required=True)
+
+    p = sub.add_parser("export", parents=[common], help="write sheets to .xlsx or (compressed) .csv")
+    p.add_argument("inputs", nargs="+", metavar="INPUT")
+    p.add_argument("-o", "--output", required=True)
+
+    p = sub.add_parser("run", parents=[common], help="run the jobs in a JSON job file")
+    p.add_argument("job_file")
+
+    p = sub.add_parser("pipeline", parents=[common], help="replay a pipeline saved from the window")
+    p.add_argument("pipeline_file")
+    p.add_argument("--source", action="append", default=[], metavar="NAME=FILE",
+                   help="run on another workbook for a source; repeatable")
+    return parser
+
+
+def replay_pipeline(parser, args):
+    try:
+        pipeline = Pipeline.load(args.pipeline_file)
+    except PipelineError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    sources = {}
+    for item in args.source:
+        name, eq, path = item.partition("=")
+        if not eq or name not in pipeline.sources:
+            parser.error(f"--source expects NAME=FILE with NAME one of {', '.join(pipeline.sources)}")
+        sources[name] = path
+    missing = [p for p in {**pipeline.sources, **sources}.values() if not os.path.isfile(p)]
+    if missing:
+        print(f"MISSING INPUT: {', '.join(missing)}", file=sys.stderr)
+        return EXIT_INPUT
+    try:
+        result = PipelineRunner().run(pipeline, sources)
+    except Exception as e:
+        print(f"FAILED: {type(e).__name__}: {e}", file=sys.stderr)
+        return EXIT_FAILED
+    if not args.quiet:
+        for step, status, message in result.steps:
+            print(f"{status:>6}  {pipeline.describe_step(step)}" + (f": {message}" if message else ""))
+        print(result.describe())
+    return EXIT_OK
+
+
+def jobs_from_args(parser, args):
+    if args.op == "run":
+        jobs, workers = load_job_file(args.job_file)
+        if args.out_of_core:
+            for job in jobs:
+                job["out_of_core"] = True
+        return jobs, args.workers or workers
+    if args.op == "vlookup":
+        jobs = _per_input(parser, args, "main", lookup=args.lookup, keys=args.keys, lookup_keys=args.lookup_keys,
+                          fetch=args.fetch, mode=args.mode, policy=args.policy, normalize=args.normalize,
+                          threshold=args.threshold, fail_on_diff=args.fail_on_diff)
+    elif args.op == "compare":
+        job = {"op": "compare", "a": args.a, "b": args.b, "cols": args.cols, "cols_b": args.cols_b,
+               "include_both": args.include_both, "whole_rows": args.whole_rows, "mode": args.mode,
+               "threshold": args.threshold, "fail_on_diff": args.fail_on_diff, "output": args.output}
+        if args.normalize is not None:
+            job["normalize"] = args.normalize
+        jobs = [job]
+    elif args.op == "diff":
+        jobs = [{"op": "diff", "a": args.a, "b": args.b, "keys": args.keys, "keys_b": args.keys_b, "cols": args.cols,
+                 "normalize": args.normalize, "layout": args.layout, "fail_on_diff": args.fail_on_diff,
+                 "output": args.output}]
+    elif args.op == "unique":
+        column = args.column[0] if len(args.column) == 1 else args.column
+        jobs = _per_input(parser, args, "input", column=column, counts=args.counts, sort=args.sort)
+    elif args.op == "distinct":
+        jobs = [{"op": "distinct", "inputs": _expand_inputs(args.inputs), "columns": args.columns,
+                 "top": args.top, "output": args.output}]
+    elif args.op == "stack":
+        jobs = [{"op": "stack", "inputs": _expand_inputs(args.inputs), "sheet": args.sheet,
+                 "source_column": args.source_column, "output": args.output}]
+    elif args.op == "concat":
+        formats = {}
+        for item in args.format:
+            col, eq, fmt = item.partition("=")
+            if not eq:
+                parser.error(f"--format expects COLUMN=FORMAT, got {item!r}")
+            formats[col] = fmt
+        jobs = _per_input(parser, args, "input", cols=args.cols, name=args.name, sep=args.sep, prefix=args.prefix,
+                          suffix=args.suffix, formats=formats, skip_empty=args.skip_empty)
+    else:
+        jobs = _per_input(parser, args, "input")
+    if args.out_of_core:
+        for job in jobs:
+            job["out_of_core"] = True
+    return [make_job(job) for job in jobs], args.workers
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.op == "pipeline":
+        try:
+            return replay_pipeline(parser, args)
+        except KeyboardInterrupt:
+            return EXIT_INTERRUPTED
+    try:
+        jobs, workers = jobs_from_args(parser, args)
+    except UsageError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    try:
+        return run_jobs(jobs, workers or PARSE_PROCESSES, args.quiet)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()  # needed for the process pool in a frozen .exe
+    sys.exit(main())
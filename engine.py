@@ -0,0 +1,2717 @@
+# Data side of ABG-Excel: reading, caching, lookups, comparison, concatenation and export.
+# Nothing here imports tkinter, so the same code runs behind the window (python.py)
+# and headless from the command line (cli.py).
+import numpy as np
+import pandas as pd
+import os
+import bz2
+import contextlib
+import cProfile
+import fnmatch
+import functools
+import gzip
+import hashlib
+import importlib.util
+import io
+import itertools
+import json
+import lzma
+import pickle
+import platform
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import warnings
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+# RAM budget for parsed sheets; least recently used sheets are dropped beyond it
+SHEET_CACHE_MB = int(os.environ.get("ABG_SHEET_CACHE_MB", "1024"))
+# Worker processes for CPU-bound parsing (and for batch jobs on the command line)
+PARSE_PROCESSES = int(os.environ.get("ABG_PARSE_PROCESSES", str(min(4, os.cpu_count() or 1))))
+# On-disk columnar copies of parsed sheets; 0 disables the cache
+CACHE_DIR = os.environ.get("ABG_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".abg_excel", "cache"))
+DISK_CACHE_MB = int(os.environ.get("ABG_DISK_CACHE_MB", "4096"))
+# Shrink dtypes of freshly parsed sheets (categoricals, downcast numbers, Arrow strings, dates)
+COMPACT_ON_LOAD = os.environ.get("ABG_COMPACT", "1") != "0"
+# Undo history: steps kept, and the memory they may hold on to beyond the live sheets
+HISTORY_DEPTH = int(os.environ.get("ABG_HISTORY_DEPTH", "50"))
+HISTORY_MB = int(os.environ.get("ABG_HISTORY_MB", "512"))
+# Timed operations and I/O kept for View > Performance
+PERF_HISTORY = int(os.environ.get("ABG_PERF_HISTORY", "500"))
+# Seconds between checks of open workbooks for changes on disk; 0 turns watching off
+WATCH_SECONDS = float(os.environ.get("ABG_WATCH_SECONDS", "2"))
+
+
+# Copy-on-write (always on from pandas 3): a preview, a staged result or a sheet plus one new
+# column share the sheet's column buffers until one of them is written to.
+try:
+    if int(pd.__version__.split(".")[0]) < 3:
+        pd.set_option("mode.copy_on_write", True)
+except (AttributeError, KeyError, ValueError):
+    pass    # pandas < 1.5 has no copy-on-write
+
+
+def frame_nbytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+# ---------- Memory accounting ----------
+# Column buffers are told apart by address, so memory shared between frames is counted once.
+# A column of a consolidated block is its own row of the block: counted by that row's address
+# and size, not the whole block's.
+def _array_buffer(a):
+    return a.__array_interface__["data"][0], a.nbytes
+
+
+# [(address, nbytes)] of the memory behind one column; deep=False leaves out the objects of object columns
+def column_buffers(s, deep=True):
+    values = s.array
+    if type(values).__name__.startswith("Arrow"):
+        chunked = values.__arrow_array__()
+        return [(b.address, b.size) for chunk in chunked.chunks for b in chunk.buffers() if b is not None]
+    if isinstance(values, pd.Categorical):
+        return [_array_buffer(values.codes)]    # categories are small
+    if hasattr(values, "asi8"):         # datetimes, timedeltas, periods
+        return [_array_buffer(values.asi8)]
+    if hasattr(values, "_mask"):        # nullable Int64 / Float64 / boolean
+        return [_array_buffer(values._data), _array_buffer(values._mask)]
+    arr = np.asarray(values)
+    address, nbytes = _array_buffer(arr)
+    if deep and arr.dtype == object:
+        # the Python objects hang off this column's pointers; charge them to it
+        nbytes += int(s.memory_usage(index=False, deep=True)) - arr.nbytes
+    return [(address, nbytes)]
+
+
+# frames: {name: DataFrame}. Owned bytes are referenced by one frame only, shared bytes by several.
+# deep=False skips the objects of object columns: fast enough to run after every job.
+def memory_report(frames, deep=True):
+    buffers = {}    # {address: [nbytes, {name, ...}]}
+    frames = {name: df for name, df in frames.items() if isinstance(df, pd.DataFrame)}
+    for name, df in frames.items():
+        for i in range(df.shape[1]):
+            for address, nbytes in column_buffers(df.iloc[:, i], deep):
+                if not address or not nbytes:
+                    continue
+                entry = buffers.setdefault(address, [nbytes, set()])
+                entry[0] = max(entry[0], nbytes)
+                entry[1].add(name)
+    per_frame = {name: {"owned": 0, "shared": 0} for name in frames}
+    owned = shared = 0
+    for nbytes, names in buffers.values():
+        kind = "owned" if len(names) == 1 else "shared"
+        for name in names:
+            per_frame[name][kind] += nbytes
+        if kind == "owned":
+            owned += nbytes
+        else:
+            shared += nbytes
+    return {"owned": owned, "shared": shared, "total": owned + shared, "frames": per_frame}
+
+
+def describe_memory(report):
+    mb = 1024 ** 2
+    return (f"Memory: {report['total'] / mb:,.0f} MB "
+            f"({report['shared'] / mb:,.0f} MB shared, {report['owned'] / mb:,.0f} MB owned)")
+
+
+# ---------- Instrumentation ----------
+# Operations and I/O paths record spans: wall time, rows, bytes read / written and the change in
+# the process's resident memory. Spans nest per thread, so the sheet loads and merges of a VLOOKUP
+# sit under it; parsing in a worker process is timed from the thread waiting for it. Totals per op
+# count every span, the history keeps the last PERF_HISTORY (spans under their min_seconds, such as
+# quick preview renders, only reach the totals). With profile / trace_memory on, each top-level
+# span also runs under cProfile (its own thread only) / tracemalloc.
+PERF_PROFILE_LINES = 40
+
+
+def process_rss():
+    try:
+        if sys.platform.startswith("linux"):
+            with open("/proc/self/statm") as fh:
+                return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+
+            class Counters(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                    (name, ctypes.c_size_t) for name in (
+                        "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                        "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage",
+                        "PeakPagefileUsage")]
+
+            counters = Counters()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return int(counters.WorkingSetSize)
+    except (OSError, ValueError, AttributeError):
+        pass
+    return None     # other platforms: spans go without a memory delta
+
+
+def _profile_text(profiler):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PERF_PROFILE_LINES)
+    return out.getvalue()
+
+
+class PerfLog:
+    def __init__(self, limit=PERF_HISTORY):
+        self.profile = False        # cProfile each top-level span
+        self.trace_memory = False   # tracemalloc peak of each top-level span
+        self._records = deque(maxlen=limit)
+        self._totals = {}           # {op: {"calls", "seconds", "max", "rows"}}
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._tracing = 0           # top-level spans under tracemalloc right now
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    # the record is yielded so the caller can add rows, bytes_read, bytes_written, ...
+    @contextlib.contextmanager
+    def span(self, op, min_seconds=0.0, **fields):
+        stack = self._stack()
+        rec = {"id": next(self._ids), "op": op, "parent": stack[-1]["id"] if stack else None,
+               "depth": len(stack), "thread": threading.current_thread().name, "started": time.time(), **fields}
+        top = not stack
+        profiler = cProfile.Profile() if top and self.profile else None
+        traced = top and self.trace_memory and self._start_tracing()
+        rss = process_rss()
+        stack.append(rec)
+        t0 = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield rec
+        except BaseException as e:
+            rec["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                rec["profile"] = _profile_text(profiler)
+            rec["seconds"] = time.perf_counter() - t0
+            stack.pop()
+            after = process_rss()
+            if rss is not None and after is not None:
+                rec["rss_delta"] = after - rss
+            if traced:
+                rec["traced_peak"] = self._stop_tracing()
+            self._add(rec, min_seconds)
+
+    def _start_tracing(self):
+        with self._lock:
+            self._tracing += 1
+            if self._tracing == 1 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            else:
+                tracemalloc.reset_peak()
+        return True
+
+    def _stop_tracing(self):
+        with self._lock:
+            peak = tracemalloc.get_traced_memory()[1]
+            self._tracing -= 1
+            if not self._tracing:
+                tracemalloc.stop()
+        return peak
+
+    def _add(self, rec, min_seconds):
+        with self._lock:
+            total = self._totals.setdefault(rec["op"], {"calls": 0, "seconds": 0.0, "max": 0.0, "rows": 0})
+            total["calls"] += 1
+            total["seconds"] += rec["seconds"]
+            total["max"] = max(total["max"], rec["seconds"])
+            total["rows"] += rec.get("rows") or 0
+            if rec["seconds"] >= min_seconds or "error" in rec or "profile" in rec:
+                self._records.append(rec)
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def totals(self):
+        with self._lock:
+            return {op: dict(total) for op, total in self._totals.items()}
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._totals.clear()
+
+    def to_dict(self):
+        return {
+            "version": 1,
+            "environment": {
+                "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+                "pandas": pd.__version__, "numpy": np.__version__, "rss": process_rss(),
+                "parse_processes": PARSE_PROCESSES, "compact_on_load": COMPACT_ON_LOAD,
+            },
+            "totals": self.totals(),
+            "records": self.records(),
+        }
+
+    def save(self, path):
+        tmp = path + ".part"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.to_dict(), fh, indent=2, default=str)
+        os.replace(tmp, path)
+
+
+perf_log = PerfLog()    # one per process, shared by the window, the workers' threads and cli jobs
+
+
+# a run_* operation as one span; rows is the length of the frame it returns
+def instrumented(op, **fields):
+    def wrap(fn):
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with perf_log.span(op, **fields) as rec:
+                out = fn(*args, **kwargs)
+                frame = out[0] if isinstance(out, tuple) else out
+                if hasattr(frame, "__len__"):
+                    rec["rows"] = len(frame)
+                return out
+        return run
+    return wrap
+
+
+# ---------- Readers ----------
+# Fastest engine installed wins; ABG_EXCEL_ENGINE forces one.
+EXCEL_ENGINE = os.environ.get("ABG_EXCEL_ENGINE", "")
+
+
+def _has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def _pandas_version():
+    return tuple(int(p) for p in re.findall(r"\d+", pd.__version__)[:2])
+
+
+def pick_engine(path):
+    if EXCEL_ENGINE:
+        return EXCEL_ENGINE
+    ext = os.path.splitext(path)[1].lower()
+    # calamine parses in Rust; pandas accepts it from 2.2 on
+    if _has_module("python_calamine") and _pandas_version() >= (2, 2):
+        return "calamine"
+    if ext == ".xlsb":
+        return "pyxlsb"
+    if ext == ".xls":
+        return "xlrd"
+    return "openpyxl"   # pandas opens it in read-only mode
+
+
+# {sheet_name: (rows, cols)} without parsing any cell data
+def read_workbook_meta(path):
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        import openpyxl
+        wb = openpyxl.load_workbook(path, read_only=True)
+        try:
+            # dimensions come from the sheet's <dimension> tag and may be missing
+            return {ws.title: (ws.max_row, ws.max_column) for ws in wb.worksheets}
+        finally:
+            wb.close()
+    with pd.ExcelFile(path, engine=pick_engine(path)) as xl:
+        return {s: (None, None) for s in xl.sheet_names}
+
+
+# usecols are column positions; nrows=0 reads just the header row
+def read_sheet(path, sheet, usecols=None, nrows=None):
+    engine = pick_engine(path)
+    try:
+        return pd.read_excel(path, sheet_name=sheet, usecols=usecols, nrows=nrows, engine=engine)
+    except Exception:
+        if engine != "calamine":
+            raise
+        # calamine rejects a few exotic files that openpyxl/xlrd still read
+        return pd.read_excel(path, sheet_name=sheet, usecols=usecols, nrows=nrows)
+
+
+# ---------- Dtype compaction ----------
+# Parsed sheets arrive as object/str columns for text and 64-bit numbers. Every conversion
+# below keeps the values the lookups, comparisons and exports see: floats only narrow when
+# float32 holds them exactly, and text dates are parsed only when one reading fits them all.
+CATEGORY_MAX_RATIO = 0.5    # distinct / non-blank values at or below this -> categorical
+DATE_SAMPLE = 100
+_DATE_LIKE = re.compile(r"^\s*\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}([ T]\d{1,2}:\d{2}(:\d{2})?)?\s*$")
+
+
+def _arrow_string_dtype():
+    if not _has_module("pyarrow"):
+        return None
+    for args in ((("pyarrow",), {"na_value": np.nan}), (("pyarrow_numpy",), {})):
+        try:
+            # NaN for blanks, like object columns, so the existing code paths see no pd.NA
+            return pd.StringDtype(*args[0], **args[1])
+        except (TypeError, ValueError, ImportError):
+            continue
+    return None
+
+
+def _parse_dates(values):
+    try:
+        from pandas.tseries.api import guess_datetime_format
+    except ImportError:
+        return None
+    sample = values.iloc[:DATE_SAMPLE]
+    if not sample.map(lambda v: bool(_DATE_LIKE.match(v))).all():
+        return None
+    # each distinct string is parsed once
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques)
+    found = {}
+    for dayfirst in (False, True):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")     # "parsing in %d/%m/%Y format when dayfirst=False"
+            fmt = guess_datetime_format(sample.iloc[0], dayfirst=dayfirst)
+        if fmt is None or fmt in found:
+            continue
+        parsed = pd.to_datetime(uniques, format=fmt, errors="coerce")
+        if parsed.notna().all():
+            found[fmt] = parsed
+    if len(found) != 1:
+        return None     # unparseable, or 03/04/2020 read both ways: leave it as text
+    parsed = next(iter(found.values()))
+    return pd.Series(parsed.to_numpy()[codes], index=values.index, name=values.name)
+
+
+def _compact_text(s):
+    values = s.dropna()
+    if not len(values):
+        return s
+    if s.dtype == object and pd.api.types.infer_dtype(values, skipna=False) != "string":
+        return s    # mixed numbers and text: "Numbers as text" matching relies on the raw values
+    dates = _parse_dates(values)
+    if dates is not None:
+        return dates.reindex(s.index)
+    if len(values) > 1 and values.nunique() <= CATEGORY_MAX_RATIO * len(values):
+        return s.astype("category")
+    dtype = _arrow_string_dtype()
+    if dtype is not None and s.dtype == object:
+        return s.astype(dtype)
+    return s
+
+
+def compact_column(s):
+    dtype = s.dtype
+    if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(dtype):
+        return s
+    if pd.api.types.is_integer_dtype(dtype) and isinstance(dtype, np.dtype):
+        return pd.to_numeric(s, downcast="integer")
+    if dtype == np.float64:
+        values = s.to_numpy()
+        narrow = values.astype(np.float32)
+        if np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+            return pd.Series(narrow, index=s.index, name=s.name)
+        return s
+    if dtype == object or pd.api.types.is_string_dtype(dtype):
+        return _compact_text(s)
+    return s
+
+
+# returns (compacted frame, bytes before, bytes after)
+def compact_frame(df):
+    before = frame_nbytes(df)
+    if not df.shape[1]:
+        return df, before, before
+    # positional, so duplicate column names survive; untouched columns aren't copied
+    out = pd.concat([compact_column(df.iloc[:, i]) for i in range(df.shape[1])], axis=1)
+    out.columns = df.columns
+    return out, before, frame_nbytes(out)
+
+
+def read_sheet_compact(path, sheet, usecols=None, nrows=None):
+    return compact_frame(read_sheet(path, sheet, usecols, nrows))
+
+
+def _project(df, usecols=None, nrows=None):
+    if usecols is not None:
+        df = df[list(usecols)]
+    if nrows is not None:
+        df = df.iloc[:nrows]
+    return df
+
+
+class SheetCache:
+    def __init__(self, budget_bytes):
+        self.budget = budget_bytes
+        self.used = 0
+        self._items = OrderedDict()   # {key: (DataFrame, nbytes)}
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, df):
+        self.discard(key)
+        size = frame_nbytes(df)
+        self._items[key] = (df, size)
+        self.used += size
+        # never evict the sheet we were just asked for
+        while self.used > self.budget and len(self._items) > 1:
+            _, (_, old_size) = self._items.popitem(last=False)
+            self.used -= old_size
+
+    def discard(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.used -= item[1]
+
+    def discard_where(self, pred):
+        for key in [k for k in self._items if pred(k)]:
+            self.discard(key)
+
+    def clear(self):
+        self._items.clear()
+        self.used = 0
+
+    def items(self):
+        return [(key, item[0]) for key, item in self._items.items()]
+
+
+# path + size + mtime + content hash; any change to the workbook gives a new key
+def file_fingerprint(path):
+    st = os.stat(path)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}".encode())
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# Parsed sheets stored as Arrow IPC files (memory-mapped on read) or pickles when
+# pyarrow is missing or a sheet has columns Arrow can't hold. Evicts least recently used files.
+class DiskCache:
+    def __init__(self, directory, budget_bytes):
+        self.dir = directory
+        self.budget = budget_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(e.stat().st_size for e in os.scandir(directory) if e.is_file())
+
+    def _base(self, fingerprint, sheet):
+        tag = hashlib.blake2b(str(sheet).encode(), digest_size=8).hexdigest()
+        return os.path.join(self.dir, f"{fingerprint}-{tag}")
+
+    def load_meta(self, fingerprint):
+        path = os.path.join(self.dir, f"{fingerprint}.meta.json")
+        try:
+            with open(path, encoding="utf-8") as fh:
+                meta = {s: tuple(dims) for s, dims in json.load(fh)}
+            os.utime(path)
+            return meta
+        except (OSError, ValueError):
+            return None
+
+    def save_meta(self, fingerprint, meta):
+        data = json.dumps([[s, list(dims)] for s, dims in meta.items()]).encode("utf-8")
+        self._write(os.path.join(self.dir, f"{fingerprint}.meta.json"), data)
+
+    def load(self, fingerprint, sheet, columns=None):
+        base = self._base(fingerprint, sheet)
+        for ext, reader in ((".arrow", self._read_arrow), (".pkl", self._read_pickle)):
+            path = base + ext
+            if not os.path.exists(path):
+                continue
+            try:
+                with perf_log.span("cache read", bytes_read=os.path.getsize(path)) as rec:
+                    df = reader(path, columns)
+                    rec["rows"] = len(df)
+            except Exception:
+                continue
+            try:
+                os.utime(path)      # mtime doubles as the LRU clock
+            except OSError:
+                pass
+            with self._lock:
+                self.hits += 1
+            return df
+        with self._lock:
+            self.misses += 1
+        return None
+
+    # small JSON notes kept next to a cached sheet (e.g. its size before compaction)
+    def load_note(self, fingerprint, sheet):
+        try:
+            with open(self._base(fingerprint, sheet) + ".note.json", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def save_note(self, fingerprint, sheet, note):
+        self._write(self._base(fingerprint, sheet) + ".note.json", json.dumps(note).encode("utf-8"))
+
+    def has(self, fingerprint, sheet):
+        base = self._base(fingerprint, sheet)
+        return os.path.exists(base + ".arrow") or os.path.exists(base + ".pkl")
+
+    def save(self, fingerprint, sheet, df):
+        base = self._base(fingerprint, sheet)
+        with perf_log.span("cache write", rows=len(df)) as rec:
+            try:
+                from pyarrow import feather
+                buf = io.BytesIO()
+                feather.write_feather(df, buf, compression="uncompressed")
+                data, ext = buf.getvalue(), ".arrow"
+            except Exception:
+                data, ext = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL), ".pkl"
+            self._write(base + ext, data)
+            rec["bytes_written"] = len(data)
+        self._evict()
+
+    @staticmethod
+    def _read_arrow(path, columns=None):
+        from pyarrow import feather
+        if columns is not None and all(isinstance(c, str) for c in columns):
+            # only the projected columns are paged in from the mapping
+            return feather.read_table(path, columns=list(columns), memory_map=True).to_pandas(split_blocks=True)
+        df = feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+        return _project(df, columns)
+
+    @staticmethod
+    def _read_pickle(path, columns=None):
+        return _project(pd.read_pickle(path), columns)
+
+    def _write(self, path, data):
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.size += len(data)
+
+    def _evict(self):
+        with self._lock:
+            if self.size <= self.budget:
+                return
+            entries = sorted((e for e in os.scandir(self.dir) if e.is_file()), key=lambda e: e.stat().st_mtime)
+            self.size = sum(e.stat().st_size for e in entries)
+            for e in entries:
+                if self.size <= self.budget:
+                    break
+                try:
+                    size = e.stat().st_size
+                    os.remove(e.path)
+                    self.size -= size
+                except OSError:
+                    pass    # still memory-mapped on Windows; try again next time
+
+    def clear(self):
+        with self._lock:
+            for e in os.scandir(self.dir):
+                try:
+                    os.remove(e.path)
+                except OSError:
+                    pass
+            self.size = sum(e.stat().st_size for e in os.scandir(self.dir) if e.is_file())
+            self.hits = self.misses = 0
+
+    def describe(self):
+        return f"Cache: {self.hits} hit(s), {self.misses} miss(es), {self.size / 1024 ** 2:,.0f} MB"
+
+
+# Sheets are parsed on first access and kept in a SheetCache; edited sheets are pinned.
+def open_disk_cache():
+    if DISK_CACHE_MB <= 0:
+        return None
+    try:
+        return DiskCache(CACHE_DIR, DISK_CACHE_MB * 1024 * 1024)
+    except OSError:
+        return None     # unwritable cache dir: run without one
+
+
+def open_registry():
+    return SheetRegistry(SheetCache(SHEET_CACHE_MB * 1024 * 1024), open_disk_cache())
+
+
+class SheetRegistry:
+    def __init__(self, cache, disk_cache=None, compact=COMPACT_ON_LOAD):
+        self.cache = cache
+        self.disk_cache = disk_cache
+        self.compact = compact      # compact_frame every parsed sheet
+        self.compaction = {}        # {(path, sheet): (bytes before, bytes after)} of compacted sheets
+        self.parse_executor = None  # optional process pool for parsing
+        self._books = {}    # {path: {sheet_name: (rows, cols)}}
+        self._fingerprints = {}     # {path: file_fingerprint} when the disk cache is on
+        self._headers = {}  # {(path, sheet): [column, ...]} read without parsing the sheet
+        self._pinned = {}   # {(path, sheet): DataFrame} edited in-session, never evicted
+        self._versions = {}     # {path or (path, sheet): stamp}, bumped on open / set
+        self._reloads = {}      # {(path, sheet): stamp}, bumped when a reload changed the sheet
+        self._loading = {}      # {cache key: Future} of sheets being parsed
+        self._clock = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def __contains__(self, path):
+        return path in self._books
+
+    def _call(self, fn, *args):
+        if self.parse_executor is not None:
+            return self.parse_executor.submit(fn, *args).result()
+        return fn(*args)
+
+    # compacted and raw copies of a sheet are cached apart
+    def _disk_sheet(self, sheet):
+        return (sheet, "compact") if self.compact else sheet
+
+    # compaction runs next to the parse, in the worker process when there is one;
+    # bytes_read is the workbook's size (a sheet's share of it isn't known)
+    def _parse(self, path, sheet, usecols=None, nrows=None):
+        with perf_log.span("parse", sheet=sheet_label(path, sheet), bytes_read=os.path.getsize(path)) as rec:
+            if not self.compact:
+                df = self._call(read_sheet, path, sheet, usecols, nrows)
+            else:
+                df, before, after = self._call(read_sheet_compact, path, sheet, usecols, nrows)
+                rec["compacted"] = [before, after]
+                if usecols is None and nrows is None:
+                    with self._lock:
+                        self.compaction[(path, sheet)] = (before, after)
+            rec["rows"] = len(df)
+        return df
+
+    # safe to call from a worker thread
+    def open(self, path):
+        fingerprint, meta = self._read_meta(path)
+        with self._lock:
+            self._books[path] = meta
+            self._fingerprints[path] = fingerprint
+            self._versions[path] = next(self._clock)
+        return meta
+
+    def _read_meta(self, path):
+        fingerprint = meta = None
+        with perf_log.span("open workbook", file=os.path.basename(path), bytes_read=os.path.getsize(path)) as rec:
+            if self.disk_cache is not None:
+                fingerprint = file_fingerprint(path)
+                meta = self.disk_cache.load_meta(fingerprint)
+            rec["source"] = "disk cache" if meta is not None else "workbook"
+            if meta is None:
+                meta = self._call(read_workbook_meta, path)
+                if fingerprint is not None:
+                    self.disk_cache.save_meta(fingerprint, meta)
+        return fingerprint, meta
+
+    # Re-reads a workbook that changed on disk; safe to call from a worker thread. Sheets parsed
+    # before are parsed again and swapped in only if their data differs, so unchanged sheets keep
+    # their frames and everything derived from them. Sheets never parsed can't be compared and
+    # count as changed; sheets edited in this session keep the edits.
+    # Returns {"changed", "added", "removed", "edited": [sheet, ...]}, or None if the path was closed.
+    def reload(self, path):
+        with self._lock:
+            if path not in self._books:
+                return None
+            old = dict(self._books[path])
+            edited = {sheet for p, sheet in self._pinned if p == path}
+            loaded = {k[1]: df for k, df in self.cache.items() if len(k) == 2 and k[0] == path}
+        with perf_log.span("reload workbook", file=os.path.basename(path)) as rec:
+            fingerprint, meta = self._read_meta(path)
+            fresh = {sheet: self._load(path, sheet, fingerprint)
+                     for sheet in loaded if sheet in meta and sheet not in edited}
+            same = {sheet for sheet, df in fresh.items() if df.equals(loaded[sheet])}
+            report = {
+                "changed": [s for s in meta if s in old and s not in edited and s not in same],
+                "added": [s for s in meta if s not in old],
+                "removed": [s for s in old if s not in meta and s not in edited],
+                "edited": sorted(edited),
+            }
+            rec["changed"] = len(report["changed"])
+        with self._lock:
+            if path not in self._books:
+                return None
+            for sheet in set(old) | set(meta):
+                if sheet in edited or sheet in same:
+                    continue
+                self.cache.discard_where(lambda k: k[:2] == (path, sheet))
+                self._headers.pop((path, sheet), None)
+                if sheet not in fresh:
+                    self.compaction.pop((path, sheet), None)
+                self._reloads[(path, sheet)] = next(self._clock)
+            for sheet, df in fresh.items():
+                if sheet not in same:
+                    self.cache.put((path, sheet), df)
+            # an edited sheet stays listed even if the workbook no longer has it
+            self._books[path] = {**meta, **{s: self._pinned[(path, s)].shape for s in edited}}
+            self._fingerprints[path] = fingerprint
+        return report
+
+    # changes whenever the sheet's data may have changed; derived caches key on it.
+    # (workbook opened, sheet edited, sheet reloaded)
+    def version(self, path, sheet):
+        with self._lock:
+            return (self._versions.get(path, 0), self._versions.get((path, sheet), 0),
+                    self._reloads.get((path, sheet), 0))
+
+    def sheet_names(self, path):
+        return list(self._books[path])
+
+    def dimensions(self, path, sheet):
+        return self._books[path][sheet]
+
+    def is_loaded(self, path, sheet):
+        return (path, sheet) in self._pinned or (path, sheet) in self.cache
+
+    def has_columns(self, path, sheet):
+        return (path, sheet) in self._headers or self.is_loaded(path, sheet)
+
+    def columns(self, path, sheet):
+        key = (path, sheet)
+        with self._lock:
+            full = self._pinned.get(key)
+            if full is None:
+                full = self.cache.get(key)
+            if full is not None:
+                return list(full.columns)
+            header = self._headers.get(key)
+        if header is None:
+            header = list(self._call(read_sheet, path, sheet, None, 0).columns)
+            with self._lock:
+                self._headers[key] = header
+        return header
+
+    # usecols (column names) / nrows let an operation read only what it needs
+    def get(self, path, sheet, usecols=None, nrows=None):
+        key = (path, sheet)
+        with self._lock:
+            df = self._pinned.get(key)
+            if df is None:
+                df = self.cache.get(key)
+        if df is not None:
+            return _project(df, usecols, nrows)
+        if usecols is not None or nrows is not None:
+            return self._get_projection(path, sheet, usecols, nrows)
+
+        # parse outside the lock so other sheets stay readable meanwhile
+        return self._load_once(key, lambda: self._load(path, sheet, self._fingerprints.get(path)))
+
+    # One parse per cache key: callers asking while it runs wait for its frame (or its error).
+    def _load_once(self, key, load):
+        with self._lock:
+            df = self._pinned.get(key)
+            if df is None:
+                df = self.cache.get(key)
+            if df is not None:
+                return df       # put there while the caller looked
+            future = self._loading.get(key)
+            first = future is None
+            if first:
+                future = self._loading[key] = Future()
+        if not first:
+            return future.result()
+        try:
+            df = load()
+        except BaseException as e:
+            with self._lock:
+                del self._loading[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self.cache.put(key, df)
+            del self._loading[key]
+        future.set_result(df)
+        return df
+
+    # the whole sheet from the disk cache or the workbook, caching what was parsed on disk
+    def _load(self, path, sheet, fingerprint):
+        key = (path, sheet)
+        df = None
+        with perf_log.span("load sheet", sheet=sheet_label(path, sheet)) as rec:
+            if fingerprint is not None:
+                df = self.disk_cache.load(fingerprint, self._disk_sheet(sheet))
+                note = self.disk_cache.load_note(fingerprint, self._disk_sheet(sheet)) if df is not None else None
+                if note:
+                    with self._lock:
+                        self.compaction[key] = tuple(note["compaction"])
+            rec["source"] = "disk cache" if df is not None else "workbook"
+            if df is None:
+                df = self._parse(path, sheet)
+                if fingerprint is not None:
+                    self.disk_cache.save(fingerprint, self._disk_sheet(sheet), df)
+                    if key in self.compaction:
+                        self.disk_cache.save_note(
+                            fingerprint, self._disk_sheet(sheet), {"compaction": self.compaction[key]})
+            rec["rows"] = len(df)
+            rec["frame_bytes"] = frame_nbytes(df)
+        return df
+
+    def _get_projection(self, path, sheet, usecols, nrows):
+        usecols = None if usecols is None else list(dict.fromkeys(usecols))
+        key = (path, sheet, None if usecols is None else tuple(usecols), nrows)
+        with self._lock:
+            df = self.cache.get(key)
+        if df is not None:
+            return df
+        return self._load_once(key, lambda: self._load_projection(path, sheet, usecols, nrows))
+
+    def _load_projection(self, path, sheet, usecols, nrows):
+        df = None
+        with perf_log.span("read columns", sheet=sheet_label(path, sheet),
+                           columns=None if usecols is None else len(usecols)) as rec:
+            fingerprint = self._fingerprints.get(path)
+            if fingerprint is not None and nrows is None:
+                df = self.disk_cache.load(fingerprint, self._disk_sheet(sheet), columns=usecols)
+            rec["source"] = "disk cache" if df is not None else "workbook"
+            if df is None:
+                df = self._read_projection(path, sheet, usecols, nrows)
+            rec["rows"] = len(df)
+        return df
+
+    def _read_projection(self, path, sheet, usecols, nrows):
+        positions = None
+        if usecols is not None:
+            header = self.columns(path, sheet)
+            if not all(c in header for c in usecols):
+                return _project(self.get(path, sheet), usecols, nrows)
+            positions = sorted(header.index(c) for c in usecols)
+        df = self._parse(path, sheet, positions, nrows)
+        if usecols is not None:
+            # header mangling (duplicate names) can differ on a partial read
+            if sorted(map(str, df.columns)) != sorted(map(str, usecols)):
+                return _project(self.get(path, sheet), usecols, nrows)
+            df = df[usecols]
+        return df
+
+    def set(self, path, sheet, df):
+        with self._lock:
+            self.cache.discard_where(lambda k: k[:2] == (path, sheet))
+            self._headers.pop((path, sheet), None)
+            self._pinned[(path, sheet)] = df
+            self._books[path][sheet] = df.shape
+            self._versions[(path, sheet)] = next(self._clock)
+
+    # every parsed frame held in memory, {(path, sheet[, columns, nrows]): DataFrame}
+    def frames(self):
+        with self._lock:
+            return {**dict(self.cache.items()), **self._pinned}
+
+    # a frame with no workbook behind it (e.g. a pipeline step's output), pinned like an edit
+    def attach(self, path, sheet, df):
+        with self._lock:
+            self._books.setdefault(path, {})
+        self.set(path, sheet, df)
+
+    def remove(self, path):
+        with self._lock:
+            self._books.pop(path, None)
+            self._fingerprints.pop(path, None)
+            self._headers = {k: v for k, v in self._headers.items() if k[0] != path}
+            self.compaction = {k: v for k, v in self.compaction.items() if k[0] != path}
+            self.cache.discard_where(lambda k: k[0] == path)
+            for key in [k for k in self._pinned if k[0] == path]:
+                del self._pinned[key]
+
+    def clear(self):
+        with self._lock:
+            self._books.clear()
+            self._fingerprints.clear()
+            self._headers.clear()
+            self.compaction.clear()
+            self._pinned.clear()
+            self.cache.clear()
+
+
+# ---------- File watching ----------
+# Notices workbooks that changed on disk by polling their size and mtime, so it works the same
+# on local disks and network shares with nothing to install. A change is reported once the
+# file has looked the same on two checks in a row, so a workbook still being saved (or copied
+# in) isn't read half-written.
+def file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None     # gone, or briefly missing while an app saves by replacing it
+    return st.st_size, st.st_mtime_ns
+
+
+class FileWatcher:
+    def __init__(self, on_change=None, interval=WATCH_SECONDS):
+        self.on_change = on_change  # on_change(path), called on the watcher thread
+        self.interval = interval
+        self._known = {}    # {path: stamp of the copy that was read}
+        self._seen = {}     # {path: new stamp from the last check, not reported yet}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # stamp: taken before the workbook was read; by default the file as it is now
+    def watch(self, path, stamp=None):
+        with self._lock:
+            self._known[path] = stamp if stamp is not None else file_stamp(path)
+            self._seen.pop(path, None)
+
+    def unwatch(self, path):
+        with self._lock:
+            self._known.pop(path, None)
+            self._seen.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._known.clear()
+            self._seen.clear()
+
+    # paths whose change has settled since the last check; they count as read from here on
+    def check(self):
+        with self._lock:
+            known = dict(self._known)
+        changed = []
+        for path, stamp in known.items():
+            now = file_stamp(path)
+            with self._lock:
+                if path not in self._known:
+                    continue
+                if now is None or now == stamp:
+                    self._seen.pop(path, None)
+                elif self._seen.get(path) != now:
+                    self._seen[path] = now
+                else:
+                    self._known[path] = now
+                    del self._seen[path]
+                    changed.append(path)
+        for path in changed:
+            if self.on_change is not None:
+                self.on_change(path)
+        return changed
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            # a fresh event each time: a thread told to stop never picks up again
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._loop, args=(self._stop,), name="abg-watch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _loop(self, stop):
+        while not stop.wait(self.interval):
+            self.check()
+
+
+# ---------- Key indexes ----------
+# A hash index over a lookup sheet's key column, built once and reused by every
+# VLOOKUP against that key until the sheet changes.
+DUPLICATE_POLICIES = ("first", "last", "error", "aggregate")
+KEY_INDEX_CACHE_SIZE = 16
+
+
+class DuplicateKeyError(ValueError):
+    pass
+
+
+def _numbers_as_text(s):
+    nums = pd.to_numeric(s, errors="coerce")
+    is_num = nums.notna().to_numpy()
+    out = s.astype(object).to_numpy(copy=True)
+    if is_num.any():
+        values = nums.to_numpy(dtype="float64", na_value=np.nan)[is_num]
+        integral = np.isfinite(values) & (values == np.round(values)) & (np.abs(values) < 2 ** 53)
+        text = np.empty(len(values), dtype=object)
+        text[integral] = values[integral].astype(np.int64).astype(str)
+        text[~integral] = [repr(v) for v in values[~integral]]
+        out[is_num] = text
+    return pd.Series(out, index=s.index)
+
+
+NORMALIZE_OPTIONS = (("trim", "Trim spaces"), ("casefold", "Ignore case"), ("numeric_text", "Numbers as text"))
+
+
+# normalize=("trim", "casefold", "numeric_text") in any combination; NaN keys stay NaN
+def normalize_keys(s, normalize=()):
+    if not normalize:
+        return s
+    mask = s.isna()
+    if "numeric_text" in normalize:
+        s = _numbers_as_text(s)
+    text = s.astype(object).where(mask, s.astype(str))
+    if "trim" in normalize:
+        text = text.str.strip()
+    if "casefold" in normalize:
+        text = text.str.casefold()
+    return text
+
+
+def normalize_frame(df, columns, normalize=()):
+    return pd.DataFrame({i: normalize_keys(df[c], normalize) for i, c in enumerate(columns)}, index=df.index)
+
+
+# one key column -> Index, several -> MultiIndex
+def _key_index(keys):
+    if keys.shape[1] == 1:
+        return pd.Index(keys.iloc[:, 0].to_numpy())
+    return pd.MultiIndex.from_arrays([keys[c].to_numpy() for c in keys.columns])
+
+
+class KeyIndex:
+    # keys: DataFrame of already-normalized key columns, one row per lookup-sheet row
+    def __init__(self, keys, policy="first"):
+        if policy not in DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown duplicate policy: {policy}")
+        self.policy = policy
+        valid = keys.notna().all(axis=1).to_numpy()
+        index = _key_index(keys[valid])
+        positions = np.flatnonzero(valid)
+        dup = index.duplicated(keep="first")
+        self.duplicates = int(dup.sum())    # rows beyond the first for each key
+        if policy == "error" and self.duplicates:
+            sample = ", ".join(map(str, index[dup].unique()[:5]))
+            raise DuplicateKeyError(f"{self.duplicates} duplicate lookup key(s), e.g. {sample}")
+        self._agg_cache = {}
+        if policy == "aggregate":
+            self.codes, self.index = pd.factorize(index, sort=False)
+            self.positions = positions
+        else:
+            keep = ~index.duplicated(keep="last" if policy == "last" else "first")
+            self.index = index[keep]
+            self.positions = positions[keep]
+
+    def __len__(self):
+        return len(self.index)
+
+    # lookup-sheet row for each probe row (DataFrame of normalized keys), -1 where there is none
+    def locate(self, probe):
+        hit = self.index.get_indexer(_key_index(probe))
+        if self.policy == "aggregate":
+            return hit
+        return np.where(hit >= 0, self.positions[np.maximum(hit, 0)], -1)
+
+    # lookup_df[cols] aligned to the probe rows; unmatched rows are NaN
+    def fetch(self, lookup_df, probe, cols):
+        where = self.locate(probe)
+        if self.policy == "aggregate":
+            source = self._aggregated(lookup_df, cols)
+        else:
+            source = lookup_df[cols].reset_index(drop=True)
+        # -1 is never a label of the RangeIndex, so reindex fills misses with NaN
+        out = source.reindex(where)
+        out.index = probe.index
+        return out, where >= 0
+
+    # one row per key: numbers summed, everything else joined as distinct text
+    def _aggregated(self, lookup_df, cols):
+        key = tuple(cols)
+        if key not in self._agg_cache:
+            rows = lookup_df[cols].iloc[self.positions].reset_index(drop=True)
+            parts = {}
+            for c in cols:
+                col = rows[c]
+                if pd.api.types.is_numeric_dtype(col.dtype) and not pd.api.types.is_bool_dtype(col.dtype):
+                    parts[c] = col.groupby(self.codes, sort=True).sum(min_count=1)
+                else:
+                    parts[c] = col.groupby(self.codes, sort=True).agg(
+                        lambda g: ", ".join(pd.unique(g.dropna().astype(str))))
+            self._agg_cache[key] = pd.DataFrame(parts).reindex(range(len(self.index))).reset_index(drop=True)
+        return self._agg_cache[key]
+
+
+class KeyIndexCache:
+    def __init__(self, max_entries=KEY_INDEX_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, registry, path, sheet, columns, normalize=(), policy="first"):
+        columns = list(columns)
+        key = (path, sheet, tuple(columns), tuple(sorted(normalize)), policy, registry.version(path, sheet))
+        with self._lock:
+            index = self._items.get(key)
+            if index is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return index
+        with perf_log.span("key index", sheet=sheet_label(path, sheet)) as rec:
+            keys = registry.get(path, sheet, usecols=columns)
+            index = KeyIndex(normalize_frame(keys, columns, normalize), policy)
+            rec["rows"] = len(keys)
+        with self._lock:
+            self.builds += 1
+            self._items[key] = index
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+def _attach(df_main, fetched, matched, policy, duplicates):
+    fetched.columns = [f"{c}_lk" if c in df_main.columns else c for c in fetched.columns]
+    out = pd.concat([df_main, fetched.set_axis(df_main.index)], axis=1)
+    stats = {
+        "rows": len(df_main),
+        "matched": int(np.asarray(matched).sum()),
+        "duplicates": duplicates,
+        "policy": policy,
+    }
+    return out, stats
+
+
+# df_main plus fetch_cols from the lookup side; never adds rows to df_main
+@instrumented("merge")
+def vlookup_frame(df_main, keys_main, df_lookup, fetch_cols, index, normalize=()):
+    probe = normalize_frame(df_main, keys_main, normalize)
+    fetched, matched = index.fetch(df_lookup, probe, fetch_cols)
+    return _attach(df_main, fetched, matched, index.policy, index.duplicates)
+
+
+APPROX_DIRECTIONS = {
+    "approximate": "backward",  # largest lookup key <= main key, like Excel's range lookup
+    "nearest": "nearest",
+}
+
+
+def _range_key(s):
+    if pd.api.types.is_numeric_dtype(s.dtype) or pd.api.types.is_datetime64_any_dtype(s.dtype):
+        return s
+    for convert in (pd.to_numeric, pd.to_datetime):
+        try:
+            return convert(s)
+        except (ValueError, TypeError):
+            pass
+    raise ValueError(f"Approximate match needs a numeric or date key; '{s.name}' is neither.")
+
+
+DATE_UNITS = ("s", "ms", "us", "ns")
+
+
+def _numeric_key(s):
+    if isinstance(s.dtype, np.dtype):
+        return s.to_numpy()
+    if not s.hasnans:
+        return s.to_numpy(dtype=s.dtype.numpy_dtype)
+    # nullable numbers (Int64, Float64, Arrow) with blanks: only a float array holds NaN
+    return s.to_numpy(dtype="float64", na_value=np.nan)
+
+
+# both sides as arrays of one dtype wide enough for either (int8 + int16, int + float)
+def _common_numbers(a, b):
+    a, b = _numeric_key(a), _numeric_key(b)
+    dtype = np.result_type(a.dtype, b.dtype)
+    return a.astype(dtype, copy=False), b.astype(dtype, copy=False)
+
+
+# merge_asof only compares keys of one dtype: numbers are widened to a common dtype,
+# dates to the finer of the two resolutions
+def _range_keys(s_main, s_lookup):
+    a, b = _range_key(s_main), _range_key(s_lookup)
+    is_date = pd.api.types.is_datetime64_any_dtype
+    if is_date(a.dtype) != is_date(b.dtype):
+        raise ValueError(f"Approximate match needs two numeric or two date keys; '{a.name}' and '{b.name}' differ.")
+    if not is_date(a.dtype):
+        return _common_numbers(a, b)
+    if a.dtype != b.dtype:
+        unit = max(a.dt.unit, b.dt.unit, key=DATE_UNITS.index)
+        a, b = a.dt.as_unit(unit), b.dt.as_unit(unit)
+    return a.array, b.array
+
+
+# by= keys need one dtype per column too; anything but two kinds of number is compared as objects.
+# Categoricals (compacted sheets) too: each sheet gets its own categories.
+def _common_by_keys(left, right, names):
+    for name in names:
+        a, b = left[name], right[name]
+        categorical = isinstance(a.dtype, pd.CategoricalDtype) or isinstance(b.dtype, pd.CategoricalDtype)
+        if a.dtype == b.dtype and not categorical:
+            continue
+        if pd.api.types.is_numeric_dtype(a.dtype) and pd.api.types.is_numeric_dtype(b.dtype):
+            left[name], right[name] = _common_numbers(a, b)
+        else:
+            left[name], right[name] = a.astype(object), b.astype(object)
+
+
+# Exact match on every key but the last, sorted search (merge_asof) on the last one.
+@instrumented("merge")
+def approx_vlookup_frame(df_main, keys_main, df_lookup, keys_lookup, fetch_cols,
+                         mode="approximate", normalize=(), policy="first"):
+    if policy not in ("first", "last", "error"):
+        raise ValueError("Approximate match supports the first, last and error duplicate policies.")
+    n = len(keys_main)
+    names = [f"__k{i}" for i in range(n)]
+    left = normalize_frame(df_main, keys_main[:-1], normalize).set_axis(names[:-1], axis=1)
+    right = normalize_frame(df_lookup, keys_lookup[:-1], normalize).set_axis(names[:-1], axis=1)
+    _common_by_keys(left, right, names[:-1])
+    left[names[-1]], right[names[-1]] = _range_keys(df_main[keys_main[-1]], df_lookup[keys_lookup[-1]])
+    left["__pos"] = np.arange(len(df_main))
+    fetched_names = [f"__f{i}" for i in range(len(fetch_cols))]
+    for name, c in zip(fetched_names, fetch_cols):
+        right[name] = df_lookup[c].to_numpy()
+    right["__hit"] = True
+
+    # merge_asof refuses null keys; those rows simply never match
+    left = left.dropna(subset=names)
+    right = right.dropna(subset=names)
+    dup = right.duplicated(subset=names, keep="first")
+    duplicates = int(dup.sum())
+    if policy == "error" and duplicates:
+        raise DuplicateKeyError(f"{duplicates} duplicate lookup key(s)")
+    right = right[~right.duplicated(subset=names, keep="last" if policy == "last" else "first")]
+
+    merged = pd.merge_asof(
+        left.sort_values(names[-1], kind="stable"),
+        right.sort_values(names[-1], kind="stable"),
+        on=names[-1],
+        by=names[:-1] or None,
+        direction=APPROX_DIRECTIONS[mode],
+    )
+    # back to main-sheet order, with NaN rows for keys that were null
+    merged = merged.set_index("__pos").reindex(np.arange(len(df_main)))
+    fetched = merged[fetched_names].set_axis(list(fetch_cols), axis=1)
+    matched = merged["__hit"].notna().to_numpy()
+    return _attach(df_main, fetched, matched, policy, duplicates)
+
+
+def describe_match(stats):
+    rows, matched = stats["rows"], stats["matched"]
+    rate = matched / rows if rows else 0.0
+    msg = f"matched {matched:,} of {rows:,} rows ({rate:.1%})"
+    if stats["duplicates"]:
+        msg += f"; {stats['duplicates']:,} duplicate lookup key(s) resolved by '{stats['policy']}'"
+    return msg
+
+
+# ---------- Fuzzy matching ----------
+# Keys from different systems ("ACME Corp." vs "Acme Corporation") matched by similarity. Keys
+# are cleaned first (case, punctuation, legal suffixes such as Inc / Corp / Ltd) and keys equal
+# once cleaned match outright with score 1. The rest are scored as TF-IDF weighted sets of
+# character trigrams (cosine similarity, 0..1). The blocking index is an inverted index over the
+# lookup side's trigrams: a key is only scored against lookup keys sharing a trigram with it, and
+# trigrams in more than FUZZY_MAX_POSTINGS lookup keys are too common to block or score on. Only
+# distinct keys are matched; they are scored in chunks, side by side in worker processes.
+FUZZY_THRESHOLD = 0.8
+FUZZY_MAX_POSTINGS = 300
+FUZZY_CHUNK_KEYS = 2_000
+FUZZY_PARALLEL_MIN = 10_000     # fewer keys left to score than this are scored in the calling process
+FUZZY_SCORE_COLUMN = "Match Score"
+FUZZY_KEY_COLUMN = "Matched Key"
+FUZZY_STOPWORDS = (
+    "the", "and", "of", "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited",
+    "llc", "llp", "lp", "plc", "pvt", "pty", "gmbh", "ag", "sa", "sas", "srl", "bv", "nv", "oy", "ab", "kk",
+)
+_FUZZY_STOPWORDS = re.compile(r"\b(?:" + "|".join(FUZZY_STOPWORDS) + r")\b")
+
+
+# text of each key (key columns joined by spaces), NaN where a key column is blank
+def fuzzy_keys(df, keys, normalize=()):
+    parts = normalize_frame(df, keys, normalize)
+    valid = parts.notna().all(axis=1)
+    text = parts.iloc[:, 0].astype(str)
+    for i in range(1, parts.shape[1]):
+        text = text + " " + parts.iloc[:, i].astype(str)
+    return text.where(valid)
+
+
+def fuzzy_clean(texts):
+    s = pd.Series(texts, dtype=object).astype(str).str.casefold().str.replace(r"[\W_]+", " ", regex=True)
+    plain = s.str.split().str.join(" ")
+    cleaned = s.str.replace(_FUZZY_STOPWORDS, " ", regex=True).str.split().str.join(" ")
+    # a key that is all stop words ("The Company") keeps them
+    return cleaned.where(cleaned != "", plain).to_numpy(dtype=object)
+
+
+# (text id, trigram) for each distinct trigram of each text; the padding makes word ends count
+def _trigrams(texts):
+    ids, grams = [], []
+    for i, text in enumerate(texts):
+        text = f" {text} "
+        found = {text[j:j + 3] for j in range(len(text) - 2)}
+        ids.extend(itertools.repeat(i, len(found)))
+        grams.extend(found)
+    return np.array(ids, dtype=np.int64), np.array(grams, dtype=object)
+
+
+class FuzzyIndex:
+    # texts: distinct cleaned lookup keys
+    def __init__(self, texts, max_postings=FUZZY_MAX_POSTINGS):
+        self.size = len(texts)
+        ids, grams = _trigrams(texts)
+        codes, uniques = pd.factorize(grams)
+        self.grams = pd.Index(uniques)
+        df = np.bincount(codes, minlength=len(uniques))
+        self.weight = np.log((1 + self.size) / (1 + df)) + 1     # smoothed idf
+        self.unseen_weight = float(np.log(1 + self.size) + 1)
+        self.norm = np.sqrt(np.bincount(ids, self.weight[codes] ** 2, minlength=self.size))
+        # only the rarer trigrams have posting lists; common ones still count in the score
+        self.blocks = df <= max_postings
+        rare = self.blocks[codes]
+        self.postings = ids[rare][np.argsort(codes[rare], kind="stable")]
+        self.count = np.where(self.blocks, df, 0)
+        self.start = np.concatenate([[0], np.cumsum(self.count)[:-1]]).astype(np.int64)
+        # (lookup key, common trigram) pairs, sorted for membership tests
+        self.common = np.sort(ids[~rare] * len(uniques) + codes[~rare])
+        self.common_norm = np.sqrt(np.bincount(ids[~rare], self.weight[codes[~rare]] ** 2, minlength=self.size))
+
+    # best lookup text for each of texts: (lookup ids or -1, scores)
+    def match(self, texts, threshold=FUZZY_THRESHOLD):
+        best = np.full(len(texts), -1, dtype=np.int64)
+        score = np.full(len(texts), np.nan)
+        ids, grams = _trigrams(texts)
+        codes = self.grams.get_indexer(grams)
+        known = codes >= 0
+        w = np.where(known, self.weight[np.maximum(codes, 0)], self.unseen_weight)
+        norm = np.sqrt(np.bincount(ids, w * w, minlength=len(texts)))
+        ids, codes = ids[known], codes[known]
+        rare = self.blocks[codes]
+        common_ids, common_codes = ids[~rare], codes[~rare]
+        common_norm = np.sqrt(np.bincount(common_ids, self.weight[common_codes] ** 2, minlength=len(texts)))
+        ids, codes = ids[rare], codes[rare]
+        counts = self.count[codes]
+        if not counts.sum():
+            return best, score
+        # blocking: every (text, lookup key) pair sharing a rare trigram, once per shared trigram
+        left = np.repeat(ids, counts)
+        ends = np.cumsum(counts)
+        offsets = np.arange(ends[-1]) - np.repeat(ends - counts - self.start[codes], counts)
+        right = self.postings[offsets]
+        pair_codes, pairs = pd.factorize(left * self.size + right)
+        dot = np.bincount(pair_codes, np.repeat(self.weight[codes] ** 2, counts))
+        left, right = pairs // self.size, pairs % self.size
+        scale = norm[left] * self.norm[right]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # the common trigrams add at most the product of their norms (Cauchy-Schwarz)
+            bound = (dot + common_norm[left] * self.common_norm[right]) / scale
+        keep = bound >= threshold
+        left, right, dot, scale = left[keep], right[keep], dot[keep], scale[keep]
+        # common trigrams the remaining pairs share, looked up per trigram of the text
+        per_text = np.bincount(common_ids, minlength=len(texts))
+        text_start = np.concatenate([[0], np.cumsum(per_text)[:-1]])
+        reps = per_text[left]
+        pair = np.repeat(np.arange(len(left)), reps)
+        ends = np.cumsum(reps)
+        at = np.repeat(text_start[left] - (ends - reps), reps) + np.arange(ends[-1] if len(ends) else 0)
+        gram = common_codes[at]
+        probe = right[pair] * len(self.grams) + gram
+        slot = np.minimum(np.searchsorted(self.common, probe), max(len(self.common) - 1, 0))
+        shared = self.common[slot] == probe if len(self.common) else np.zeros(len(probe), dtype=bool)
+        dot = dot + np.bincount(pair[shared], self.weight[gram[shared]] ** 2, minlength=len(left))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sim = np.minimum(dot / scale, 1.0)
+        ok = sim >= threshold
+        left, right, sim = left[ok], right[ok], sim[ok]
+        # best score first, the earliest lookup key among equals
+        order = np.lexsort((right, -sim, left))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = left[order][1:] != left[order][:-1]
+        pick = order[first]
+        best[left[pick]] = right[pick]
+        score[left[pick]] = sim[pick]
+        return best, score
+
+
+_fuzzy_index = None     # the lookup side, in each worker process of a fuzzy match
+
+
+def _fuzzy_worker(index):
+    global _fuzzy_index
+    _fuzzy_index = index
+
+
+def _fuzzy_chunk(texts, threshold):
+    return _fuzzy_index.match(texts, threshold)
+
+
+# best lookup entry for each main entry: (positions in lookup or -1, scores). main and lookup
+# hold distinct key texts; among lookup keys equally close the first wins.
+def fuzzy_match(main, lookup, threshold=FUZZY_THRESHOLD, workers=PARSE_PROCESSES, progress=None):
+    main_clean, lookup_clean = fuzzy_clean(main), fuzzy_clean(lookup)
+    lookup_codes, lookup_texts = pd.factorize(lookup_clean)
+    first = np.full(len(lookup_texts), -1, dtype=np.int64)
+    first[lookup_codes[::-1]] = np.arange(len(lookup_codes))[::-1]
+    main_codes, main_texts = pd.factorize(main_clean)
+    best = pd.Index(lookup_texts).get_indexer(main_texts).astype(np.int64)
+    score = np.where(best >= 0, 1.0, np.nan)
+    rest = np.flatnonzero(best < 0)
+    if len(rest) and len(lookup_texts):
+        with perf_log.span("fuzzy score", rows=len(rest), lookup=len(lookup_texts)):
+            index = FuzzyIndex(lookup_texts)
+            main_texts = np.asarray(main_texts, dtype=object)
+            chunks = [rest[i:i + FUZZY_CHUNK_KEYS] for i in range(0, len(rest), FUZZY_CHUNK_KEYS)]
+            pool = None
+            if workers > 1 and len(rest) >= FUZZY_PARALLEL_MIN:
+                # the index goes to each worker once, the chunks of keys one by one
+                pool = ProcessPoolExecutor(min(workers, len(chunks)), initializer=_fuzzy_worker, initargs=(index,))
+            try:
+                if pool is None:
+                    results = (index.match(main_texts[chunk], threshold) for chunk in chunks)
+                else:
+                    results = pool.map(_fuzzy_chunk, [main_texts[chunk] for chunk in chunks],
+                                       itertools.repeat(threshold))
+                for i, (chunk, (chunk_best, chunk_score)) in enumerate(zip(chunks, results)):
+                    best[chunk], score[chunk] = chunk_best, chunk_score
+                    _step(progress, (i + 1) / len(chunks))
+            finally:
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+    where = np.where(best >= 0, first[np.maximum(best, 0)], -1)
+    return where[main_codes], score[main_codes]
+
+
+# df_main plus fetch_cols of each row's closest lookup key, the key itself and its score
+@instrumented("merge")
+def fuzzy_vlookup_frame(df_main, keys_main, df_lookup, keys_lookup, fetch_cols, threshold=FUZZY_THRESHOLD,
+                        normalize=(), policy="first", workers=PARSE_PROCESSES, progress=None):
+    if policy not in ("first", "last", "error"):
+        raise ValueError("Fuzzy match supports the first, last and error duplicate policies.")
+    main_keys = fuzzy_keys(df_main, keys_main, normalize)
+    lookup_keys = fuzzy_keys(df_lookup, keys_lookup, normalize)
+    main_codes, main_uniques = pd.factorize(main_keys)
+    lookup_codes, lookup_uniques = pd.factorize(lookup_keys)
+    valid = lookup_codes >= 0
+    duplicates = int(valid.sum()) - len(lookup_uniques)
+    if policy == "error" and duplicates:
+        raise DuplicateKeyError(f"{duplicates} duplicate lookup key(s)")
+    # lookup row standing for each distinct key
+    rows = np.flatnonzero(valid)
+    chosen = np.full(len(lookup_uniques), -1, dtype=np.int64)
+    if policy == "last":
+        chosen[lookup_codes[rows]] = rows
+    else:
+        chosen[lookup_codes[rows][::-1]] = rows[::-1]
+    best, score = fuzzy_match(np.asarray(main_uniques, dtype=object), np.asarray(lookup_uniques, dtype=object),
+                              threshold, workers, progress)
+    hit = main_codes >= 0
+    where = np.full(len(df_main), -1, dtype=np.int64)
+    where[hit] = np.where(best[main_codes[hit]] >= 0, chosen[np.maximum(best[main_codes[hit]], 0)], -1)
+    scores = np.full(len(df_main), np.nan)
+    scores[hit] = score[main_codes[hit]]
+    # -1 is never a label of the RangeIndex, so reindex fills misses with NaN
+    fetched = df_lookup[list(fetch_cols)].reset_index(drop=True).reindex(where)
+    fetched[FUZZY_KEY_COLUMN] = lookup_keys.reset_index(drop=True).reindex(where).to_numpy()
+    fetched[FUZZY_SCORE_COLUMN] = np.round(scores, 4)
+    return _attach(df_main, fetched, where >= 0, policy, duplicates)
+
+
+# ---------- Set comparison ----------
+# Keys from both sides are factorized together once; membership is then plain
+# array indexing on the integer codes, with no Python object per value.
+class CompareResult:
+    def __init__(self, cols_a, cols_b, codes_a, codes_b, uniques):
+        self.cols_a = list(cols_a)
+        self.cols_b = list(cols_b)
+        self.codes_a = codes_a      # per valid row of A, -1 for rows with a null key
+        self.codes_b = codes_b
+        self.uniques = uniques
+        present_a = np.zeros(len(uniques), dtype=bool)
+        present_b = np.zeros(len(uniques), dtype=bool)
+        present_a[codes_a[codes_a >= 0]] = True
+        present_b[codes_b[codes_b >= 0]] = True
+        self.present_a = present_a
+        self.present_b = present_b
+        self._order = None
+
+    def _keys(self, mask):
+        if self._order is None:
+            self._order = _sort_order(self.uniques)
+        return self.uniques[self._order[mask[self._order]]]
+
+    @property
+    def only_a(self):
+        return self._keys(self.present_a & ~self.present_b)
+
+    @property
+    def only_b(self):
+        return self._keys(self.present_b & ~self.present_a)
+
+    @property
+    def both(self):
+        return self._keys(self.present_a & self.present_b)
+
+    def counts(self):
+        return {
+            "only_a": int((self.present_a & ~self.present_b).sum()),
+            "only_b": int((self.present_b & ~self.present_a).sum()),
+            "both": int((self.present_a & self.present_b).sum()),
+        }
+
+    # rows of A whose key is missing from B (or present, with present=True)
+    def rows_a(self, df_a, present=False):
+        return df_a[self._row_mask(self.codes_a, self.present_b, present)]
+
+    def rows_b(self, df_b, present=False):
+        return df_b[self._row_mask(self.codes_b, self.present_a, present)]
+
+    @staticmethod
+    def _row_mask(codes, other, present):
+        hit = np.zeros(len(codes), dtype=bool)
+        valid = codes >= 0
+        hit[valid] = other[codes[valid]]
+        return (hit if present else ~hit) & valid
+
+    # distinct keys side by side, one column per key column and side
+    def to_frame(self, label_a, label_b, include_both=False):
+        groups = [(f"Only in {label_a}", self.only_a, self.cols_a),
+                  (f"Only in {label_b}", self.only_b, self.cols_b)]
+        if include_both:
+            groups.append(("In both", self.both, self.cols_a))
+        parts = {}
+        for label, keys, cols in groups:
+            if len(cols) == 1:
+                parts[label] = pd.Series(np.asarray(keys, dtype=object))
+            else:
+                for level, c in enumerate(cols):
+                    parts[f"{label} [{c}]"] = pd.Series(np.asarray(keys.get_level_values(level), dtype=object))
+        return pd.DataFrame(parts)
+
+    # whole rows that exist on only one side, labelled by a leading Side column
+    def to_rows(self, df_a, df_b, label_a, label_b):
+        a = self.rows_a(df_a)
+        b = self.rows_b(df_b)
+        a.insert(0, "Side", f"Only in {label_a}", allow_duplicates=True)
+        b.insert(0, "Side", f"Only in {label_b}", allow_duplicates=True)
+        return pd.concat([a, b], ignore_index=True, sort=False)
+
+
+def _sort_order(uniques):
+    try:
+        return np.asarray(uniques.argsort())
+    except TypeError:
+        # mixed numbers and text: order by the text form, like the old astype(str) path
+        return np.asarray(pd.Index(uniques.map(str)).argsort())
+
+
+@instrumented("set compare")
+def compare_sets(df_a, cols_a, df_b, cols_b, normalize=()):
+    if len(cols_a) != len(cols_b):
+        raise ValueError("Both sides need the same number of key columns.")
+    ka = normalize_frame(df_a, cols_a, normalize)
+    kb = normalize_frame(df_b, cols_b, normalize)
+    valid_a = ka.notna().all(axis=1).to_numpy()
+    valid_b = kb.notna().all(axis=1).to_numpy()
+    keys = _key_index(pd.concat([ka[valid_a], kb[valid_b]], ignore_index=True))
+    codes, uniques = pd.factorize(keys, sort=False)
+    n_a = int(valid_a.sum())
+    codes_a = np.full(len(ka), -1, dtype=np.intp)
+    codes_b = np.full(len(kb), -1, dtype=np.intp)
+    codes_a[valid_a] = codes[:n_a]
+    codes_b[valid_b] = codes[n_a:]
+    return CompareResult(cols_a, cols_b, codes_a, codes_b, pd.Index(uniques) if keys.nlevels == 1 else uniques)
+
+
+# as compare_sets, with each key of A standing for its closest key of B when that scores at
+# least threshold; several key columns are matched as one text and listed as one column
+@instrumented("set compare")
+def fuzzy_compare_sets(df_a, cols_a, df_b, cols_b, threshold=FUZZY_THRESHOLD, normalize=(),
+                       workers=PARSE_PROCESSES, progress=None):
+    if len(cols_a) != len(cols_b):
+        raise ValueError("Both sides need the same number of key columns.")
+    codes_a, uniques_a = pd.factorize(fuzzy_keys(df_a, cols_a, normalize))
+    codes_b, uniques_b = pd.factorize(fuzzy_keys(df_b, cols_b, normalize))
+    best = fuzzy_match(np.asarray(uniques_a, dtype=object), np.asarray(uniques_b, dtype=object),
+                       threshold, workers, progress)[0]
+    # unmatched keys of A get codes of their own after those of B
+    own = np.cumsum(best < 0) - 1 + len(uniques_b)
+    code_of_a = np.where(best >= 0, best, own)
+    codes_a = np.where(codes_a >= 0, code_of_a[np.maximum(codes_a, 0)], -1).astype(np.intp)
+    uniques = pd.Index(np.concatenate([np.asarray(uniques_b, dtype=object),
+                                       np.asarray(uniques_a, dtype=object)[best < 0]]))
+    return CompareResult([" + ".join(map(str, cols_a))], [" + ".join(map(str, cols_b))],
+                         codes_a, codes_b.astype(np.intp), uniques)
+
+
+def describe_compare(counts):
+    return (f"only in A: {counts['only_a']:,}, only in B: {counts['only_b']:,}, "
+            f"in both: {counts['both']:,}")
+
+
+# ---------- Row diff ----------
+# Two versions of a sheet (old A, new B) matched row by row on key columns. Every row's compared
+# values are hashed into one number, so a matched pair with equal hashes is unchanged without a
+# look at its cells; only pairs whose hashes differ are compared cell by cell. Each step is a
+# hash or array pass over the rows, so the work grows linearly with them. A key repeated on a
+# side pairs its n-th row in A with its n-th row in B.
+DIFF_LAYOUTS = ("cells", "rows")
+DIFF_CHANGES = ("added", "removed", "changed")
+
+
+# one uint64 per row; numbers hash as float64 so 1 from one sheet and 1.0 from another are the same value
+def row_hashes(df):
+    df = df.copy(deep=False)
+    for c in range(df.shape[1]):
+        s = df.iloc[:, c]
+        if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+            df.isetitem(c, s.astype("float64"))
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def _is_number(dtype):
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+
+# cell by cell equality of two aligned columns; blank on both sides counts as equal
+def _cells_equal(a, b):
+    blank_a, blank_b = a.isna().to_numpy(), b.isna().to_numpy()
+    equal = blank_a & blank_b
+    both = ~(blank_a | blank_b)
+    if _is_number(a.dtype) and _is_number(b.dtype):
+        va, vb = a.to_numpy(dtype="float64", na_value=np.nan), b.to_numpy(dtype="float64", na_value=np.nan)
+    else:
+        # differently typed versions (category vs text, ns vs us dates) compare by value
+        va, vb = a.to_numpy(dtype=object), b.to_numpy(dtype=object)
+    equal[both] = va[both] == vb[both]
+    return equal
+
+
+# positions of the rows of A and B paired by key, -1 in pair_b for rows of A with no partner
+def _pair_rows(ka, kb):
+    valid_a = ka.notna().all(axis=1).to_numpy()
+    valid_b = kb.notna().all(axis=1).to_numpy()
+    keys = _key_index(pd.concat([ka[valid_a], kb[valid_b]], ignore_index=True))
+    codes = pd.factorize(keys, sort=False)[0].astype(np.int64)
+    n_a = int(valid_a.sum())
+    codes_a, codes_b = codes[:n_a], codes[n_a:]
+    n_codes = int(codes.max()) + 1 if len(codes) else 0
+    duplicates = 0
+    for side in (codes_a, codes_b):
+        occurrence = pd.Series(side).groupby(side, sort=False).cumcount().to_numpy()
+        duplicates += int(np.count_nonzero(occurrence))
+        # the n-th row of a repeated key gets a code of its own, past every plain key code
+        side += occurrence * n_codes
+    rows_a, rows_b = np.flatnonzero(valid_a), np.flatnonzero(valid_b)
+    hit = pd.Index(codes_b).get_indexer(codes_a)
+    found = hit >= 0
+    pair_b = np.full(len(rows_a), -1, dtype=np.intp)
+    pair_b[found] = rows_b[hit[found]]
+    unmatched_b = np.ones(len(rows_b), dtype=bool)
+    unmatched_b[hit[found]] = False
+    blank_keys = int((~valid_a).sum() + (~valid_b).sum())
+    return rows_a, pair_b, rows_b[unmatched_b], blank_keys, duplicates
+
+
+class RowDiff:
+    def __init__(self, keys_a, keys_b, cols, removed, added, changed_a, changed_b, cells, stats):
+        self.keys_a = list(keys_a)
+        self.keys_b = list(keys_b)
+        self.cols = list(cols)
+        self.removed = removed      # rows of A whose key is gone from B
+        self.added = added          # rows of B with a new key
+        self.changed_a = changed_a  # matched rows with at least one different cell, A side
+        self.changed_b = changed_b
+        self.cells = cells          # bool (changed rows x cols), True where the cell changed
+        self.stats = stats
+
+    def counts(self):
+        return dict(self.stats)
+
+    def _keys(self, df_a, df_b, groups):
+        parts = {}
+        for i, (ka, kb) in enumerate(zip(self.keys_a, self.keys_b)):
+            parts[i] = pd.concat([(df_b[kb] if side == "b" else df_a[ka]).iloc[rows].reset_index(drop=True)
+                                  for side, rows in groups], ignore_index=True)
+        return parts
+
+    # one line per added row, removed row and changed cell: Change, keys, Column, Old, New
+    def to_cells(self, df_a, df_b):
+        row, col = np.nonzero(self.cells)
+        pos_a, pos_b = self.changed_a[row], self.changed_b[row]
+        old = np.empty(len(row), dtype=object)
+        new = np.empty(len(row), dtype=object)
+        for j, c in enumerate(self.cols):
+            hit = col == j
+            old[hit] = df_a[c].iloc[pos_a[hit]].to_numpy(dtype=object)
+            new[hit] = df_b[c].iloc[pos_b[hit]].to_numpy(dtype=object)
+        n_added, n_removed = len(self.added), len(self.removed)
+        blank = np.full(n_added + n_removed, None, dtype=object)
+        parts = {"change": np.repeat(np.array(DIFF_CHANGES, dtype=object), [n_added, n_removed, len(row)])}
+        keys = self._keys(df_a, df_b, [("b", self.added), ("a", self.removed), ("a", pos_a)])
+        parts.update({f"key{i}": s for i, s in keys.items()})
+        names = np.array([str(c) for c in self.cols], dtype=object)
+        parts["column"] = np.concatenate([blank, names[col]])
+        parts["old"] = np.concatenate([blank, old])
+        parts["new"] = np.concatenate([blank, new])
+        out = pd.DataFrame(parts)
+        out.columns = ["Change", *self.keys_a, "Column", "Old", "New"]
+        return out
+
+    # whole rows: added and changed rows as they are in B, removed rows as they were in A,
+    # after Change and the names of the changed columns
+    def to_rows(self, df_a, df_b):
+        names = np.full(len(self.cells), "", dtype=object)
+        for j, c in enumerate(self.cols):
+            hit = self.cells[:, j]
+            names[hit] = names[hit] + np.where(names[hit] == "", "", ", ").astype(object) + str(c)
+        out = pd.concat([df_b.iloc[self.added], df_a.iloc[self.removed], df_b.iloc[self.changed_b]],
+                        ignore_index=True, sort=False)
+        out.insert(0, "Change", np.repeat(np.array(DIFF_CHANGES, dtype=object),
+                                          [len(self.added), len(self.removed), len(self.changed_b)]),
+                   allow_duplicates=True)
+        out.insert(1, "Changed Columns", np.concatenate([
+            np.full(len(self.added) + len(self.removed), "", dtype=object), names]), allow_duplicates=True)
+        return out
+
+
+# cols: the columns compared (default every column both versions have, keys aside)
+@instrumented("row diff")
+def diff_frames(df_a, keys_a, df_b, keys_b=None, cols=None, normalize=()):
+    keys_b = list(keys_b or keys_a)
+    if len(keys_a) != len(keys_b):
+        raise ValueError("Both versions need the same number of key columns.")
+    skip = set(keys_a) | set(keys_b)
+    in_b = set(df_b.columns)
+    if cols is None:
+        cols = [c for c in df_a.columns if c in in_b and c not in skip]
+    missing = [c for c in cols if c not in in_b or c not in df_a.columns]
+    if missing:
+        raise ValueError(f"Not in both versions: {', '.join(map(str, missing))}")
+    rows_a, pair_b, added, blank_keys, duplicates = _pair_rows(
+        normalize_frame(df_a, keys_a, normalize), normalize_frame(df_b, keys_b, normalize))
+    matched = pair_b >= 0
+    removed = rows_a[~matched]
+    pos_a, pos_b = rows_a[matched], pair_b[matched]
+    if cols and len(pos_a):
+        differs = row_hashes(df_a[cols])[pos_a] != row_hashes(df_b[cols])[pos_b]
+        pos_a, pos_b = pos_a[differs], pos_b[differs]
+        cells = np.column_stack([~_cells_equal(df_a[c].iloc[pos_a], df_b[c].iloc[pos_b]) for c in cols])
+    else:
+        pos_a, pos_b = pos_a[:0], pos_b[:0]
+        cells = np.zeros((0, len(cols)), dtype=bool)
+    # a differing hash may come from a type change alone (1 vs "1" stays a change, int vs float doesn't)
+    changed = cells.any(axis=1)
+    stats = {
+        "rows_a": len(df_a), "rows_b": len(df_b),
+        "added": len(added), "removed": len(removed),
+        "changed": int(changed.sum()), "unchanged": int(matched.sum() - changed.sum()),
+        "cells": int(cells.sum()), "columns": len(cols),
+        "only_a": [str(c) for c in df_a.columns if c not in in_b and c not in skip],
+        "only_b": [str(c) for c in df_b.columns if c not in set(df_a.columns) and c not in skip],
+        "blank_keys": blank_keys, "duplicates": duplicates,
+    }
+    return RowDiff(keys_a, keys_b, cols, removed, added, pos_a[changed], pos_b[changed], cells[changed], stats)
+
+
+def describe_diff(stats):
+    text = (f"{stats['added']:,} added, {stats['removed']:,} removed, {stats['changed']:,} changed "
+            f"({stats['cells']:,} cell(s)), {stats['unchanged']:,} unchanged")
+    if stats["only_a"]:
+        text += f"; columns dropped: {', '.join(stats['only_a'])}"
+    if stats["only_b"]:
+        text += f"; columns new: {', '.join(stats['only_b'])}"
+    if stats["blank_keys"]:
+        text += f"; {stats['blank_keys']:,} row(s) with a blank key left out"
+    return text
+
+
+# ---------- Concatenation ----------
+# Columns are turned into text one whole column at a time and joined column-wise;
+# with pyarrow installed the join runs in Arrow compute and the result stays Arrow-backed.
+def _format_value(fmt, v):
+    return fmt % v if "%" in fmt and "{" not in fmt else fmt.format(v)
+
+
+# fmt: strftime pattern for dates, "%.2f" or "{:,.2f}" style for numbers
+def concat_text(s, fmt=None):
+    dtype = s.dtype
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        if not fmt:
+            return _format_datetimes(s)
+        return s.dt.strftime(fmt).fillna("").to_numpy(dtype=object)
+    if fmt and pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+        values = s.to_numpy(dtype="float64", na_value=np.nan)
+        out = np.full(len(values), "", dtype=object)
+        ok = ~np.isnan(values)
+        if pd.api.types.is_integer_dtype(dtype):
+            out[ok] = [_format_value(fmt, int(v)) for v in values[ok]]
+        else:
+            out[ok] = [_format_value(fmt, v) for v in values[ok]]
+        return out
+    if pd.api.types.is_float_dtype(dtype):
+        return _format_floats(s)
+    return s.astype(object).where(s.notna(), "").astype(str).to_numpy(dtype=object)
+
+
+@instrumented("concat columns")
+def concat_columns(df, cols, sep=" ", prefix="", suffix="", formats=None, skip_empty=False):
+    formats = formats or {}
+    parts = [concat_text(df[c], formats.get(c)) for c in cols]
+    if _has_module("pyarrow"):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        arrays = [pa.array(p, type=pa.string()) for p in parts]
+        if skip_empty:
+            # folded pairwise: where either side is empty the other is kept alone, so an empty
+            # cell adds no separator (blanks are already "" here)
+            joined = arrays[0]
+            for arr in arrays[1:]:
+                both = pc.binary_join_element_wise(joined, arr, sep)
+                joined = pc.if_else(pc.equal(joined, ""), arr, pc.if_else(pc.equal(arr, ""), joined, both))
+        else:
+            joined = pc.binary_join_element_wise(*arrays, sep)
+        if prefix or suffix:
+            joined = pc.binary_join_element_wise(pa.scalar(prefix), joined, pa.scalar(suffix), "")
+        return pd.Series(pd.arrays.ArrowStringArray(joined), index=df.index)
+    out = parts[0]
+    for p in parts[1:]:
+        if skip_empty:
+            out = np.where(out == "", p, np.where(p == "", out, out + sep + p))
+        else:
+            out = out + sep + p
+    return pd.Series(prefix + out + suffix, index=df.index, dtype=object)
+
+
+# ---------- Stacking ----------
+# Same-layout sheets from many workbooks appended into one frame. Headers are matched ignoring
+# case and surrounding spaces (the first spelling wins), a column missing from a sheet is left
+# blank for its rows, and a column whose dtype differs between sheets takes whatever dtype
+# holds all of them. Categorical columns (compacted text) stay categorical over the union of
+# their categories instead of falling back to object.
+STACK_SOURCE_COLUMN = "Source File"
+
+
+class StackError(ValueError):
+    pass
+
+
+# sheets of each workbook whose names match pattern (fnmatch wildcards, any case); no pattern
+# takes each workbook's first sheet
+def match_sheets(registry, paths, pattern=""):
+    pattern = pattern.strip().casefold()
+    sources = []
+    for path in paths:
+        names = registry.sheet_names(path)
+        if not pattern:
+            sources.extend((path, sheet) for sheet in names[:1])
+        else:
+            sources.extend((path, sheet) for sheet in names if fnmatch.fnmatchcase(str(sheet).casefold(), pattern))
+    return sources
+
+
+def _header_key(name):
+    return str(name).strip().casefold()
+
+
+def _stack_columns(frames, labels):
+    names = {}      # {header key: first spelling}
+    renamed = []
+    for df, label in zip(frames, labels):
+        mapping = {}
+        for c in df.columns:
+            mapping[c] = names.setdefault(_header_key(c), c)
+        if len(set(mapping.values())) < df.shape[1] or len(mapping) < df.shape[1]:
+            raise StackError(f"{label} has duplicate column names; rename them before stacking")
+        renamed.append(df.rename(columns=mapping) if any(k != v for k, v in mapping.items()) else df)
+    return renamed, list(names.values())
+
+
+# dtype to build a stacked column in before the concat: the union of the categories when every
+# sheet has it categorical, else the one dtype the sheets share, which the sheets lacking the
+# column get their blanks in. None leaves it to pd.concat (ints and bools can't hold blanks).
+def _blank_dtype(parts):
+    if not all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+        dtypes = {p.dtype for p in parts}
+        if len(dtypes) == 1:
+            dtype = dtypes.pop()
+            if not (pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype)):
+                return dtype
+        return None
+    try:
+        return pd.CategoricalDtype(
+            pd.api.types.union_categoricals([p.array for p in parts], ignore_order=True).categories)
+    except TypeError:
+        return None     # categories of different kinds (numbers in one, text in another)
+
+
+# frames: one per sheet, labels: what the source column says for each. Returns (frame, report)
+@instrumented("align sheets")
+def stack_frames(frames, labels, source_col=STACK_SOURCE_COLUMN):
+    if not frames:
+        raise StackError("No sheets to stack")
+    frames, columns = _stack_columns(frames, labels)
+    missing = {}
+    for c in columns:
+        parts = [df[c] for df in frames if c in df.columns]
+        absent = [i for i, df in enumerate(frames) if c not in df.columns]
+        if absent:
+            missing[c] = [labels[i] for i in absent]
+        dtype = _blank_dtype(parts)
+        if dtype is not None and (absent or isinstance(dtype, pd.CategoricalDtype)):
+            frames = [df.assign(**{c: df[c].astype(dtype)}) if c in df.columns
+                      else df.assign(**{c: pd.Series([None] * len(df), index=df.index, dtype=dtype)})
+                      for df in frames]
+    dtypes = {}     # {column: {dtype: kind}} across the sheets holding it
+    for df in frames:
+        for c in df.columns:
+            dtypes.setdefault(c, {})[str(df[c].dtype)] = df[c].dtype.kind
+    out = pd.concat([df.reindex(columns=columns) if list(df.columns) != columns else df for df in frames],
+                    ignore_index=True)
+    # narrower and wider ints (compaction) aren't worth a mention; numbers next to text are
+    retyped = {c: sorted(dtypes[c]) for c in columns if len(set(dtypes[c].values())) > 1}
+    while source_col in out.columns:
+        source_col = f"{source_col}_"
+    # the same label may be given to several sheets (e.g. one source listed twice)
+    categories = pd.Index(labels).unique()
+    source = pd.Categorical.from_codes(
+        np.repeat(categories.get_indexer(labels), [len(df) for df in frames]), categories=categories)
+    out.insert(0, source_col, source)
+    report = {"sheets": len(frames), "rows": len(out), "columns": len(columns),
+              "missing": missing, "retyped": retyped}
+    return out, report
+
+
+def describe_stack(report):
+    msg = f"Stacked {report['sheets']} sheet(s): {report['rows']:,} rows, {report['columns']} column(s)"
+    if report["missing"]:
+        msg += f"; {len(report['missing'])} column(s) blank in some sheets"
+    if report["retyped"]:
+        msg += f"; mixed types in {', '.join(map(str, report['retyped']))}"
+    return msg
+
+
+# ---------- Distinct values ----------
+# Distinct values (or combinations of several columns) are grouped on the columns' own dtypes,
+# never converted to text. For inputs streamed chunk by chunk there are two mergeable sketches:
+# HyperLogLog for how many distinct values there are, and a bounded counter for the most frequent.
+UNIQUE_SORTS = ("appearance", "frequency")
+HLL_PRECISION = 14          # 2**14 one-byte registers: about 0.8% standard error
+TOPK_CAPACITY = 10          # counters kept per top-K entry asked for
+DISTINCT_CHUNK_ROWS = 200_000
+
+
+def _as_columns(cols):
+    return [cols] if isinstance(cols, str) else list(cols)
+
+
+# rows blank in every column hold no value
+def _non_blank(df):
+    return df[df.notna().any(axis=1).to_numpy()]
+
+
+def _value_counts(keys):
+    return keys.groupby(list(keys.columns), dropna=False, sort=False, observed=True).size()
+
+
+# one row per distinct value or combination, in order of first appearance or most frequent first
+@instrumented("distinct")
+def distinct_frame(df, cols, counts=False, sort="appearance"):
+    if sort not in UNIQUE_SORTS:
+        raise ValueError(f"Unknown sort: {sort}")
+    sizes = _value_counts(_non_blank(df[_as_columns(cols)]))
+    out = sizes.index.to_frame(index=False)
+    if counts:
+        out["Count"] = sizes.to_numpy()
+    if sort == "frequency":
+        out = out.iloc[np.argsort(-sizes.to_numpy(), kind="stable")].reset_index(drop=True)
+    return out
+
+
+class HyperLogLog:
+    def __init__(self, precision=HLL_PRECISION):
+        self.p = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        return 1.04 / float(np.sqrt(len(self.registers)))
+
+    def add(self, df):
+        if not len(df):
+            return
+        h = row_hashes(df)
+        bits = 64 - self.p
+        index = (h >> np.uint64(bits)).astype(np.intp)
+        rest = h & np.uint64((1 << bits) - 1)
+        # rank = 1 + leading zeros of the remaining bits
+        rank = np.full(len(h), bits + 1, dtype=np.uint8)
+        nonzero = rest != 0
+        r = rest[nonzero]
+        top = np.floor(np.log2(r.astype(np.float64))).astype(np.uint64)
+        top -= (np.left_shift(np.uint64(1), top) > r).astype(np.uint64)    # float rounding can overshoot by one
+        rank[nonzero] = (bits - top).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def estimate(self):
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            raw = m * np.log(m / zeros)     # linear counting while most registers are empty
+        return int(round(raw))
+
+
+# The k most frequent values of a stream in bounded memory (Space-Saving, one chunk at a time).
+# A value first counted after others were dropped may have been among them, so its count is
+# raised by the largest dropped count: counts are upper bounds, at most "Error" too high.
+class TopK:
+    def __init__(self, k, capacity=None):
+        self.k = k
+        self.capacity = capacity or k * TOPK_CAPACITY
+        self.counts = None
+        self.errors = None
+        self.floor = 0      # largest count dropped so far; 0 while every count is exact
+
+    def add(self, df):
+        if not len(df):
+            return
+        chunk = _value_counts(df)
+        if self.counts is None:
+            counts, errors = chunk, pd.Series(0, index=chunk.index)
+        else:
+            extra = pd.Series(np.where(chunk.index.isin(self.counts.index), 0, self.floor), index=chunk.index)
+            counts = self.counts.add(chunk + extra, fill_value=0)
+            errors = self.errors.add(extra, fill_value=0)
+        if len(counts) > self.capacity:
+            order = np.argsort(-counts.to_numpy(), kind="stable")
+            self.floor = max(self.floor, int(counts.iloc[order[self.capacity]]))
+            counts, errors = counts.iloc[order[:self.capacity]], errors.iloc[order[:self.capacity]]
+        self.counts, self.errors = counts, errors.reindex(counts.index)
+
+    def result(self):
+        if self.counts is None:
+            return pd.DataFrame({"Count": pd.Series(dtype="int64"), "Error": pd.Series(dtype="int64")})
+        order = np.argsort(-self.counts.to_numpy(), kind="stable")[:self.k]
+        out = self.counts.index[order].to_frame(index=False)
+        out["Count"] = self.counts.to_numpy()[order].astype(np.int64)
+        out["Error"] = self.errors.to_numpy()[order].astype(np.int64)
+        return out
+
+
+# chunks of a sheet's columns from the registry; outofcore has a twin reading spilled Parquet
+def iter_sheet_chunks(registry, path, sheet, cols, chunk_rows=DISTINCT_CHUNK_ROWS):
+    df = registry.get(path, sheet, usecols=list(cols))
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def describe_distinct(stats):
+    msg = (f"≈{stats['distinct']:,} distinct (±{stats['error']:.1%}) in {stats['rows']:,} rows "
+           f"across {stats['sheets']} sheet(s)")
+    if not stats["exact_top"]:
+        msg += "; top counts are upper bounds"
+    return msg
+
+
+# ---------- Export ----------
+# Results are written in chunks so memory stays flat however many rows go out.
+EXCEL_MAX_ROWS = 1_048_576      # per sheet, header included
+EXPORT_CHUNK_ROWS = 50_000
+EXPORT_FILETYPES = [
+    ("Excel files", "*.xlsx"),
+    ("CSV files", "*.csv"),
+    ("CSV, gzip", "*.csv.gz"),
+    ("CSV, bzip2", "*.csv.bz2"),
+    ("CSV, xz", "*.csv.xz"),
+    ("CSV, zip", "*.csv.zip"),
+]
+
+
+def _open_csv(path, tmp_path):
+    lower = path.lower()
+    if lower.endswith(".gz"):
+        return gzip.open(tmp_path, "wt", encoding="utf-8", newline="")
+    if lower.endswith(".bz2"):
+        return bz2.open(tmp_path, "wt", encoding="utf-8", newline="")
+    if lower.endswith(".xz"):
+        return lzma.open(tmp_path, "wt", encoding="utf-8", newline="")
+    if lower.endswith(".zip"):
+        archive = zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED)
+        member = os.path.basename(path)[:-len(".zip")]
+        return _ZipMemberWriter(archive, member)
+    return open(tmp_path, "w", encoding="utf-8", newline="")
+
+
+class _ZipMemberWriter(io.TextIOWrapper):
+    def __init__(self, archive, member):
+        self._archive = archive
+        super().__init__(archive.open(member, "w", force_zip64=True), encoding="utf-8", newline="")
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._archive.close()
+
+
+def is_csv_path(path):
+    return ".csv" in os.path.basename(path).lower()
+
+
+def _excel_rows(chunk):
+    chunk = chunk.copy(deep=False)
+    for c in chunk.columns[chunk.dtypes.map(lambda d: isinstance(d, pd.DatetimeTZDtype))]:
+        chunk[c] = chunk[c].dt.tz_localize(None)    # Excel has no time zones
+    values = chunk.astype(object).where(chunk.notna(), None)
+    return values.itertuples(index=False, name=None)
+
+
+# df is a DataFrame or a frame spilled to disk (outofcore.SpilledFrame): anything with
+# columns, len() and slice(start, stop) returning a DataFrame
+def frame_rows(df, start=0, stop=None):
+    if isinstance(df, pd.DataFrame):
+        return df.iloc[start:stop]
+    return df.slice(start, len(df) if stop is None else stop)
+
+
+# progress(fraction, message) may raise (e.g. JobCancelled) to abort; the partial file is removed
+def export_frame(df, path, progress=None, sheet_name="Result", chunk_rows=EXPORT_CHUNK_ROWS):
+    tmp_path = path + ".part"
+    with perf_log.span("export", file=os.path.basename(path), rows=len(df)) as rec:
+        try:
+            if is_csv_path(path):
+                sheets = _export_csv(df, path, tmp_path, progress, chunk_rows)
+            else:
+                sheets = _export_xlsx(df, tmp_path, progress, sheet_name, chunk_rows)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        rec["bytes_written"] = os.path.getsize(path)
+    return sheets
+
+
+def _report(progress, done, total):
+    if progress is not None:
+        progress(done / total if total else 1.0, f"{done:,}/{total:,} rows")
+
+
+def _export_csv(df, path, tmp_path, progress, chunk_rows):
+    total = len(df)
+    with _open_csv(path, tmp_path) as fh:
+        frame_rows(df, 0, 0).to_csv(fh, index=False)
+        for start in range(0, total, chunk_rows):
+            frame_rows(df, start, start + chunk_rows).to_csv(fh, index=False, header=False)
+            _report(progress, min(start + chunk_rows, total), total)
+    return 1
+
+
+def _export_xlsx(df, tmp_path, progress, sheet_name, chunk_rows):
+    import openpyxl
+    # write-only workbooks stream rows to temp files instead of building cells in memory
+    wb = openpyxl.Workbook(write_only=True)
+    header = [str(c) for c in df.columns]
+    per_sheet = EXCEL_MAX_ROWS - 1
+    total = len(df)
+    sheets = max(1, -(-total // per_sheet))
+    written = 0
+    try:
+        for i in range(sheets):
+            ws = wb.create_sheet(sheet_name if i == 0 else f"{sheet_name}_{i + 1}")
+            ws.append(header)
+            stop = min(total, (i + 1) * per_sheet)
+            for start in range(i * per_sheet, stop, chunk_rows):
+                for row in _excel_rows(frame_rows(df, start, min(start + chunk_rows, stop))):
+                    ws.append(row)
+                written = min(start + chunk_rows, stop)
+                _report(progress, written, total)
+    except BaseException:
+        _discard_write_only(wb)
+        raise
+    wb.save(tmp_path)
+    return sheets
+
+
+# save() removes the temp files write-only sheets stream to; without it they stay until exit
+def _discard_write_only(wb):
+    for ws in wb.worksheets:
+        writer = ws._writer
+        if writer is None:
+            continue
+        try:
+            if ws._rows is not None:
+                ws._rows.close()
+            writer.close()
+            writer.cleanup()
+        except (OSError, ValueError, StopIteration):
+            pass
+
+
+# ---------- Preview rendering ----------
+# Slices are turned into display strings one column at a time, never row by row.
+PREVIEW_TEXT_MAX = 200      # longer cell text is cut with an ellipsis
+PREVIEW_HEAD_ROWS = 200     # shown from a row-limited read while a sheet parses
+PREVIEW_FLOAT_FMT = "{:.10g}"
+PREVIEW_PERF_SECONDS = 0.05     # quicker renders (most scrolls) only count in the performance totals
+
+
+def _format_datetimes(s):
+    has_time = bool((s.dropna().dt.normalize() != s.dropna()).any())
+    out = s.dt.strftime("%Y-%m-%d %H:%M:%S" if has_time else "%Y-%m-%d")
+    return out.fillna("").to_numpy(dtype=object)
+
+
+def _format_floats(s):
+    values = s.to_numpy(dtype="float64", na_value=np.nan)
+    mask = np.isnan(values)
+    out = np.full(len(values), "", dtype=object)
+    finite = values[~mask]
+    # Excel integers come in as float64 whenever the column has a blank
+    if finite.size and np.all(np.isfinite(finite)) and np.all(finite == np.round(finite)) \
+            and np.abs(finite).max() < 2 ** 53:
+        out[~mask] = finite.astype(np.int64).astype(str)
+    else:
+        out[~mask] = [PREVIEW_FLOAT_FMT.format(v) for v in finite]
+    return out
+
+
+def _format_text(s):
+    text = s.astype(str).where(s.notna(), "")
+    long_ = text.str.len() > PREVIEW_TEXT_MAX
+    if long_.any():
+        text = text.where(~long_, text.str.slice(0, PREVIEW_TEXT_MAX - 1) + "…")
+    return text.to_numpy(dtype=object)
+
+
+def format_column(s):
+    dtype = s.dtype
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return _format_datetimes(s)
+    if pd.api.types.is_bool_dtype(dtype):
+        return s.astype(object).where(s.notna(), "").astype(str).to_numpy(dtype=object)
+    if pd.api.types.is_float_dtype(dtype):
+        return _format_floats(s)
+    if pd.api.types.is_integer_dtype(dtype):
+        out = s.astype(object).where(s.notna(), "").astype(str)
+        return out.to_numpy(dtype=object)
+    return _format_text(s)
+
+
+# rows [start, stop) of df as tuples of display strings
+def render_rows(df, start=0, stop=None):
+    with perf_log.span("render", min_seconds=PREVIEW_PERF_SECONDS) as rec:
+        part = frame_rows(df, start, stop)
+        rec["rows"] = len(part)
+        if not len(part) or not part.shape[1]:
+            return [()] * len(part)
+        cols = [format_column(part.iloc[:, i]) for i in range(part.shape[1])]
+        return list(zip(*cols))
+
+
+# ---------- Views ----------
+# Sorting, filtering and searching a frame for display. A view is an array of row positions into
+# the frame, never a copy. Each column is indexed once on first use (codes into its sorted
+# distinct values, plus their display text); sorts reuse cached permutations and filters test
+# the distinct values only, then spread the answer over the rows through the codes.
+VIEW_FILTER_OPS = ("<=", ">=", "!=", "<", ">", "=")     # longest first, so "<=" isn't read as "<"
+
+
+class ColumnIndex:
+    def __init__(self, s):
+        codes, uniques = pd.factorize(s, sort=False)
+        uniques = pd.Index(uniques)
+        if isinstance(uniques.dtype, pd.CategoricalDtype):
+            uniques = uniques.astype(object)    # compacted text sorts by value, not category order
+        try:
+            rank = np.asarray(uniques.argsort())
+        except TypeError:
+            # mixed numbers and text: order by the text shown
+            rank = np.asarray(pd.Index(format_column(pd.Series(uniques))).argsort())
+        where = np.empty(len(rank), dtype=np.intp)
+        where[rank] = np.arange(len(rank))
+        self.codes = np.where(codes >= 0, where[np.maximum(codes, 0)], -1)   # -1 for blanks
+        self.uniques = uniques[rank]
+        self._text = None
+        self._orders = {}
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = pd.Series(format_column(pd.Series(self.uniques)), dtype="str").str.lower()
+        return self._text
+
+    # row permutation, blanks last either way; ties keep the frame's order
+    def order(self, ascending=True):
+        if ascending not in self._orders:
+            n = len(self.uniques)
+            key = self.codes if ascending else n - 1 - self.codes
+            self._orders[ascending] = np.argsort(np.where(self.codes < 0, n, key), kind="stable")
+        return self._orders[ascending]
+
+    # "abc" contains (ignoring case); "=abc", "!=abc", ">10", "<=2024-01-31" compare; "=" alone is blank
+    def match(self, text):
+        op = next((o for o in VIEW_FILTER_OPS if text.startswith(o)), None)
+        value = text[len(op):].strip() if op else text.strip()
+        if op is None:
+            hit = self.text.str.contains(value.lower(), regex=False).to_numpy(dtype=bool)
+        elif not value:
+            return self.codes < 0 if op == "=" else self.codes >= 0
+        else:
+            hit = self._compare(op, value)
+        return np.append(hit, False)[self.codes]    # code -1 (blank) lands on the False
+
+    def _compare(self, op, value):
+        values = self.uniques
+        number = pd.to_numeric(value, errors="coerce")
+        if pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+            target = number
+        elif pd.api.types.is_datetime64_any_dtype(values.dtype):
+            target = pd.to_datetime(value, errors="coerce")
+        elif op not in ("=", "!=") and pd.notna(number):
+            # ">10" on a text column: compare the cells that hold numbers, skip the rest
+            values, target = pd.to_numeric(pd.Series(values.astype(object)), errors="coerce"), number
+        else:
+            values, target = self.text, value.lower()
+        if pd.isna(target):
+            return np.zeros(len(values), dtype=bool)
+        values = pd.Series(np.asarray(values))
+        compare = {"<": values.lt, "<=": values.le, ">": values.gt, ">=": values.ge,
+                   "=": values.eq, "!=": values.ne}[op]
+        return compare(target).to_numpy(dtype=bool)
+
+
+class FrameView:
+    def __init__(self, df):
+        self.df = df
+        self.sort = None        # (column position, ascending)
+        self.filters = {}       # {column position: filter text}
+        self.search = ""        # text to find in any column
+        self.positions = None   # rows shown, as positions into df; None while nothing is sorted or filtered
+        self._indexes = {}
+
+    @property
+    def columns(self):
+        return self.df.columns
+
+    def __len__(self):
+        return len(self.df) if self.positions is None else len(self.positions)
+
+    def index(self, column):
+        if column not in self._indexes:
+            self._indexes[column] = ColumnIndex(self.df.iloc[:, column])
+        return self._indexes[column]
+
+    def set_sort(self, column, ascending=True):
+        self.sort = None if column is None else (column, ascending)
+        self._update()
+
+    def set_filter(self, column, text):
+        if text and text.strip():
+            self.filters[column] = text
+        else:
+            self.filters.pop(column, None)
+        self._update()
+
+    def set_search(self, text):
+        self.search = text.strip()
+        self._update()
+
+    def clear(self):
+        self.sort, self.filters, self.search = None, {}, ""
+        self.positions = None
+
+    def _update(self):
+        with perf_log.span("view", min_seconds=PREVIEW_PERF_SECONDS, rows=len(self.df)):
+            self._select()
+
+    def _select(self):
+        mask = None
+        for column, text in self.filters.items():
+            hit = self.index(column).match(text)
+            mask = hit if mask is None else mask & hit
+        if self.search:
+            found = np.zeros(len(self.df), dtype=bool)
+            for column in range(self.df.shape[1]):
+                found |= self.index(column).match(self.search.lstrip("=<>!"))
+            mask = found if mask is None else mask & found
+        order = None if self.sort is None else self.index(self.sort[0]).order(self.sort[1])
+        if order is None:
+            self.positions = None if mask is None else np.flatnonzero(mask)
+        else:
+            self.positions = order if mask is None else order[mask[order]]
+
+    # rows [start, stop) of the view as a DataFrame, like engine.frame_rows
+    def slice(self, start, stop):
+        if self.positions is None:
+            return self.df.iloc[start:stop]
+        return self.df.iloc[self.positions[start:stop]]
+
+    def describe(self):
+        if self.positions is None or len(self.positions) == len(self.df):
+            return f"{len(self.df):,} rows"
+        return f"{len(self.positions):,} of {len(self.df):,} rows"
+
+
+# ---------- Operations ----------
+# One function per menu action, shared by the dialogs and the command line.
+# progress(fraction) is optional; Job.report fits, so a cancelled job stops between steps.
+def _step(progress, fraction):
+    if progress is not None:
+        progress(fraction)
+
+
+# progress of a part of an operation, mapped onto [start, stop] of the whole
+def _scaled(progress, start, stop):
+    if progress is None:
+        return None
+    return lambda fraction: progress(start + (stop - start) * fraction)
+
+
+def sheet_label(path, sheet):
+    return f"{os.path.basename(path)}::{sheet}"
+
+
+# returns (result, stats) as vlookup_frame / approx_vlookup_frame / fuzzy_vlookup_frame do;
+# threshold is the lowest score a fuzzy match may have
+@instrumented("vlookup")
+def run_vlookup(registry, fp_main, sh_main, keys_main, fp_lookup, sh_lookup, keys_lookup, fetch_cols=None,
+                mode="exact", policy="first", normalize=(), key_indexes=None, progress=None,
+                threshold=FUZZY_THRESHOLD):
+    df_main = registry.get(fp_main, sh_main)
+    _step(progress, 0.3)
+    cols = list(fetch_cols or [c for c in registry.columns(fp_lookup, sh_lookup) if c not in keys_lookup])
+    if mode == "fuzzy":
+        df_lookup = registry.get(fp_lookup, sh_lookup, usecols=list(dict.fromkeys([*keys_lookup, *cols])))
+        _step(progress, 0.4)
+        return fuzzy_vlookup_frame(df_main, keys_main, df_lookup, keys_lookup, cols, threshold, normalize, policy,
+                                   progress=_scaled(progress, 0.4, 0.95))
+    if mode != "exact":
+        df_lookup = registry.get(fp_lookup, sh_lookup, usecols=list(keys_lookup) + cols)
+        _step(progress, 0.6)
+        return approx_vlookup_frame(df_main, keys_main, df_lookup, keys_lookup, cols, mode, normalize, policy)
+    key_indexes = key_indexes if key_indexes is not None else KeyIndexCache()
+    index = key_indexes.get(registry, fp_lookup, sh_lookup, keys_lookup, normalize, policy)
+    _step(progress, 0.5)
+    # only the fetched columns are read from the lookup sheet
+    df_lookup = registry.get(fp_lookup, sh_lookup, usecols=cols)
+    _step(progress, 0.7)
+    return vlookup_frame(df_main, keys_main, df_lookup, cols, index, normalize)
+
+
+# returns (result, counts); whole_rows gives full rows of each side instead of key values;
+# mode="fuzzy" pairs keys scoring at least threshold (see fuzzy_compare_sets)
+@instrumented("compare")
+def run_compare(registry, fp_a, sh_a, cols_a, fp_b, sh_b, cols_b, normalize=(),
+                include_both=False, whole_rows=False, progress=None, mode="exact", threshold=FUZZY_THRESHOLD):
+    # whole-row output needs every column; key output only the key columns
+    df_a = registry.get(fp_a, sh_a, usecols=None if whole_rows else list(cols_a))
+    _step(progress, 0.3)
+    df_b = registry.get(fp_b, sh_b, usecols=None if whole_rows else list(cols_b))
+    _step(progress, 0.6)
+    if mode == "fuzzy":
+        result = fuzzy_compare_sets(df_a, cols_a, df_b, cols_b, threshold, normalize,
+                                    progress=_scaled(progress, 0.6, 0.95))
+    else:
+        result = compare_sets(df_a, cols_a, df_b, cols_b, normalize)
+    label_a, label_b = sheet_label(fp_a, sh_a), sheet_label(fp_b, sh_b)
+    if whole_rows:
+        return result.to_rows(df_a, df_b, label_a, label_b), result.counts()
+    return result.to_frame(label_a, label_b, include_both), result.counts()
+
+
+# returns (report, stats); layout "cells" lists changed cells, "rows" whole rows (see RowDiff)
+@instrumented("diff")
+def run_diff(registry, fp_a, sh_a, keys_a, fp_b, sh_b, keys_b=None, cols=None, normalize=(),
+             layout="cells", progress=None):
+    if layout not in DIFF_LAYOUTS:
+        raise ValueError(f"Unknown diff layout: {layout}")
+    keys_b = list(keys_b or keys_a)
+    # the cell report only needs the keys and the compared columns
+    narrow = layout == "cells" and cols is not None
+    df_a = registry.get(fp_a, sh_a, usecols=list(dict.fromkeys([*keys_a, *cols])) if narrow else None)
+    _step(progress, 0.3)
+    df_b = registry.get(fp_b, sh_b, usecols=list(dict.fromkeys([*keys_b, *cols])) if narrow else None)
+    _step(progress, 0.6)
+    diff = diff_frames(df_a, keys_a, df_b, keys_b, cols, normalize)
+    _step(progress, 0.8)
+    report = diff.to_cells(df_a, df_b) if layout == "cells" else diff.to_rows(df_a, df_b)
+    return report, diff.counts()
+
+
+# col: one column (result column Unique_<col>) or a list for distinct combinations;
+# counts adds a Count column, sort="frequency" puts the most frequent first
+@instrumented("unique")
+def run_unique(registry, fp, sh, col, progress=None, counts=False, sort="appearance"):
+    cols = _as_columns(col)
+    df = registry.get(fp, sh, usecols=cols)
+    _step(progress, 0.5)
+    out = distinct_frame(df, cols, counts, sort)
+    return out.rename(columns={col: f"Unique_{col}"}) if isinstance(col, str) else out
+
+
+# approximate distinct count and top-k of cols over several sheets (path, sheet), streamed chunk
+# by chunk; chunks defaults to iter_sheet_chunks. Returns (top-k frame, stats).
+@instrumented("distinct stats")
+def run_distinct_stats(registry, sources, cols, top_k=20, chunks=None, progress=None):
+    cols = _as_columns(cols)
+    chunks = chunks or iter_sheet_chunks
+    hll, top = HyperLogLog(), TopK(top_k)
+    rows = 0
+    for i, (path, sheet) in enumerate(sources):
+        for chunk in chunks(registry, path, sheet, cols, DISTINCT_CHUNK_ROWS):
+            chunk = _non_blank(chunk.set_axis(cols, axis=1))
+            hll.add(chunk)
+            top.add(chunk)
+            rows += len(chunk)
+            _step(progress, i / len(sources))
+    stats = {"rows": rows, "distinct": hll.estimate(), "error": hll.relative_error,
+             "sheets": len(sources), "exact_top": top.floor == 0}
+    return top.result(), stats
+
+
+# sources [(path, sheet)] appended into one frame with a source column; returns (frame, report).
+# The sheets are read side by side on a thread pool; the parses themselves run in worker
+# processes only when registry.parse_executor is set.
+@instrumented("stack")
+def run_stack(registry, sources, source_col=STACK_SOURCE_COLUMN, progress=None, workers=PARSE_PROCESSES):
+    sources = [tuple(src) for src in sources]
+    # a workbook giving several sheets is named with the sheet
+    several = len({path for path, _sheet in sources}) < len(sources)
+    labels = [sheet_label(path, sheet) if several else os.path.basename(path) for path, sheet in sources]
+    pool = ThreadPoolExecutor(max(1, min(workers, len(sources))))
+    try:
+        futures = [pool.submit(registry.get, path, sheet) for path, sheet in sources]
+        frames = []
+        for i, future in enumerate(futures):
+            frames.append(future.result())
+            _step(progress, 0.8 * (i + 1) / len(futures))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    out, report = stack_frames(frames, labels, source_col)
+    if registry.compact and report["retyped"]:
+        # object columns from mixed types shrink like a freshly parsed sheet
+        out = compact_frame(out)[0]
+    return out, report
+
+
+# the sheet with res_name added; spec is passed on to concat_columns
+@instrumented("concat")
+def run_concat(registry, fp, sh, cols, res_name="Concatenated", progress=None, **spec):
+    df = registry.get(fp, sh)
+    _step(progress, 0.3)
+    # shallow: the new frame shares the sheet's columns and only owns the added one
+    out = df.copy(deep=False)
+    out[res_name] = concat_columns(df, cols, **spec)
+    return out
+
+
+# ---------- History ----------
+# Undo/redo of sheet edits and result changes. A sheet edit keeps only the columns it added,
+# replaced or removed (everything else is shared with the live sheet), so deep histories on
+# large sheets cost little more than the columns the user created.
+class SheetChange:
+    # tag: the caller's own note about the edit, handed back untouched
+    def __init__(self, registry, path, sheet, before, after, label="", tag=None):
+        self.registry = registry
+        self.path = path
+        self.sheet = sheet
+        self.label = label
+        self.tag = tag
+        self.order_before = list(before.columns)
+        self.order_after = list(after.columns)
+        if before.columns.is_unique and after.columns.is_unique:
+            changed = [c for c in self.order_after if c not in before.columns
+                       or column_buffers(before[c], deep=False) != column_buffers(after[c], deep=False)]
+            self.before = {c: before[c] for c in self.order_before if c not in after.columns or c in changed}
+            self.after = {c: after[c] for c in changed}
+        else:
+            # duplicate column names can't be addressed one by one; keep both frames (still shared)
+            self.before, self.after = before, after
+        kept = (list(self.before.values()) + list(self.after.values()) if isinstance(self.before, dict)
+                else [self.before.iloc[:, i] for i in range(self.before.shape[1])])
+        self.buffers = [buf for col in kept for buf in column_buffers(col)]
+
+    def _build(self, stored, order):
+        if isinstance(stored, pd.DataFrame):
+            return stored
+        df = self.registry.get(self.path, self.sheet).copy(deep=False)
+        for name, col in stored.items():
+            df[name] = col
+        return df[order]
+
+    def undo(self):
+        df = self._build(self.before, self.order_before)
+        self.registry.set(self.path, self.sheet, df)
+        return df
+
+    def redo(self):
+        df = self._build(self.after, self.order_after)
+        self.registry.set(self.path, self.sheet, df)
+        return df
+
+
+# Anything else the caller can put back: apply(state) restores before on undo and after on redo.
+# frames: DataFrames the states hold, so the history can count their memory.
+class StateChange:
+    def __init__(self, before, after, apply, label="", frames=()):
+        self.before = before
+        self.after = after
+        self.apply = apply
+        self.label = label
+        self.buffers = [buf for df in frames if isinstance(df, pd.DataFrame)
+                        for i in range(df.shape[1]) for buf in column_buffers(df.iloc[:, i])]
+
+    def undo(self):
+        return self.apply(self.before)
+
+    def redo(self):
+        return self.apply(self.after)
+
+
+class History:
+    def __init__(self, depth=HISTORY_DEPTH, budget_bytes=HISTORY_MB * 1024 * 1024):
+        self.depth = depth
+        self.budget = budget_bytes
+        self._undo = []
+        self._redo = []
+        self.used = 0
+
+    # columns shared between steps (one step's new column is the next one's old) count once
+    def _measure(self):
+        buffers = {address: nbytes for change in self._undo + self._redo for address, nbytes in change.buffers}
+        self.used = sum(buffers.values())
+
+    def push(self, change):
+        self._redo.clear()
+        self._undo.append(change)
+        self._measure()
+        # oldest steps go first; the newest one is kept whatever it costs
+        while len(self._undo) > 1 and (len(self._undo) > self.depth or self.used > self.budget):
+            self._undo.pop(0)
+            self._measure()
+
+    def undo(self):
+        if not self._undo:
+            return None
+        change = self._undo.pop()
+        self._redo.append(change)
+        return change, change.undo()
+
+    def redo(self):
+        if not self._redo:
+            return None
+        change = self._redo.pop()
+        self._undo.append(change)
+        return change, change.redo()
+
+    def next_undo(self):
+        return self._undo[-1].label if self._undo else None
+
+    def next_redo(self):
+        return self._redo[-1].label if self._redo else None
+
+    # drops the steps pred picks, e.g. those on a workbook that was closed or reloaded
+    def forget(self, pred):
+        for stack in (self._undo, self._redo):
+            stack[:] = [c for c in stack if not pred(c)]
+        self._measure()
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self.used = 0
+
+    def describe(self):
+        return f"{len(self._undo)} undo / {len(self._redo)} redo step(s), {self.used / 1024 ** 2:,.0f} MB"
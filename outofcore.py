@@ -0,0 +1,563 @@
+# Out-of-core backend for workbooks larger than RAM (needs duckdb).
+#
+# Sheets are spilled to Parquet once, streamed row by row from .xlsx/.xlsm files (or written
+# from the frame when the sheet is already in memory), and VLOOKUP, compare, unique and concat
+# run as DuckDB queries over those files. DuckDB works within ABG_QUERY_MEMORY_MB and spills
+# joins and sorts to disk beyond it. Results are written to Parquet as SpilledFrame; only the
+# rows a preview shows and the chunks an export writes are ever read back into memory.
+import hashlib
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+
+import pandas as pd
+
+from engine import (
+    CACHE_DIR, DUPLICATE_POLICIES, FUZZY_THRESHOLD, UNIQUE_SORTS, DuplicateKeyError, _as_columns, _has_module,
+    _step, concat_columns, file_fingerprint, instrumented, perf_log, sheet_label,
+)
+
+OUT_OF_CORE = os.environ.get("ABG_OUT_OF_CORE", "0") == "1"
+SPILL_DIR = os.environ.get("ABG_SPILL_DIR", os.path.join(os.path.dirname(CACHE_DIR), "spill"))
+QUERY_MEMORY_MB = int(os.environ.get("ABG_QUERY_MEMORY_MB", "2048"))
+SPILL_CHUNK_ROWS = 100_000      # rows per spilled Parquet part and per streamed batch
+ROW_GROUP_ROWS = 65_536         # the unit a preview or export slice reads
+ROW = "__row"                   # source row number, kept in spilled sheets to restore sheet order
+
+_NUMERIC = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT",
+            "UINTEGER", "UBIGINT", "UHUGEINT", "FLOAT", "DOUBLE", "DECIMAL")
+
+
+def available():
+    return _has_module("duckdb") and _has_module("pyarrow")
+
+
+def _q(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _lit(text):
+    return "'" + str(text).replace("'", "''") + "'"
+
+
+def _kind(dtype):
+    name = str(dtype).split("(")[0]
+    if name in _NUMERIC:
+        return "number"
+    if name.startswith(("TIMESTAMP", "DATE")):
+        return "date"
+    if name == "BOOLEAN":
+        return "bool"
+    return "text"
+
+
+# text the way pandas' astype(str) writes it, so results match the in-memory operations
+def _text(x, dtype):
+    if _kind(dtype) == "bool":
+        return f"CASE WHEN {x} THEN 'True' WHEN NOT {x} THEN 'False' END"
+    return f"CAST({x} AS VARCHAR)"
+
+
+# SQL twin of engine.normalize_keys; casefold becomes lower(), which differs only for a few letters like ß
+def _key(x, dtype, normalize=(), as_text=False):
+    if "numeric_text" in normalize:
+        d = f"TRY_CAST({x} AS DOUBLE)"
+        x = (f"CASE WHEN {d} IS NULL THEN {_text(x, dtype)} "
+             f"WHEN {d} = round({d}) AND abs({d}) < 9007199254740992 THEN CAST(CAST({d} AS BIGINT) AS VARCHAR) "
+             f"ELSE CAST({d} AS VARCHAR) END")
+    elif normalize or as_text:
+        x = _text(x, dtype)
+    if "trim" in normalize:
+        x = f"regexp_replace({x}, '^\\s+|\\s+$', '', 'g')"
+    if "casefold" in normalize:
+        x = f"lower({x})"
+    return x
+
+
+def _arrow_reader(relation, rows):
+    if hasattr(relation, "to_arrow_reader"):
+        return relation.to_arrow_reader(rows)
+    return relation.fetch_record_batch(rows)    # duckdb < 1.4
+
+
+# one chunk of a sheet as an Arrow table; columns Arrow can't type (mixed numbers and text) become text
+def _arrow_chunk(df):
+    import pyarrow as pa
+    arrays = []
+    for i in range(df.shape[1]):
+        s = df.iloc[:, i]
+        if s.dtype == object:
+            s = s.infer_objects()
+        try:
+            arrays.append(pa.array(s, from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            arrays.append(pa.array(s.astype(object).where(s.notna(), None).map(
+                lambda v: v if v is None else str(v)), type=pa.string()))
+    return pa.Table.from_arrays(arrays, names=[str(c) for c in df.columns])
+
+
+# A result (or a spilled sheet) on disk: Parquet files read one row group at a time.
+class SpilledFrame:
+    def __init__(self, files, columns=None):
+        import pyarrow.parquet as pq
+        self.files = list(files)
+        self._groups = []   # [(file, row group, first row, rows)]
+        start = 0
+        names = []
+        for path in self.files:
+            meta = pq.read_metadata(path)
+            for name in meta.schema.names:
+                if name not in names:
+                    names.append(name)
+            for i in range(meta.num_row_groups):
+                rows = meta.row_group(i).num_rows
+                self._groups.append((path, i, start, rows))
+                start += rows
+        self._rows = start
+        self.columns = pd.Index(columns if columns is not None else [c for c in names if c != ROW])
+
+    def __len__(self):
+        return self._rows
+
+    @property
+    def shape(self):
+        return self._rows, len(self.columns)
+
+    @property
+    def empty(self):
+        return not self._rows or not len(self.columns)
+
+    def slice(self, start, stop):
+        import pyarrow.parquet as pq
+        start, stop = max(0, start), min(self._rows, stop)
+        parts = []
+        for path, i, first, rows in self._groups:
+            if first + rows <= start or first >= stop:
+                continue
+            with pq.ParquetFile(path) as pf:
+                have = set(pf.schema_arrow.names)
+                table = pf.read_row_group(i, columns=[c for c in self.columns if c in have])
+            part = table.to_pandas(split_blocks=True).iloc[max(0, start - first):stop - first]
+            parts.append(part.reindex(columns=self.columns))
+        if not parts:
+            return pd.DataFrame(columns=self.columns)
+        return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0].reset_index(drop=True)
+
+    def head(self, n=5):
+        return self.slice(0, n)
+
+    # the whole frame in memory, e.g. to apply a result to a sheet
+    def to_pandas(self):
+        return self.slice(0, self._rows)
+
+
+class _Source:
+    def __init__(self, files, types):
+        self.files = files
+        self.types = types      # {column: duckdb type}, ROW included
+        self.columns = [c for c in types if c != ROW]
+        self.scan = f"read_parquet([{', '.join(_lit(f) for f in files)}], union_by_name=true)"
+
+    def type(self, column):
+        if column not in self.types:
+            raise KeyError(f"No column {column!r}")
+        return self.types[column]
+
+
+class OutOfCoreEngine:
+    def __init__(self, directory=SPILL_DIR, memory_mb=QUERY_MEMORY_MB):
+        import duckdb
+        self.dir = directory
+        os.makedirs(os.path.join(directory, "sheets"), exist_ok=True)
+        self.session = tempfile.mkdtemp(prefix="session-", dir=directory)   # results and edited sheets
+        self._db = duckdb.connect(config={
+            "memory_limit": f"{memory_mb}MB",
+            "temp_directory": os.path.join(self.session, "tmp"),
+            "preserve_insertion_order": True,   # spilled parts are read back in sheet order
+        })
+        self._sources = {}          # {spill directory: _Source}
+        self._spilling = {}         # {spill directory: Lock held while it is written}
+        self._fingerprints = {}     # {path: ((size, mtime), fingerprint)}
+        self._names = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._db.close()
+        shutil.rmtree(self.session, ignore_errors=True)
+
+    # spilled sheets of past sessions; results of this one stay until close()
+    def clear(self):
+        with self._lock:
+            spilling = list(self._spilling.values())
+        for lock in spilling:       # let spills in flight finish first
+            with lock:
+                pass
+        with self._lock:
+            self._sources.clear()
+            shutil.rmtree(os.path.join(self.dir, "sheets"), ignore_errors=True)
+            os.makedirs(os.path.join(self.dir, "sheets"), exist_ok=True)
+
+    def _cursor(self):
+        return self._db.cursor()
+
+    def _result_path(self):
+        return os.path.join(self.session, f"result-{next(self._names)}.parquet")
+
+    def _copy(self, con, query, path):
+        con.execute(f"COPY ({query}) TO {_lit(path)} (FORMAT parquet, ROW_GROUP_SIZE {ROW_GROUP_ROWS})")
+        return SpilledFrame([path])
+
+    # ---------- Spilling ----------
+    def _fingerprint(self, path):
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        known = self._fingerprints.get(path)
+        if known is None or known[0] != stamp:
+            known = (stamp, file_fingerprint(path))
+            self._fingerprints[path] = known
+        return known[1]
+
+    # edited sheets and pipeline outputs live in the session; unchanged workbook sheets are
+    # kept across sessions under the workbook's fingerprint
+    def _spill_dir(self, registry, path, sheet):
+        tag = hashlib.blake2b(str(sheet).encode(), digest_size=8).hexdigest()
+        if registry.version(path, sheet)[1] or not os.path.isfile(path):
+            stamp = hashlib.blake2b(repr((path, registry.version(path, sheet))).encode(), digest_size=8).hexdigest()
+            return os.path.join(self.session, f"sheet-{stamp}-{tag}")
+        return os.path.join(self.dir, "sheets", f"{self._fingerprint(path)}-{tag}")
+
+    # one sheet spills at a time per target directory; other sheets spill and query meanwhile
+    def source(self, registry, path, sheet, progress=None):
+        target = self._spill_dir(registry, path, sheet)
+        with self._lock:
+            src = self._sources.get(target)
+            if src is not None:
+                return src
+            spilling = self._spilling.setdefault(target, threading.Lock())
+        with spilling:
+            with self._lock:
+                src = self._sources.get(target)
+            if src is not None:
+                return src      # spilled by the caller we waited for
+            if not os.path.isdir(target):
+                tmp = f"{target}.{threading.get_ident()}.part"
+                shutil.rmtree(tmp, ignore_errors=True)
+                os.makedirs(tmp)
+                try:
+                    self._spill(registry, path, sheet, tmp, progress)
+                    os.replace(tmp, target)
+                except BaseException:
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    raise
+            files = sorted(os.path.join(target, f) for f in os.listdir(target) if f.endswith(".parquet"))
+            con = self._cursor()
+            try:
+                rel = con.sql(f"SELECT * FROM read_parquet([{', '.join(_lit(f) for f in files)}], "
+                              f"union_by_name=true) LIMIT 0")
+                src = _Source(files, dict(zip(rel.columns, rel.types)))
+            finally:
+                con.close()
+            with self._lock:
+                self._sources[target] = src
+                self._spilling.pop(target, None)
+        return src
+
+    # a sheet as a SpilledFrame, for the preview and for export
+    def sheet(self, registry, path, sheet, progress=None):
+        return SpilledFrame(self.source(registry, path, sheet, progress).files)
+
+    def _spill(self, registry, path, sheet, folder, progress):
+        with perf_log.span("spill", sheet=sheet_label(path, sheet)) as rec:
+            names = [str(c) for c in registry.columns(path, sheet)] if os.path.isfile(path) else []
+            streamable = (path.lower().endswith((".xlsx", ".xlsm")) and names and len(set(names)) == len(names)
+                          and not registry.is_loaded(path, sheet))
+            rec["source"] = "workbook" if streamable else "frame"
+            chunks = (self._stream_xlsx(path, sheet, names) if streamable
+                      else self._frame_chunks(registry.get(path, sheet)))
+            import pyarrow.parquet as pq
+            written = 0
+            for n, df in enumerate(chunks):
+                df[ROW] = range(written, written + len(df))
+                pq.write_table(_arrow_chunk(df), os.path.join(folder, f"part-{n:06d}.parquet"),
+                               row_group_size=ROW_GROUP_ROWS, compression="zstd")
+                written += len(df)
+                if progress is not None:
+                    progress(None, f"Spilling {sheet_label(path, sheet)}: {written:,} rows")
+            if not written:
+                empty = pd.DataFrame({c: pd.Series(dtype=object) for c in names})
+                empty[ROW] = pd.Series(dtype="int64")
+                pq.write_table(_arrow_chunk(empty), os.path.join(folder, "part-000000.parquet"))
+            rec["rows"] = written
+            rec["bytes_written"] = sum(e.stat().st_size for e in os.scandir(folder) if e.is_file())
+
+    @staticmethod
+    def _frame_chunks(df):
+        names = [str(c) for c in df.columns]
+        seen = {}
+        for i, name in enumerate(names):    # Parquet needs distinct names (1 and "1" aren't)
+            if name in seen:
+                names[i] = f"{name}.{i}"
+            seen[name] = i
+        for start in range(0, len(df), SPILL_CHUNK_ROWS):
+            yield df.iloc[start:start + SPILL_CHUNK_ROWS].set_axis(names, axis=1).reset_index(drop=True)
+
+    # rows under the header, SPILL_CHUNK_ROWS at a time, as pandas' openpyxl reader would give them
+    @staticmethod
+    def _stream_xlsx(path, sheet, names):
+        import openpyxl
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            width = len(names)
+            rows, blank = [], 0
+            for row in wb[sheet].iter_rows(min_row=2, values_only=True):
+                row = tuple(row[:width]) + (None,) * (width - len(row))
+                if all(v is None for v in row):
+                    blank += 1      # blank rows count only when data follows them
+                    continue
+                rows.extend([(None,) * width] * blank)
+                blank = 0
+                rows.append(row)
+                if len(rows) >= SPILL_CHUNK_ROWS:
+                    yield pd.DataFrame.from_records(rows, columns=names)
+                    rows = []
+            if rows:
+                yield pd.DataFrame.from_records(rows, columns=names)
+        finally:
+            wb.close()
+
+    # ---------- Operations ----------
+    # Same arguments and results as engine.run_*, but results are SpilledFrames.
+    def _key_pairs(self, main, keys_main, other, keys_other, normalize):
+        pairs = []
+        for a, b in zip(keys_main, keys_other):
+            ta, tb = main.type(str(a)), other.type(str(b))
+            as_text = _kind(ta) != _kind(tb)    # 1 and "1" can't be compared otherwise
+            pairs.append((_key(f"m.{_q(a)}", ta, normalize, as_text), _key(f"d.{_q(b)}", tb, normalize, as_text)))
+        return pairs
+
+    def _range_key(self, con, src, alias, column):
+        x, dtype = f"{alias}.{_q(column)}", src.type(str(column))
+        if _kind(dtype) in ("number", "date"):
+            return _kind(dtype), (f"epoch_us(CAST({x} AS TIMESTAMP))" if _kind(dtype) == "date" else x)
+        for kind, expr in (("number", f"TRY_CAST({x} AS DOUBLE)"),
+                           ("date", f"epoch_us(TRY_CAST({x} AS TIMESTAMP))")):
+            bad = con.sql(f"SELECT count(*) FROM {src.scan} {alias} "
+                          f"WHERE {x} IS NOT NULL AND {expr} IS NULL").fetchone()[0]
+            if not bad:
+                return kind, expr
+        raise ValueError(f"Approximate match needs a numeric or date key; '{column}' is neither.")
+
+    @instrumented("vlookup", engine="duckdb")
+    def run_vlookup(self, registry, fp_main, sh_main, keys_main, fp_lookup, sh_lookup, keys_lookup,
+                    fetch_cols=None, mode="exact", policy="first", normalize=(), key_indexes=None, progress=None,
+                    threshold=FUZZY_THRESHOLD):
+        if mode == "fuzzy":
+            raise ValueError("Fuzzy match runs in memory; use engine.run_vlookup.")
+        if policy not in DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown duplicate policy: {policy}")
+        if mode != "exact" and policy not in ("first", "last", "error"):
+            raise ValueError("Approximate match supports the first, last and error duplicate policies.")
+        main = self.source(registry, fp_main, sh_main, progress)
+        _step(progress, 0.2)
+        lookup = self.source(registry, fp_lookup, sh_lookup, progress)
+        _step(progress, 0.4)
+        cols = [str(c) for c in (fetch_cols or [c for c in lookup.columns if c not in map(str, keys_lookup)])]
+        con = self._cursor()
+        try:
+            pairs = self._key_pairs(main, keys_main, lookup, keys_lookup, normalize)
+            if mode != "exact":
+                pairs = pairs[:-1]
+                kind_m, range_m = self._range_key(con, main, "m", keys_main[-1])
+                kind_l, range_l = self._range_key(con, lookup, "d", keys_lookup[-1])
+                if kind_m != kind_l:
+                    raise ValueError("Approximate match needs number keys on both sides or dates on both sides.")
+                pairs.append((range_m, range_l))
+            k = [f"__k{i}" for i in range(len(pairs))]
+            f = [f"__f{i}" for i in range(len(cols))]
+            con.execute(
+                f"CREATE TEMP TABLE lk AS SELECT {', '.join(f'{b} AS {n}' for (_a, b), n in zip(pairs, k))}, "
+                f"{''.join(f'd.{_q(c)} AS {n}, ' for c, n in zip(cols, f))}d.{ROW} AS {ROW} "
+                f"FROM {lookup.scan} d WHERE {' AND '.join(f'{n} IS NOT NULL' for n in k)}")
+            valid = con.sql("SELECT count(*) FROM lk").fetchone()[0]
+            distinct = con.sql(f"SELECT count(*) FROM (SELECT DISTINCT {', '.join(k)} FROM lk)").fetchone()[0]
+            duplicates = valid - distinct
+            if policy == "error" and duplicates:
+                sample = con.sql(f"SELECT {', '.join(k)} FROM lk GROUP BY ALL HAVING count(*) > 1 LIMIT 5").fetchall()
+                sample = ", ".join(str(r[0] if len(r) == 1 else r) for r in sample)
+                raise DuplicateKeyError(f"{duplicates} duplicate lookup key(s), e.g. {sample}")
+            if policy == "aggregate":
+                # numbers summed, other values joined as distinct text in order of appearance
+                texts = [c for c in cols if _kind(lookup.type(c)) != "number"]
+                parts = [f"sum({n}) AS {n}" if c not in texts else
+                         f"list({_text(n, lookup.type(c))} ORDER BY {ROW}) FILTER (WHERE {n} IS NOT NULL) AS {n}"
+                         for c, n in zip(cols, f)]
+                final = [n if c not in texts else
+                         f"coalesce(array_to_string(list_filter({n}, (x, i) -> list_position({n}, x) = i), ', '), '') "
+                         f"AS {n}" for c, n in zip(cols, f)]
+                con.execute(f"CREATE TEMP TABLE lk1 AS SELECT {', '.join(k + final)} "
+                            f"FROM (SELECT {', '.join(k + parts)} FROM lk GROUP BY ALL)")
+            else:
+                order = "DESC" if policy == "last" else "ASC"
+                con.execute(f"CREATE TEMP TABLE lk1 AS SELECT * FROM lk "
+                            f"QUALIFY row_number() OVER (PARTITION BY {', '.join(k)} ORDER BY {ROW} {order}) = 1")
+            _step(progress, 0.6)
+
+            names = [f"{c}_lk" if c in main.columns else c for c in cols]
+            if mode == "exact":
+                on = " AND ".join(f"{a} = d.{n}" for (a, _b), n in zip(pairs, k))
+                joins = f"LEFT JOIN lk1 d ON {on}"
+                fetched = [f"d.{n} AS {_q(name)}" for n, name in zip(f, names)]
+                hit = f"d.{k[0]} IS NOT NULL"
+            else:
+                exact = "".join(f"{a} = {{t}}.{n} AND " for (a, _b), n in zip(pairs[:-1], k))
+                range_m = pairs[-1][0]
+                joins = f"ASOF LEFT JOIN lk1 d ON {exact.format(t='d')}{range_m} >= d.{k[-1]}"
+                fetched = [f"d.{n} AS {_q(name)}" for n, name in zip(f, names)]
+                hit = f"d.{k[-1]} IS NOT NULL"
+                if mode == "nearest":
+                    # the closer of the last key at or below and the first at or above; ties go below
+                    joins += f" ASOF LEFT JOIN lk1 u ON {exact.format(t='u')}{range_m} <= u.{k[-1]}"
+                    below = (f"u.{k[-1]} IS NULL OR (d.{k[-1]} IS NOT NULL "
+                             f"AND {range_m} - d.{k[-1]} <= u.{k[-1]} - {range_m})")
+                    fetched = [f"CASE WHEN {below} THEN d.{n} ELSE u.{n} END AS {_q(name)}"
+                               for n, name in zip(f, names)]
+                    hit = f"(d.{k[-1]} IS NOT NULL OR u.{k[-1]} IS NOT NULL)"
+            out = self._copy(con, f"SELECT m.* EXCLUDE ({ROW}){''.join(', ' + x for x in fetched)} "
+                                  f"FROM {main.scan} m {joins} ORDER BY m.{ROW}", self._result_path())
+            _step(progress, 0.9)
+            matched = con.sql(f"SELECT count(*) FROM {main.scan} m {joins} WHERE {hit}").fetchone()[0]
+        finally:
+            con.close()
+        return out, {"rows": len(out), "matched": int(matched), "duplicates": int(duplicates), "policy": policy}
+
+    @instrumented("compare", engine="duckdb")
+    def run_compare(self, registry, fp_a, sh_a, cols_a, fp_b, sh_b, cols_b, normalize=(),
+                    include_both=False, whole_rows=False, progress=None, mode="exact", threshold=FUZZY_THRESHOLD):
+        if mode == "fuzzy":
+            raise ValueError("Fuzzy match runs in memory; use engine.run_compare.")
+        if len(cols_a) != len(cols_b):
+            raise ValueError("Both sides need the same number of key columns.")
+        a = self.source(registry, fp_a, sh_a, progress)
+        _step(progress, 0.2)
+        b = self.source(registry, fp_b, sh_b, progress)
+        _step(progress, 0.4)
+        label_a, label_b = sheet_label(fp_a, sh_a), sheet_label(fp_b, sh_b)
+        con = self._cursor()
+        try:
+            pairs = self._key_pairs(a, cols_a, b, cols_b, normalize)
+            k = [f"__k{i}" for i in range(len(pairs))]
+            for table, side, alias in (("ka", a, "m"), ("kb", b, "d")):
+                exprs = [p[0] if alias == "m" else p[1] for p in pairs]
+                con.execute(f"CREATE TEMP TABLE {table} AS SELECT DISTINCT "
+                            f"{', '.join(f'{x} AS {n}' for x, n in zip(exprs, k))} FROM {side.scan} {alias} "
+                            f"WHERE {' AND '.join(f'{x} IS NOT NULL' for x in exprs)}")
+            groups = {"only_a": "SELECT * FROM ka EXCEPT SELECT * FROM kb",
+                      "only_b": "SELECT * FROM kb EXCEPT SELECT * FROM ka",
+                      "both": "SELECT * FROM ka INTERSECT SELECT * FROM kb"}
+            counts = {name: int(con.sql(f"SELECT count(*) FROM ({q})").fetchone()[0]) for name, q in groups.items()}
+            _step(progress, 0.6)
+            if whole_rows:
+                sides = []
+                for n, (side, alias, other, label) in enumerate(((a, "m", "kb", label_a), (b, "d", "ka", label_b))):
+                    exprs = [p[0] if alias == "m" else p[1] for p in pairs]
+                    sides.append(
+                        f"SELECT {_lit(f'Only in {label}')} AS \"Side\", {n} AS __side, {alias}.* "
+                        f"FROM {side.scan} {alias} ANTI JOIN {other} o "
+                        f"ON {' AND '.join(f'{x} = o.{kn}' for x, kn in zip(exprs, k))} "
+                        f"WHERE {' AND '.join(f'{x} IS NOT NULL' for x in exprs)}")
+                query = (f"SELECT * EXCLUDE (__side, {ROW}) FROM ({sides[0]} UNION ALL BY NAME {sides[1]}) "
+                         f"ORDER BY __side, {ROW}")
+            else:
+                parts = [(f"Only in {label_a}", "only_a", cols_a), (f"Only in {label_b}", "only_b", cols_b)]
+                if include_both:
+                    parts.append(("In both", "both", cols_a))
+                ctes, select = [], []
+                for i, (label, name, cols) in enumerate(parts):
+                    ctes.append(f"g{i} AS (SELECT *, row_number() OVER (ORDER BY {', '.join(k)}) AS __n "
+                                f"FROM ({groups[name]}))")
+                    if len(cols) == 1:
+                        select.append(f"g{i}.{k[0]} AS {_q(label)}")
+                    else:
+                        select.extend(f"g{i}.{n} AS {_q(f'{label} [{c}]')}" for n, c in zip(k, cols))
+                joined = "g0" + "".join(f" FULL JOIN g{i} USING (__n)" for i in range(1, len(parts)))
+                query = f"WITH {', '.join(ctes)} SELECT {', '.join(select)} FROM {joined} ORDER BY __n"
+            out = self._copy(con, query, self._result_path())
+        finally:
+            con.close()
+        return out, counts
+
+    @instrumented("unique", engine="duckdb")
+    def run_unique(self, registry, fp, sh, col, progress=None, counts=False, sort="appearance"):
+        if sort not in UNIQUE_SORTS:
+            raise ValueError(f"Unknown sort: {sort}")
+        cols = [str(c) for c in _as_columns(col)]
+        src = self.source(registry, fp, sh, progress)
+        for c in cols:
+            src.type(c)
+        _step(progress, 0.5)
+        select = [f"{_q(col)} AS {_q(f'Unique_{col}')}"] if isinstance(col, str) else [_q(c) for c in cols]
+        if counts:
+            select.append('count(*) AS "Count"')
+        order = f"count(*) DESC, min({ROW})" if sort == "frequency" else f"min({ROW})"
+        con = self._cursor()
+        try:
+            return self._copy(con, f"SELECT {', '.join(select)} FROM {src.scan} "
+                                   f"WHERE {' OR '.join(f'{_q(c)} IS NOT NULL' for c in cols)} "
+                                   f"GROUP BY ALL ORDER BY {order}", self._result_path())
+        finally:
+            con.close()
+
+    # engine.iter_sheet_chunks over the spilled sheet, for run_distinct_stats
+    def iter_chunks(self, registry, path, sheet, cols, chunk_rows=SPILL_CHUNK_ROWS):
+        src = self.source(registry, path, sheet)
+        con = self._cursor()
+        try:
+            query = f"SELECT {', '.join(_q(c) for c in cols)} FROM {src.scan}"
+            for batch in _arrow_reader(con.sql(query), chunk_rows):
+                yield batch.to_pandas()
+        finally:
+            con.close()
+
+    # the new column is built by engine.concat_columns one batch at a time, so formats behave the same
+    @instrumented("concat", engine="duckdb")
+    def run_concat(self, registry, fp, sh, cols, res_name="Concatenated", progress=None, **spec):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        src = self.source(registry, fp, sh, progress)
+        _step(progress, 0.3)
+        total = done = 0
+        path = self._result_path()
+        con = self._cursor()
+        writer = None
+        try:
+            total = con.sql(f"SELECT count(*) FROM {src.scan}").fetchone()[0]
+            reader = _arrow_reader(con.sql(f"SELECT * EXCLUDE ({ROW}) FROM {src.scan}"), SPILL_CHUNK_ROWS)
+            for batch in reader:
+                table = pa.Table.from_batches([batch])
+                part = table.select([str(c) for c in cols]).to_pandas()
+                joined = pa.array(concat_columns(part, [str(c) for c in cols], **spec), type=pa.string())
+                if res_name in table.column_names:
+                    table = table.set_column(table.column_names.index(res_name), res_name, joined)
+                else:
+                    table = table.append_column(res_name, joined)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+                writer.write_table(table, row_group_size=ROW_GROUP_ROWS)
+                done += len(table)
+                _step(progress, 0.3 + 0.7 * done / max(total, 1))
+            if writer is None:
+                empty = pa.table({**{c: pa.array([], pa.string()) for c in src.columns}, res_name: pa.array([], pa.string())})
+                pq.write_table(empty, path)
+        finally:
+            if writer is not None:
+                writer.close()
+            con.close()
+        return SpilledFrame([path])
+
+
+def open_out_of_core():
+    if not available():
+        raise RuntimeError("The out-of-core engine needs the duckdb and pyarrow packages (pip install duckdb).")
+    return OutOfCoreEngine()
@@ -0,0 +1,335 @@
+# Recorded chains of operations (concat -> VLOOKUP -> compare -> export) that can be saved,
+# replayed on new workbooks and re-run incrementally.
+#
+# A pipeline is a DAG. Its sources are named workbooks, so a replay can point them at other
+# files; each step reads sheets of sources or the outputs of earlier steps. A step's result is
+# cached under a key made from its op, its parameters and the keys of what it reads (a source
+# sheet's key is the workbook's fingerprint), so when one workbook changes only the steps
+# downstream of it re-run and the rest come from the memory or disk cache.
+import hashlib
+import json
+import os
+import re
+
+from engine import (
+    KeyIndexCache, describe_compare, describe_diff, describe_match, describe_stack, export_frame, file_fingerprint,
+    open_registry, run_compare, run_concat, run_diff, run_stack, run_unique, run_vlookup,
+)
+
+PIPELINE_VERSION = 1
+# {op: input roles}; every other field of a step is a parameter of the matching run_* call
+STEP_INPUTS = {
+    "concat": ("sheet",),
+    "vlookup": ("main", "lookup"),
+    "compare": ("a", "b"),
+    "diff": ("a", "b"),     # old and new version
+    "unique": ("sheet",),
+    "export": ("data",),
+    "stack": None,      # any number of sheets, read as sheet1, sheet2, ...
+}
+STEP_PREFIX = "step:"       # registry path of a cached step output
+STEP_SHEET = "result"
+
+
+class PipelineError(ValueError):
+    pass
+
+
+def step_roles(op, inputs=()):
+    roles = STEP_INPUTS[op]
+    if roles is None:
+        return tuple(f"sheet{i}" for i in range(1, max(1, len(inputs)) + 1))
+    return roles
+
+
+def _digest(parts):
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class Pipeline:
+    def __init__(self, sources=None, steps=None):
+        self.sources = dict(sources or {})  # {name: workbook path}
+        self.steps = list(steps or [])      # [{"id", "op", "inputs", "params"}], upstream first
+        self._producers = {}    # {(path, sheet): step id} for sheets replaced by a recorded step
+
+    def __len__(self):
+        return len(self.steps)
+
+    def clear(self):
+        self.sources.clear()
+        self.steps.clear()
+        self._producers.clear()
+
+    # name of the source recorded for a workbook path, if any step read it
+    def source_of(self, path):
+        for name, known in self.sources.items():
+            if os.path.abspath(known) == os.path.abspath(path):
+                return name
+        return None
+
+    def _source_name(self, path):
+        name = self.source_of(path)
+        if name is not None:
+            return name
+        base = re.sub(r"\W+", "_", os.path.splitext(os.path.basename(path))[0]).strip("_") or "book"
+        name, n = base, 2
+        while name in self.sources:
+            name, n = f"{base}_{n}", n + 1
+        self.sources[name] = path
+        return name
+
+    def _ref(self, ref):
+        if isinstance(ref, str):
+            return {"step": ref}
+        path, sheet = ref
+        step_id = self._producers.get((path, sheet))
+        if step_id is not None:
+            return {"step": step_id}
+        return {"source": self._source_name(path), "sheet": sheet}
+
+    # inputs: {role: (path, sheet) or id of an earlier step}; replaces marks the sheet the
+    # step's output now stands in for (an applied concat), so later reads of it depend on the step
+    def record(self, op, inputs, replaces=None, **params):
+        if set(inputs) != set(step_roles(op, inputs)):
+            raise PipelineError(f"{op} reads {', '.join(step_roles(op, inputs))}")
+        step = {
+            "id": f"s{len(self.steps) + 1}",
+            "op": op,
+            "inputs": {role: self._ref(ref) for role, ref in inputs.items()},
+            "params": json.loads(json.dumps(params)),     # tuples -> lists, as after a reload
+        }
+        self.steps.append(step)
+        if replaces is not None:
+            self._producers[tuple(replaces)] = step["id"]
+        return step["id"]
+
+    def producer(self, path, sheet):
+        return self._producers.get((path, sheet))
+
+    # after an undo/redo of the edit that made the sheet what it is
+    def set_producer(self, path, sheet, step_id):
+        if step_id is None:
+            self._producers.pop((path, sheet), None)
+        else:
+            self._producers[(path, sheet)] = step_id
+
+    def describe_step(self, step):
+        reads = []
+        for role in step_roles(step["op"], step["inputs"]):
+            ref = step["inputs"][role]
+            reads.append(ref["step"] if "step" in ref else f"{ref['source']}::{ref['sheet']}")
+        text = f"{step['id']} {step['op']}({', '.join(reads)})"
+        if step["op"] == "export":
+            text += f" -> {step['params']['output']}"
+        return text
+
+    # ids of the steps that read, directly or not, any of the named sources (only these sheets of them)
+    def downstream(self, source_names, sheets=None):
+        hit = set()
+        for step in self.steps:
+            for ref in step["inputs"].values():
+                if ref.get("step") in hit or (
+                        ref.get("source") in source_names and (sheets is None or ref["sheet"] in sheets)):
+                    hit.add(step["id"])
+        return hit
+
+    # the steps leading up to step_id, as a pipeline of their own that re-creates its result
+    def upto(self, step_id):
+        ids = [step["id"] for step in self.steps]
+        steps = [s for s in self.steps[:ids.index(step_id) + 1] if s["op"] != "export"]
+        return Pipeline(self.sources, json.loads(json.dumps(steps)))
+
+    def to_dict(self):
+        return {"version": PIPELINE_VERSION, "sources": self.sources, "steps": self.steps}
+
+    def save(self, path):
+        tmp = path + ".part"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.to_dict(), fh, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict) or data.get("version") != PIPELINE_VERSION:
+            raise PipelineError("Not a pipeline file (or from a newer version).")
+        sources, steps = data.get("sources") or {}, data.get("steps") or []
+        seen = set()
+        for step in steps:
+            op = step.get("op")
+            if op not in STEP_INPUTS:
+                raise PipelineError(f"Unknown step op {op!r}")
+            inputs = step.get("inputs", {})
+            if set(inputs) != set(step_roles(op, inputs)):
+                raise PipelineError(f"Step {step.get('id')}: {op} reads {', '.join(step_roles(op, inputs))}")
+            for ref in step["inputs"].values():
+                # steps may only read earlier steps, which keeps the graph acyclic
+                if "step" in ref and ref["step"] not in seen:
+                    raise PipelineError(f"Step {step['id']} reads {ref['step']} before it runs")
+                if "source" in ref and ref["source"] not in sources:
+                    raise PipelineError(f"Step {step['id']} reads unknown source {ref['source']!r}")
+            if op == "export" and not step.get("params", {}).get("output"):
+                raise PipelineError(f"Step {step['id']}: export needs an output path")
+            seen.add(step["id"])
+        return cls(sources, steps)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError) as e:
+            raise PipelineError(f"Cannot read {path}: {e}")
+        return cls.from_dict(data)
+
+
+class PipelineRun:
+    def __init__(self):
+        self.steps = []         # [(step, "ran" | "cached", message)]
+        self.result = None      # output of the last step that isn't an export
+
+    def add(self, step, status, message=""):
+        self.steps.append((step, status, message))
+
+    def counts(self):
+        ran = sum(1 for _step, status, _msg in self.steps if status == "ran")
+        return ran, len(self.steps) - ran
+
+    def describe(self):
+        ran, cached = self.counts()
+        return f"{ran} step(s) ran, {cached} served from cache"
+
+
+# Keeps step outputs between runs; with a disk cache they also survive a restart.
+class PipelineRunner:
+    def __init__(self, registry=None):
+        self.registry = registry if registry is not None else open_registry()
+        self.key_indexes = KeyIndexCache()
+        self._fingerprints = {}     # {path: fingerprint} as of the last run
+        self._held = set()          # registry paths of step outputs kept in memory
+        self._exported = {}         # {output path: key of the step output written there}
+
+    # sources: {name: path} overrides for a replay on other workbooks
+    def run(self, pipeline, sources=None, progress=None):
+        paths = {**pipeline.sources, **(sources or {})}
+        self._refresh(paths)
+        keys = self._keys(pipeline, paths)
+        steps = {step["id"]: step for step in pipeline.steps}
+        run = PipelineRun()
+        for i, step in enumerate(pipeline.steps):
+            if progress is not None:
+                progress(i / len(pipeline.steps), pipeline.describe_step(step))
+            key = keys[step["id"]]
+            if step["op"] == "export":
+                output = step["params"]["output"]
+                if self._exported.get(output) == key and os.path.exists(output):
+                    run.add(step, "cached")
+                    continue
+                fp, sh = self._resolve(step["inputs"]["data"], steps, keys, paths)
+                df = self.registry.get(fp, sh)
+                folder = os.path.dirname(output)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                sheets = export_frame(df, output)
+                self._exported[output] = key
+                run.add(step, "ran", f"{len(df):,} row(s)" + (f", {sheets} sheets" if sheets > 1 else ""))
+            elif self._has(key):
+                run.add(step, "cached")
+            else:
+                run.add(step, "ran", self._compute(step, steps, keys, paths))
+        last = [s for s in pipeline.steps if s["op"] != "export"]
+        if last:
+            fp, sh = self._resolve({"step": last[-1]["id"]}, steps, keys, paths)
+            run.result = self.registry.get(fp, sh)
+        self._prune(set(keys.values()))
+        return run
+
+    def _refresh(self, paths):
+        for name, path in paths.items():
+            if not os.path.isfile(path):
+                raise PipelineError(f"Source {name}: file not found: {path}")
+            fingerprint = file_fingerprint(path)
+            if self._fingerprints.get(path) != fingerprint:
+                # the workbook changed since the last run: drop what was read from it
+                if path in self.registry:
+                    self.registry.remove(path)
+                self._fingerprints[path] = fingerprint
+            if path not in self.registry:
+                self.registry.open(path)
+
+    def _keys(self, pipeline, paths):
+        keys = {}
+        for step in pipeline.steps:
+            parts = [step["op"], step["params"]]
+            for role in sorted(step["inputs"]):
+                ref = step["inputs"][role]
+                if "step" in ref:
+                    parts.append([role, keys[ref["step"]]])
+                else:
+                    parts.append([role, self._fingerprints[paths[ref["source"]]], ref["sheet"]])
+            keys[step["id"]] = _digest(parts)
+        return keys
+
+    def _has(self, key):
+        disk_cache = self.registry.disk_cache
+        return (STEP_PREFIX + key in self.registry
+                or (disk_cache is not None and disk_cache.has(key, STEP_SHEET)))
+
+    # (path, sheet) in the registry holding what ref points at, computing a step if it has to
+    def _resolve(self, ref, steps, keys, paths):
+        if "source" in ref:
+            path = paths[ref["source"]]
+            if ref["sheet"] not in self.registry.sheet_names(path):
+                raise PipelineError(f"No sheet {ref['sheet']!r} in {path}")
+            return path, ref["sheet"]
+        key = keys[ref["step"]]
+        path = STEP_PREFIX + key
+        if path not in self.registry:
+            disk_cache = self.registry.disk_cache
+            df = disk_cache.load(key, STEP_SHEET) if disk_cache is not None else None
+            if df is None:
+                self._compute(steps[ref["step"]], steps, keys, paths)
+            else:
+                self._keep(key, df, save=False)
+        return path, STEP_SHEET
+
+    def _keep(self, key, df, save=True):
+        self.registry.attach(STEP_PREFIX + key, STEP_SHEET, df)
+        self._held.add(STEP_PREFIX + key)
+        if save and self.registry.disk_cache is not None:
+            self.registry.disk_cache.save(key, STEP_SHEET, df)
+
+    def _compute(self, step, steps, keys, paths):
+        refs = {role: self._resolve(ref, steps, keys, paths) for role, ref in step["inputs"].items()}
+        registry, params, op = self.registry, step["params"], step["op"]
+        if op == "vlookup":
+            (fp_main, sh_main), (fp_lookup, sh_lookup) = refs["main"], refs["lookup"]
+            df, stats = run_vlookup(registry, fp_main, sh_main, fp_lookup=fp_lookup, sh_lookup=sh_lookup,
+                                    key_indexes=self.key_indexes, **params)
+            message = describe_match(stats)
+        elif op == "compare":
+            (fp_a, sh_a), (fp_b, sh_b) = refs["a"], refs["b"]
+            df, counts = run_compare(registry, fp_a, sh_a, fp_b=fp_b, sh_b=sh_b, **params)
+            message = describe_compare(counts)
+        elif op == "diff":
+            (fp_a, sh_a), (fp_b, sh_b) = refs["a"], refs["b"]
+            df, stats = run_diff(registry, fp_a, sh_a, fp_b=fp_b, sh_b=sh_b, **params)
+            message = describe_diff(stats)
+        elif op == "unique":
+            df = run_unique(registry, *refs["sheet"], **params)
+            message = f"{len(df):,} unique value(s)"
+        elif op == "stack":
+            df, report = run_stack(registry, [refs[role] for role in step_roles(op, refs)], **params)
+            message = describe_stack(report)
+        else:
+            df = run_concat(registry, *refs["sheet"], **params)
+            message = f"{len(df):,} row(s)"
+        self._keep(keys[step["id"]], df)
+        return message
+
+    # step outputs no longer reachable from the pipeline leave memory (the disk cache keeps them)
+    def _prune(self, live_keys):
+        for path in list(self._held):
+            if path[len(STEP_PREFIX):] not in live_keys:
+                self.registry.remove(path)
+                self._held.discard(path)
@@ -1,13 +1,415 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
+from tkinter import filedialog, messagebox, simpledialog, ttk
 import pandas as pd
 import os
 from PIL import Image, ImageTk
 from io import BytesIO
 import base64
+import itertools
+import json
+import queue
+import threading
+import time
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+
+from engine import (
+    DIFF_LAYOUTS, DUPLICATE_POLICIES, EXPORT_FILETYPES, FUZZY_THRESHOLD, NORMALIZE_OPTIONS, PARSE_PROCESSES,
+    PREVIEW_HEAD_ROWS, STACK_SOURCE_COLUMN, UNIQUE_SORTS, WATCH_SECONDS, FileWatcher, FrameView, History,
+    KeyIndexCache, SheetChange, StateChange, describe_compare, describe_diff, describe_distinct, describe_match,
+    describe_memory, describe_stack, export_frame, file_stamp, match_sheets, memory_report, open_registry, perf_log,
+    render_rows, run_compare, run_concat, run_diff, run_distinct_stats, run_stack, run_unique, run_vlookup,
+)
+from outofcore import OUT_OF_CORE, open_out_of_core
+from pipeline import Pipeline, PipelineError, PipelineRunner
 
 DEFAULT_LOGO_B64 = """R0lGODlhMAAwAIAAAP///wAAACH5BAEAAAAALAAAAAAwADAAAAIOhI+py+0Po5y02ouz3rwFADs="""
 
+# Background workers: threads run jobs, processes do the CPU-bound parsing
+JOB_THREADS = int(os.environ.get("ABG_JOB_THREADS", "4"))
+
+# the operations the dialogs run when the out-of-core engine is off
+IN_MEMORY_OPS = SimpleNamespace(
+    run_vlookup=run_vlookup, run_compare=run_compare, run_unique=run_unique, run_concat=run_concat)
+# sheet name of a stacked result, which is listed with the files as "<result name>"
+STACKED_SHEET = "Stacked"
+# how often the Tk thread picks up workbooks the file watcher found changed
+WATCH_POLL_MS = 250
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    _ids = itertools.count(1)
+
+    def __init__(self, name, scheduler):
+        self.id = next(self._ids)
+        self.name = name
+        self.state = "queued"       # queued | running | done | failed | cancelled
+        self.progress = None        # 0..1 when the job reports it
+        self.message = ""
+        self._scheduler = scheduler
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+        self._scheduler._events.put(("changed", self, None))
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled(self.name)
+
+    # called from the worker; raises JobCancelled so long loops stop at the next report
+    def report(self, progress=None, message=None):
+        self.check()
+        if progress is not None:
+            self.progress = max(0.0, min(1.0, progress))
+        if message is not None:
+            self.message = message
+        self._scheduler._events.put(("changed", self, None))
+
+    def describe(self):
+        text = self.name
+        if self.state == "queued":
+            return text + " (queued)"
+        if self.progress is not None:
+            text += f" {self.progress:.0%}"
+        if self.message:
+            text += f" - {self.message}"
+        return text
+
+
+# Runs callables on worker threads; every callback is delivered on the Tk thread via root.after.
+class JobScheduler:
+    POLL_MS = 50
+
+    def __init__(self, root, on_change=None):
+        self.root = root
+        self.on_change = on_change
+        self.jobs = []              # active (queued/running) jobs, oldest first
+        self._threads = ThreadPoolExecutor(JOB_THREADS, thread_name_prefix="abg-job")
+        # worker processes start on first use
+        self.processes = ProcessPoolExecutor(PARSE_PROCESSES)
+        self._events = queue.Queue()
+        self._callbacks = {}        # {job_id: (on_done, on_error, on_cancel)}
+        self._closed = False
+        self.root.after(self.POLL_MS, self._poll)
+
+    # fn(job, *args, **kwargs) runs on a worker; on_done(result) / on_error(exc) / on_cancel(job)
+    # run on the Tk thread. on_cancel also runs when fn finished but the job was cancelled meanwhile.
+    def submit(self, name, fn, *args, on_done=None, on_error=None, on_cancel=None, **kwargs):
+        job = Job(name, self)
+        self.jobs.append(job)
+        self._callbacks[job.id] = (on_done, on_error, on_cancel)
+        self._threads.submit(self._run, job, fn, args, kwargs)
+        self._notify()
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled:
+            self._events.put(("cancelled", job, None))
+            return
+        job.state = "running"
+        self._events.put(("changed", job, None))
+        try:
+            result = fn(job, *args, **kwargs)
+            job.check()
+        except JobCancelled:
+            self._events.put(("cancelled", job, None))
+        except Exception as e:
+            self._events.put(("failed", job, e))
+        else:
+            self._events.put(("done", job, result))
+
+    def _poll(self):
+        if self._closed:
+            return
+        changed = False
+        while True:
+            try:
+                kind, job, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+            changed = True
+            if kind == "changed":
+                continue
+            job.state = kind
+            if job in self.jobs:
+                self.jobs.remove(job)
+            on_done, on_error, on_cancel = self._callbacks.pop(job.id, (None, None, None))
+            try:
+                if kind == "done" and on_done is not None:
+                    on_done(payload)
+                elif kind == "failed" and on_error is not None:
+                    on_error(payload)
+                elif kind == "cancelled" and on_cancel is not None:
+                    on_cancel(job)
+            except Exception as e:
+                messagebox.showerror("Error", f"{job.name} failed:\n{e}")
+        if changed:
+            self._notify()
+        self.root.after(self.POLL_MS, self._poll)
+
+    def _notify(self):
+        if self.on_change is not None:
+            self.on_change(self.jobs)
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            job.cancel()
+
+    def shutdown(self):
+        self._closed = True
+        self.cancel_all()
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        self.processes.shutdown(wait=False, cancel_futures=True)
+
+
+
+# Treeview that only ever holds the rows on screen; values are paged in from the DataFrame on scroll.
+class VirtualGrid(ttk.Frame):
+    BUFFER = 200        # rows materialized around the visible window
+    HEADING_PX = 28
+    SEARCH_DELAY_MS = 250   # wait for typing to pause before searching
+
+    def __init__(self, master, col_width=120, **kw):
+        super().__init__(master, **kw)
+        self.col_width = col_width
+        self.df = None
+        self.view = None            # FrameView over df when it can be sorted and filtered
+        self.top = 0                # first data row on screen
+        self._iids = []             # tree items, one per visible row
+        self._block = (0, 0, [])    # (start, stop, rows) materialized cache
+        self._search_after = None
+
+        bar = ttk.Frame(self)
+        ttk.Label(bar, text="Search:").pack(side="left")
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(bar, textvariable=self.search_var, width=30)
+        self.search_entry.pack(side="left", padx=(4, 8))
+        self.search_var.trace_add("write", lambda *_: self._schedule_search())
+        self.clear_btn = ttk.Button(bar, text="Clear Sort/Filters", command=self.clear_view)
+        self.clear_btn.pack(side="left")
+        self.filter_var = tk.StringVar(value="")
+        ttk.Label(bar, textvariable=self.filter_var, anchor="w").pack(side="left", padx=8, fill="x", expand=True)
+
+        self.tree = ttk.Treeview(self, show="headings")
+        vsb = ttk.Scrollbar(self, orient="vertical", command=self._on_vscroll)
+        hsb = ttk.Scrollbar(self, orient="horizontal", command=self.tree.xview)
+        self.vsb = vsb
+        self.tree.configure(xscrollcommand=hsb.set)
+        self.info_var = tk.StringVar(value="")
+        info = ttk.Label(self, textvariable=self.info_var, anchor="w")
+
+        bar.grid(row=0, column=0, columnspan=2, sticky="ew", pady=(0, 4))
+        self.tree.grid(row=1, column=0, sticky="nsew")
+        vsb.grid(row=1, column=1, sticky="ns")
+        hsb.grid(row=2, column=0, sticky="ew")
+        info.grid(row=3, column=0, columnspan=2, sticky="ew")
+        self.rowconfigure(1, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.tree.bind("<Configure>", lambda e: self._render())
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", lambda e: self._scroll_to(self.top - 3) or "break")
+        self.tree.bind("<Button-5>", lambda e: self._scroll_to(self.top + 3) or "break")
+        self.tree.bind("<Prior>", lambda e: self._scroll_to(self.top - self._visible()) or "break")
+        self.tree.bind("<Next>", lambda e: self._scroll_to(self.top + self._visible()) or "break")
+        self.tree.bind("<Control-Home>", lambda e: self._scroll_to(0) or "break")
+        self.tree.bind("<Control-End>", lambda e: self._scroll_to(self._nrows()) or "break")
+        self.tree.bind("<Up>", self._on_up)
+        self.tree.bind("<Down>", self._on_down)
+        self.tree.bind("<Button-3>", self._on_right_click)
+
+    def set_data(self, df):
+        self.df = df
+        # spilled (out-of-core) results page from disk and can only be shown in file order
+        self.view = FrameView(df) if isinstance(df, pd.DataFrame) else None
+        if self._search_after is not None:
+            self.after_cancel(self._search_after)
+            self._search_after = None
+        self.search_var.set("")
+        state = "normal" if self.view is not None else "disabled"
+        self.search_entry.configure(state=state)
+        self.clear_btn.configure(state=state)
+        self.tree.delete(*self._iids)
+        self._iids = []
+        cols = [] if df is None else list(df.columns)
+        # column ids are positional so duplicate or non-string headers still work
+        ids = [f"c{i}" for i in range(len(cols))]
+        self.tree["columns"] = ids
+        for i, cid in enumerate(ids):
+            self.tree.heading(cid, command=lambda i=i: self._cycle_sort(i))
+            self.tree.column(cid, width=self.col_width, anchor="w", stretch=False)
+        self._refresh()
+
+    def _nrows(self):
+        if self.view is not None:
+            return len(self.view)
+        return 0 if self.df is None else len(self.df)
+
+    # ---- sort / filter / search ----
+    # rows shown changed: back to the top, headings and summary redrawn
+    def _refresh(self):
+        self.top = 0
+        self._block = (0, 0, [])
+        if self.df is not None:
+            sort = self.view.sort if self.view is not None else None
+            filters = self.view.filters if self.view is not None else {}
+            for i, name in enumerate(self.df.columns):
+                text = str(name)
+                if sort is not None and sort[0] == i:
+                    text += " ▲" if sort[1] else " ▼"
+                if i in filters:
+                    text += " ⧩"
+                self.tree.heading(f"c{i}", text=text)
+        parts = []
+        if self.view is not None:
+            parts = [f"{self.df.columns[i]}: {text}" for i, text in self.view.filters.items()]
+            if self.view.search:
+                parts.append(f"search: {self.view.search}")
+        self.filter_var.set(("Filters — " + "; ".join(parts)) if parts else "")
+        self._render()
+
+    # the first sort, filter or search on a column indexes it, which can take a moment on big sheets
+    def _update_view(self, change, *args):
+        self.configure(cursor="watch")
+        self.update_idletasks()
+        try:
+            change(*args)
+        finally:
+            self.configure(cursor="")
+        self._refresh()
+
+    # click a heading: ascending, descending, then back to file order
+    def _cycle_sort(self, i):
+        if self.view is None:
+            return
+        sort = self.view.sort
+        if sort is None or sort[0] != i:
+            self._update_view(self.view.set_sort, i, True)
+        elif sort[1]:
+            self._update_view(self.view.set_sort, i, False)
+        else:
+            self._update_view(self.view.set_sort, None)
+
+    def _on_right_click(self, event):
+        if self.view is None or self.tree.identify_region(event.x, event.y) != "heading":
+            return
+        column = self.tree.identify_column(event.x)     # "#1" is the first column
+        if not column or column == "#0":
+            return
+        i = int(column[1:]) - 1
+        text = simpledialog.askstring(
+            "Filter",
+            f"Filter '{self.df.columns[i]}'\n\n"
+            "text     contains (any case)\n"
+            "=text    equals        != not equal\n"
+            ">10  <=2024-01-31   compare numbers/dates\n"
+            "=        blank cells\n\n"
+            "Leave empty to remove the filter.",
+            initialvalue=self.view.filters.get(i, ""), parent=self)
+        if text is not None:
+            self._update_view(self.view.set_filter, i, text)
+        return "break"
+
+    def _schedule_search(self):
+        if self._search_after is not None:
+            self.after_cancel(self._search_after)
+        self._search_after = self.after(self.SEARCH_DELAY_MS, self._run_search)
+
+    def _run_search(self):
+        self._search_after = None
+        if self.view is not None and self.search_var.get().strip() != self.view.search:
+            self._update_view(self.view.set_search, self.search_var.get())
+
+    def clear_view(self):
+        if self.view is None:
+            return
+        self.view.clear()
+        if self.search_var.get():
+            self.search_var.set("")     # its pending search finds nothing left to do
+        self._refresh()
+
+    def _visible(self):
+        row_px = int(ttk.Style().lookup("Treeview", "rowheight") or 24)
+        height = self.tree.winfo_height()
+        if height <= 1:
+            height = int(self.tree.cget("height")) * row_px + self.HEADING_PX
+        return max(1, (height - self.HEADING_PX) // row_px)
+
+    def _rows(self, start, stop):
+        b_start, b_stop, rows = self._block
+        if start < b_start or stop > b_stop:
+            b_start = max(0, start - self.BUFFER)
+            b_stop = min(self._nrows(), stop + self.BUFFER)
+            rows = render_rows(self.view if self.view is not None else self.df, b_start, b_stop)
+            self._block = (b_start, b_stop, rows)
+        return rows[start - b_start:stop - b_start]
+
+    def _scroll_to(self, top):
+        n = self._nrows()
+        top = max(0, min(int(top), max(0, n - self._visible())))
+        if top != self.top:
+            self.top = top
+            self.tree.selection_set(())
+            self._render()
+
+    def _render(self):
+        n = self._nrows()
+        visible = self._visible()
+        # growing the window near the end pulls earlier rows into view
+        self.top = max(0, min(self.top, n - visible))
+        count = min(visible, n - self.top)
+        while len(self._iids) < count:
+            self._iids.append(self.tree.insert("", "end"))
+        if len(self._iids) > count:
+            self.tree.delete(*self._iids[count:])
+            del self._iids[count:]
+        for iid, row in zip(self._iids, self._rows(self.top, self.top + count)):
+            self.tree.item(iid, values=row)
+        if n:
+            self.vsb.set(self.top / n, (self.top + count) / n)
+            total = "" if n == len(self.df) else f" (filtered from {len(self.df):,})"
+            self.info_var.set(f"Rows {self.top + 1:,}–{self.top + count:,} of {n:,}{total}")
+        else:
+            self.vsb.set(0, 1)
+            self.info_var.set("" if self.df is None else f"No rows match (of {len(self.df):,})")
+
+    def _on_vscroll(self, action, *args):
+        if action == "moveto":
+            self._scroll_to(float(args[0]) * self._nrows())
+        elif action == "scroll":
+            step = int(args[0])
+            if args[1] == "pages":
+                step *= self._visible()
+            self._scroll_to(self.top + step)
+
+    def _on_wheel(self, event):
+        self._scroll_to(self.top - (event.delta // 120 or (1 if event.delta > 0 else -1)) * 3)
+        return "break"
+
+    def _on_up(self, _e):
+        if self._iids and self.tree.focus() == self._iids[0] and self.top > 0:
+            self._scroll_to(self.top - 1)
+            self.tree.focus(self._iids[0])
+            self.tree.selection_set(self._iids[0])
+            return "break"
+
+    def _on_down(self, _e):
+        if self._iids and self.tree.focus() == self._iids[-1]:
+            self._scroll_to(self.top + 1)
+            self.tree.focus(self._iids[-1])
+            self.tree.selection_set(self._iids[-1])
+            return "break"
+
 
 class ExcelToolApp:
     def __init__(self, root):
@@ -18,11 +420,18 @@ class ExcelToolApp:
 
         # ---------- State ----------
         self.files = []                   # [full_path, ...]
-        self.all_sheets = {}              # {full_path: {sheet_name: DataFrame}}
+        self.all_sheets = open_registry()  # lazy {full_path: {sheet_name: DataFrame}}
         self.result_df = None             # last operation result
         self.current_preview_df = None    # what's shown in preview
         self.current_preview_file = None  # file path of previewed sheet (if sheet-based)
         self.current_preview_sheet = None # sheet name
+        self.result_ref = None            # what result_df came from: (path, sheet) or a pipeline step id
+        self.pipeline = Pipeline()        # every operation is recorded here as a step
+        self.pipeline_runner = None       # replays saved pipelines; created on first use
+        self.history = History()          # undo/redo of sheet edits and results
+        self.out_of_core = None           # OutOfCoreEngine while View > Out-of-Core Engine is on
+        self._out_of_core_engine = None   # kept when switched off: earlier results still read its files
+        self._perf_win = None             # the Performance window while open
 
         # ---------- UI setup ----------
         self._load_logo()
@@ -31,11 +440,40 @@ class ExcelToolApp:
         self._create_widgets()
 
         # Status bar
+        status_frame = ttk.Frame(self.root, style="Status.TFrame")
+        status_frame.pack(side=tk.BOTTOM, fill="x")
         self.status_var = tk.StringVar(value="Ready")
         self.status_bar = ttk.Label(
-            self.root, textvariable=self.status_var, anchor="w", style="Status.TLabel"
+            status_frame, textvariable=self.status_var, anchor="w", style="Status.TLabel"
         )
-        self.status_bar.pack(side=tk.BOTTOM, fill="x")
+        self.status_bar.pack(side="left", fill="x", expand=True)
+        self.cancel_jobs_btn = ttk.Button(status_frame, text="Cancel", command=self._cancel_jobs)
+        self.jobs_var = tk.StringVar(value="")
+        ttk.Label(status_frame, textvariable=self.jobs_var, anchor="e", style="Status.TLabel").pack(side="right")
+        self.cache_var = tk.StringVar(value="")
+        ttk.Label(status_frame, textvariable=self.cache_var, anchor="e", style="Status.TLabel").pack(side="right")
+        self.memory_var = tk.StringVar(value="")
+        ttk.Label(status_frame, textvariable=self.memory_var, anchor="e", style="Status.TLabel").pack(side="right")
+
+        # ---------- Background jobs ----------
+        self.jobs = JobScheduler(self.root, on_change=self._update_job_status)
+        self.all_sheets.parse_executor = self.jobs.processes
+        self._update_job_status([])
+        self._opening = {}                # {path: its open job in flight}
+        self.key_indexes = KeyIndexCache()  # lookup-key hash indexes, reused across VLOOKUPs
+
+        # ---------- File watching ----------
+        self._file_changes = queue.Queue()  # paths changed on disk, filled by the watcher thread
+        self.watcher = FileWatcher(on_change=self._file_changes.put)
+        self._reloading = set()           # paths with a reload job in flight
+        self._reload_again = set()        # ... that changed again meanwhile
+        if self.watch_var.get():
+            self.watcher.start()
+        self.root.after(WATCH_POLL_MS, self._poll_file_changes)
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+        if OUT_OF_CORE:
+            self.out_of_core_var.set(True)
+            self._toggle_out_of_core()
 
     def _load_logo(self):
         try:
@@ -64,6 +502,7 @@ class ExcelToolApp:
         style.configure("TLabelframe", background="#232946", foreground="#eebbc3", font=("Segoe UI", 13, "bold"))
         style.configure("TLabelframe.Label", background="#232946", foreground="#eebbc3", font=("Segoe UI", 13, "bold"))
         style.configure("Status.TLabel", background="#121629", foreground="#eebbc3", font=("Segoe UI", 10, "italic"))
+        style.configure("Status.TFrame", background="#121629")
         style.configure("Treeview", background="#ffffff", foreground="#232946", fieldbackground="#ffffff", rowheight=24)
         style.configure("Treeview.Heading", background="#eebbc3", foreground="#232946", font=("Segoe UI", 11, "bold"))
 
@@ -75,11 +514,40 @@ class ExcelToolApp:
         file_menu.add_command(label="Open Excel Files...", command=self.load_files)
         file_menu.add_command(label="Export Result...", command=self.export_result)
         file_menu.add_separator()
-        file_menu.add_command(label="Exit", command=self.root.quit)
+        file_menu.add_command(label="Clear Cache", command=self.clear_cache)
+        file_menu.add_separator()
+        file_menu.add_command(label="Exit", command=self._on_close)
         menubar.add_cascade(label="File", menu=file_menu)
 
+        self.edit_menu = tk.Menu(menubar, tearoff=0)
+        self.edit_menu.add_command(label="Undo", command=self.undo, accelerator="Ctrl+Z", state="disabled")
+        self.edit_menu.add_command(label="Redo", command=self.redo, accelerator="Ctrl+Y", state="disabled")
+        menubar.add_cascade(label="Edit", menu=self.edit_menu)
+        self.root.bind_all("<Control-z>", lambda _e: self.undo())
+        self.root.bind_all("<Control-y>", lambda _e: self.redo())
+        self.root.bind_all("<Control-Z>", lambda _e: self.redo())   # Ctrl+Shift+Z
+
+        pipeline_menu = tk.Menu(menubar, tearoff=0)
+        pipeline_menu.add_command(label="Save Recorded Steps...", command=self.save_pipeline)
+        pipeline_menu.add_command(label="Run Pipeline...", command=self.run_pipeline)
+        pipeline_menu.add_separator()
+        pipeline_menu.add_command(label="Clear Recorded Steps", command=self.clear_pipeline)
+        menubar.add_cascade(label="Pipeline", menu=pipeline_menu)
+
         view_menu = tk.Menu(menubar, tearoff=0)
         view_menu.add_command(label="Full Preview", command=self.full_preview)
+        view_menu.add_command(label="Memory Usage", command=self.show_memory)
+        view_menu.add_command(label="Performance", command=self.show_performance)
+        view_menu.add_separator()
+        self.compact_var = tk.BooleanVar(value=self.all_sheets.compact)
+        view_menu.add_checkbutton(
+            label="Compact Sheets on Load", variable=self.compact_var, command=self._toggle_compaction)
+        self.out_of_core_var = tk.BooleanVar(value=False)
+        view_menu.add_checkbutton(
+            label="Out-of-Core Engine (DuckDB)", variable=self.out_of_core_var, command=self._toggle_out_of_core)
+        self.watch_var = tk.BooleanVar(value=WATCH_SECONDS > 0)
+        view_menu.add_checkbutton(
+            label="Reload Changed Files", variable=self.watch_var, command=self._toggle_watching)
         menubar.add_cascade(label="View", menu=view_menu)
 
         help_menu = tk.Menu(menubar, tearoff=0)
@@ -136,12 +604,14 @@ class ExcelToolApp:
 
         ttk.Button(op_frame, text="VLOOKUP & Compare", command=self.vlookup).pack(side="left", padx=5)
         ttk.Button(op_frame, text="Compare Columns", command=self.compare_columns).pack(side="left", padx=5)
+        ttk.Button(op_frame, text="Compare Versions", command=self.compare_versions).pack(side="left", padx=5)
         ttk.Button(op_frame, text="Concatenate Columns", command=self.concat_columns).pack(side="left", padx=5)
         ttk.Button(op_frame, text="Find Unique Values", command=self.find_unique_values).pack(side="left", padx=5)
+        ttk.Button(op_frame, text="Stack Sheets", command=self.stack_sheets).pack(side="left", padx=5)
         ttk.Button(op_frame, text="Export Result", command=self.export_result).pack(side="right", padx=5)
 
 
-        preview_frame = ttk.Labelframe(self.root, text="Step 4: Preview (first 100 rows)", padding=10)
+        preview_frame = ttk.Labelframe(self.root, text="Step 4: Preview", padding=10)
         preview_frame.pack(fill="both", expand=True, padx=15, pady=(5, 15))
 
         self.preview_container = ttk.Frame(preview_frame)
@@ -151,49 +621,174 @@ class ExcelToolApp:
 
 
     def load_files(self):
-        paths = filedialog.askopenfilenames(filetypes=[("Excel files", "*.xlsx *.xls *.xlsm")])
+        paths = filedialog.askopenfilenames(filetypes=[("Excel files", "*.xlsx *.xls *.xlsm *.xlsb")])
         if not paths:
             return
 
-        new_files = 0
         for p in paths:
-            if p in self.files:
+            if p in self.files or p in self._opening:
                 continue
-            try:
-                xl = pd.ExcelFile(p)
-                sheets_dict = {}
-                for s in xl.sheet_names:
-                    sheets_dict[s] = xl.parse(s)
-                self.all_sheets[p] = sheets_dict
-                self.files.append(p)
-                new_files += 1
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to read {os.path.basename(p)}:\n{e}")
+            # each workbook is opened by its own job on the thread pool, so several load in parallel;
+            # only reading the sheet list goes to the parse process pool, when the disk cache doesn't have it;
+            # the stamp taken first lets the watcher catch a save that lands while it reads
+            self._opening[p] = self.jobs.submit(
+                f"Open {os.path.basename(p)}",
+                lambda job, path: (file_stamp(path), self.all_sheets.open(path)),
+                p,
+                on_done=lambda result, path=p: self._file_opened(path, result[0]),
+                on_error=lambda e, path=p: self._file_failed(path, e),
+                on_cancel=lambda job, path=p: self._file_cancelled(path, job),
+            )
 
-      
+    def _file_opened(self, path, stamp=None):
+        self._opening.pop(path, None)
+        self.files.append(path)
+        self.watcher.watch(path, stamp)
         self._refresh_file_list()
         self._refresh_preview_file_combo()
 
-        if self.files and not self.current_preview_df:
-       
-            first_fp = self.files[0]
-            first_sh = next(iter(self.all_sheets[first_fp]))
-            self._set_current_preview(first_fp, first_sh)
+        if self.current_preview_df is None and self.current_preview_file is None:
+            first_sh = self.all_sheets.sheet_names(path)[0]
+            self._set_current_preview(path, first_sh)
+
+        self.set_status(f"Loaded {os.path.basename(path)}. Total: {len(self.files)}.")
 
-        self.set_status(f"Loaded {new_files} new file(s). Total: {len(self.files)}.")
+    def _file_failed(self, path, e):
+        self._opening.pop(path, None)
+        messagebox.showerror("Error", f"Failed to read {os.path.basename(path)}:\n{e}")
+
+    # the open may have finished just before the cancel; then the registry holds a workbook nobody lists
+    def _file_cancelled(self, path, job):
+        if self._opening.get(path) is job:
+            del self._opening[path]
+        if path not in self.files and path not in self._opening:
+            self.all_sheets.remove(path)
 
     def clear_files(self):
+        self.jobs.cancel_all()
+        self._opening.clear()
+        self.watcher.clear()
+        self._reloading.clear()
+        self._reload_again.clear()
         self.files.clear()
         self.all_sheets.clear()
+        self.key_indexes.clear()
+        self.history.clear()
+        self._update_history_menu()
         self.result_df = None
+        self.result_ref = None
         self.current_preview_df = None
         self.current_preview_file = None
         self.current_preview_sheet = None
         self._refresh_file_list()
         self._refresh_preview_file_combo()
         self._update_preview_tree(pd.DataFrame())
+        self._update_memory()
         self.set_status("Cleared all files.")
 
+    # ---------- Reloading changed files ----------
+    def _poll_file_changes(self):
+        while True:
+            try:
+                path = self._file_changes.get_nowait()
+            except queue.Empty:
+                break
+            if path in self.files:
+                self._reload_file(path)
+        self.root.after(WATCH_POLL_MS, self._poll_file_changes)
+
+    # only this workbook is read again, in the background; see SheetRegistry.reload
+    def _reload_file(self, path):
+        if path in self._reloading:
+            self._reload_again.add(path)
+            return
+        self._reloading.add(path)
+        self.jobs.submit(
+            f"Reload {os.path.basename(path)}",
+            lambda job: self.all_sheets.reload(path),
+            on_done=lambda report: self._file_reloaded(path, report),
+            on_error=lambda e: self._reload_failed(path, e),
+            on_cancel=lambda job: self._reload_cancelled(path),
+        )
+
+    def _reload_failed(self, path, e):
+        self._reloading.discard(path)
+        self.set_status(f"Could not reload {os.path.basename(path)} ({e}); it is tried again on its next save.")
+
+    def _reload_cancelled(self, path):
+        self._reloading.discard(path)
+        self._reload_again.discard(path)
+        if path in self.files:
+            self.set_status(f"Reload of {os.path.basename(path)} cancelled; it is reloaded on its next save.")
+
+    def _file_reloaded(self, path, report):
+        self._reloading.discard(path)
+        if path in self._reload_again:
+            self._reload_again.discard(path)
+            self._reload_file(path)
+        if report is None or path not in self.files:
+            return
+        name = os.path.basename(path)
+        changed, added, removed = report["changed"], report["added"], report["removed"]
+        if not (changed or added or removed or report["edited"]):
+            self.set_status(f"{name} was saved; no sheet changed.")
+            return
+        idx = self.preview_file_combo.current()
+        if (added or removed) and idx >= 0 and self.files[idx] == path:
+            self._update_preview_sheet_combo()
+
+        # what is on screen: a result (a recorded step) or a sheet, which an applied step may have made
+        ref = self.result_ref
+        sheet_ref = ref if isinstance(ref, tuple) else None
+        step_id = self.pipeline.producer(*ref) if sheet_ref else ref
+        source = self.pipeline.source_of(path)
+        stale = set(changed) | set(removed) | set(report["edited"])
+        if step_id is not None and source is not None and step_id in self.pipeline.downstream({source}, stale):
+            self._refresh_result(step_id, sheet_ref)
+        elif sheet_ref is not None and sheet_ref[0] == path and sheet_ref[1] in changed:
+            self._set_current_preview(path, sheet_ref[1])
+
+        parts = [f"{name} changed on disk"]
+        if changed:
+            parts.append(f"reloaded {', '.join(changed)}")
+        if added:
+            parts.append(f"new sheet(s) {', '.join(added)}")
+        if removed:
+            parts.append(f"sheet(s) {', '.join(removed)} gone")
+        if report["edited"]:
+            parts.append(f"kept your edits to {', '.join(report['edited'])}")
+        self.set_status("; ".join(parts) + ".")
+        self._update_memory()
+
+    # replays the recorded steps behind what is on screen, so it reflects the reloaded workbook;
+    # sheet_ref: the sheet the step's output was applied to, rather than a result
+    def _refresh_result(self, step_id, sheet_ref=None):
+        pipeline = self.pipeline.upto(step_id)
+        runner = self._runner()
+
+        def done(result):
+            if self.result_ref != (sheet_ref or step_id) or result.result is None:
+                return  # something else is on screen by now
+            df = result.result
+            if sheet_ref is None:
+                self._show_result(df, f"Result refreshed: {result.describe()}.", step_id, label="Refresh")
+                return
+            fp, sh = sheet_ref
+            before = self.all_sheets.get(fp, sh)
+            self.all_sheets.set(fp, sh, df)
+            self.history.push(SheetChange(
+                self.all_sheets, fp, sh, before, df, f"Refresh {sh}", tag=(step_id, step_id)))
+            self._update_history_menu()
+            self.current_preview_df = df
+            self.result_df = df
+            self._update_preview_tree(df)
+            self.set_status(f"{os.path.basename(fp)} / {sh} refreshed: {result.describe()}.")
+
+        self.jobs.submit(
+            "Refresh result", lambda job: runner.run(pipeline, progress=job.report), on_done=done,
+            on_error=lambda e: self.set_status(f"Could not refresh the result: {e}"),
+        )
+
     def _refresh_file_list(self):
         self.file_listbox.delete(0, tk.END)
         for p in self.files:
@@ -211,7 +806,7 @@ class ExcelToolApp:
             return
         idx = self.preview_file_combo.current()
         fp = self.files[idx]
-        sheets = list(self.all_sheets[fp].keys())
+        sheets = self.all_sheets.sheet_names(fp)
         self.preview_sheet_combo['values'] = sheets
         if sheets:
             self.preview_sheet_combo.current(0)
@@ -224,48 +819,132 @@ class ExcelToolApp:
         self._set_current_preview(fp, sh)
 
     def _set_current_preview(self, file_path, sheet_name):
-        df = self.all_sheets[file_path][sheet_name]
-        self.current_preview_df = df
         self.current_preview_file = file_path
         self.current_preview_sheet = sheet_name
-        self.result_df = df.copy()  # treat current as baseline result
-        self._update_preview_tree(df)
-        self.set_status(f"Previewing: {os.path.basename(file_path)} / {sheet_name}")
 
+        def current():
+            # a newer selection may have replaced this one while parsing
+            return (self.current_preview_file, self.current_preview_sheet) == (file_path, sheet_name)
+
+        shown = []  # the full sheet, once it is on screen
+
+        def show(df):
+            if not current():
+                return
+            shown.append(df)
+            self.current_preview_df = df
+            # treat current as baseline result; shares the sheet's buffers (a spilled sheet holds none)
+            self.result_df = df.copy(deep=False) if isinstance(df, pd.DataFrame) else df
+            self.result_ref = (file_path, sheet_name)
+            self._update_preview_tree(df)
+            msg = f"Previewing: {os.path.basename(file_path)} / {sheet_name}"
+            compaction = self.all_sheets.compaction.get((file_path, sheet_name))
+            if compaction:
+                msg += f" (compacted {compaction[0] / 1024 ** 2:,.1f} MB → {compaction[1] / 1024 ** 2:,.1f} MB)"
+            self.set_status(msg)
+
+        def show_head(head):
+            if current() and not shown and not self.all_sheets.is_loaded(file_path, sheet_name):
+                self._update_preview_tree(head)
+                self.set_status(f"Previewing first {len(head)} rows of {sheet_name} while it loads...")
+
+        if not self.all_sheets.is_loaded(file_path, sheet_name):
+            # a row-limited read shows something right away while the full parse runs
+            self.jobs.submit(
+                f"Read head {os.path.basename(file_path)} / {sheet_name}",
+                lambda job: self.all_sheets.get(file_path, sheet_name, nrows=PREVIEW_HEAD_ROWS),
+                on_done=show_head,
+            )
+        if self.out_of_core is not None:
+            # the preview reads row groups of the spilled sheet; the sheet never loads whole
+            self.jobs.submit(
+                f"Spill {os.path.basename(file_path)} / {sheet_name}",
+                lambda job: self.out_of_core.sheet(self.all_sheets, file_path, sheet_name, job.report),
+                on_done=show,
+                on_error=lambda e: messagebox.showerror("Error", f"Failed to read {sheet_name}:\n{e}"),
+            )
+            return
+        self._with_sheet(file_path, sheet_name, show)
+
+    # callback(df) now if the sheet is parsed, otherwise after a background parse
+    def _with_sheet(self, file_path, sheet_name, callback):
+        if self.all_sheets.is_loaded(file_path, sheet_name):
+            callback(self.all_sheets.get(file_path, sheet_name))
+            return
+        self.jobs.submit(
+            f"Parse {os.path.basename(file_path)} / {sheet_name}",
+            lambda job: self.all_sheets.get(file_path, sheet_name),
+            on_done=callback,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to read {sheet_name}:\n{e}"),
+        )
+
+    # callback(columns) once the sheet's header is known, unless dlg was closed meanwhile
+    def _with_columns(self, dlg, file_path, sheet_name, callback):
+        def fill(cols):
+            if dlg.winfo_exists():
+                callback(cols)
+
+        if self.all_sheets.has_columns(file_path, sheet_name):
+            fill(self.all_sheets.columns(file_path, sheet_name))
+            return
+        # only the header row is read; the sheet itself is parsed when an operation needs it
+        self.jobs.submit(
+            f"Read header {os.path.basename(file_path)} / {sheet_name}",
+            lambda job: self.all_sheets.columns(file_path, sheet_name),
+            on_done=fill,
+            on_error=lambda e: messagebox.showerror("Error", f"Failed to read {sheet_name}:\n{e}"),
+        )
+
+    # normalization checkboxes; returns a getter for the chosen options
+    def _normalize_checks(self, parent, checked=()):
+        frame = ttk.Frame(parent)
+        frame.pack(pady=(5, 0))
+        norm_vars = {}
+        for opt, label in NORMALIZE_OPTIONS:
+            norm_vars[opt] = tk.BooleanVar(value=opt in checked)
+            tk.Checkbutton(
+                frame, text=label, variable=norm_vars[opt],
+                bg="#232946", fg="#eebbc3", selectcolor="#232946", activebackground="#232946"
+            ).pack(side="left", padx=6)
+        return lambda: tuple(opt for opt, var in norm_vars.items() if var.get())
+
+    # the fuzzy match threshold typed in entry, or None (after a warning) when it isn't 0-1
+    def _threshold(self, entry):
+        try:
+            threshold = float(entry.get())
+        except ValueError:
+            threshold = -1.0
+        if not 0.0 < threshold <= 1.0:
+            messagebox.showwarning("Warning", "The fuzzy match score must be a number above 0 and at most 1.")
+            return None
+        return threshold
+
+    def _show_result(self, df, msg, step=None, label="Result"):
+        before = (self.result_df, self.result_ref)
+        self.history.push(StateChange(before, (df, step), self._restore_result, label, frames=(before[0], df)))
+        self._update_history_menu()
+        self._restore_result((df, step))
+        self.set_status(msg)
+
+    def _restore_result(self, state):
+        df, ref = state
+        self.result_df = df
+        self.result_ref = ref
+        self.current_preview_df = df
+        self._update_preview_tree(df if df is not None else pd.DataFrame())
 
     def _build_preview_tree(self):
         # remove existing if any
         for w in self.preview_container.winfo_children():
             w.destroy()
 
-        self.preview_tree = ttk.Treeview(self.preview_container, show="headings")
-        self.preview_tree.pack(fill="both", expand=True)
-
-        vsb = ttk.Scrollbar(self.preview_container, orient="vertical", command=self.preview_tree.yview)
-        vsb.pack(side="right", fill="y")
-        self.preview_tree.configure(yscrollcommand=vsb.set)
-
-        hsb = ttk.Scrollbar(self.preview_container, orient="horizontal", command=self.preview_tree.xview)
-        hsb.pack(side="bottom", fill="x")
-        self.preview_tree.configure(xscrollcommand=hsb.set)
+        self.preview_grid = VirtualGrid(self.preview_container, col_width=120)
+        self.preview_grid.pack(fill="both", expand=True)
 
         self._update_preview_tree(pd.DataFrame())
 
     def _update_preview_tree(self, df):
-        self.preview_tree.delete(*self.preview_tree.get_children())
-
-        for c in self.preview_tree["columns"]:
-            self.preview_tree.heading(c, text="")
-        if df is None or df.empty:
-            self.preview_tree["columns"] = []
-            return
-        cols = list(df.columns)
-        self.preview_tree["columns"] = cols
-        for c in cols:
-            self.preview_tree.heading(c, text=c)
-            self.preview_tree.column(c, width=120, anchor="w")
-        for _, row in df.head(100).iterrows():  # limit preview
-            self.preview_tree.insert("", "end", values=list(row))
+        self.preview_grid.set_data(None if df is None or df.empty else df)
 
     def vlookup(self):
         if len(self.files) < 2:
@@ -274,7 +953,7 @@ class ExcelToolApp:
 
         dlg = tk.Toplevel(self.root)
         dlg.title("VLOOKUP & Compare")
-        dlg.geometry("600x520")
+        dlg.geometry("620x860")
         dlg.configure(bg="#232946")
 
         file_names = [os.path.basename(p) for p in self.files]
@@ -292,9 +971,12 @@ class ExcelToolApp:
         main_sheet_combo = ttk.Combobox(dlg, state="readonly")
         main_sheet_combo.pack(fill="x", padx=15, pady=5)
 
-        ttk.Label(dlg, text="Key Column (Main):", style="TLabel").pack(pady=(5, 0))
-        main_key_combo = ttk.Combobox(dlg, state="readonly")
-        main_key_combo.pack(fill="x", padx=15, pady=5)
+        ttk.Label(dlg, text="Key Column(s) (Main):", style="TLabel").pack(pady=(5, 0))
+        main_key_list = tk.Listbox(
+            dlg, selectmode="multiple", height=3, exportselection=False,
+            bg="#232946", fg="#eebbc3", selectbackground="#b8c1ec", selectforeground="#232946"
+        )
+        main_key_list.pack(fill="x", padx=15, pady=5)
 
 
         ttk.Label(dlg, text="Lookup File:", style="TLabel").pack(pady=(15, 0))
@@ -311,18 +993,50 @@ class ExcelToolApp:
         lookup_sheet_combo = ttk.Combobox(dlg, state="readonly")
         lookup_sheet_combo.pack(fill="x", padx=15, pady=5)
 
-        ttk.Label(dlg, text="Key Column (Lookup):", style="TLabel").pack(pady=(5, 0))
-        lookup_key_combo = ttk.Combobox(dlg, state="readonly")
-        lookup_key_combo.pack(fill="x", padx=15, pady=5)
+        ttk.Label(dlg, text="Key Column(s) (Lookup):", style="TLabel").pack(pady=(5, 0))
+        lookup_key_list = tk.Listbox(
+            dlg, selectmode="multiple", height=3, exportselection=False,
+            bg="#232946", fg="#eebbc3", selectbackground="#b8c1ec", selectforeground="#232946"
+        )
+        lookup_key_list.pack(fill="x", padx=15, pady=5)
 
         ttk.Label(dlg, text="Columns to Fetch (Lookup):", style="TLabel").pack(pady=(5, 0))
         lookup_cols_list = tk.Listbox(
-            dlg, selectmode="multiple", height=6,
+            dlg, selectmode="multiple", height=6, exportselection=False,
             bg="#232946", fg="#eebbc3", selectbackground="#b8c1ec", selectforeground="#232946"
         )
         lookup_cols_list.pack(fill="x", padx=15, pady=5)
 
 
+        ttk.Label(dlg, text="Match Mode:", style="TLabel").pack(pady=(5, 0))
+        mode_combo = ttk.Combobox(
+            dlg, state="readonly",
+            values=["exact", "approximate (largest key <= value, last key only)", "nearest (last key only)",
+                    "fuzzy (similar text, e.g. ACME Corp. ~ Acme Corporation)"]
+        )
+        mode_combo.pack(fill="x", padx=15, pady=5)
+        mode_combo.current(0)
+        ttk.Label(
+            dlg, text="Keys pair up in list order; other keys always match exactly.",
+            style="TLabel", font=("Segoe UI", 9, "italic")
+        ).pack()
+        threshold_frame = ttk.Frame(dlg)
+        threshold_frame.pack(pady=(2, 0))
+        ttk.Label(threshold_frame, text="Fuzzy: lowest match score (0-1):", style="TLabel").pack(side="left")
+        threshold_entry = ttk.Entry(threshold_frame, width=6)
+        threshold_entry.insert(0, str(FUZZY_THRESHOLD))
+        threshold_entry.pack(side="left", padx=5)
+
+        ttk.Label(dlg, text="Duplicate Lookup Keys:", style="TLabel").pack(pady=(5, 0))
+        policy_combo = ttk.Combobox(
+            dlg, state="readonly",
+            values=["first", "last", "error", "aggregate (sum numbers, join text)"]
+        )
+        policy_combo.pack(fill="x", padx=15, pady=5)
+        policy_combo.current(0)
+
+        get_normalize = self._normalize_checks(dlg)
+
         unique_var = tk.BooleanVar()
         tk.Checkbutton(
             dlg, text="Show Only Unique Differences (A vs B)", variable=unique_var,
@@ -331,7 +1045,7 @@ class ExcelToolApp:
 
         def update_main_sheets(_e=None):
             fp = self.files[main_file_combo.current()]
-            sheets = list(self.all_sheets[fp].keys())
+            sheets = self.all_sheets.sheet_names(fp)
             main_sheet_combo['values'] = sheets
 
             if self.current_preview_file == fp and self.current_preview_sheet in sheets:
@@ -343,14 +1057,18 @@ class ExcelToolApp:
         def update_main_cols(_e=None):
             fp = self.files[main_file_combo.current()]
             sh = main_sheet_combo.get()
-            df = self.all_sheets[fp][sh]
-            main_key_combo['values'] = list(df.columns)
-            if df.columns.size:
-                main_key_combo.current(0)
+            self._with_columns(dlg, fp, sh, fill_main_cols)
+
+        def fill_main_cols(cols):
+            main_key_list.delete(0, tk.END)
+            for c in cols:
+                main_key_list.insert(tk.END, c)
+            if cols:
+                main_key_list.selection_set(0)
 
         def update_lookup_sheets(_e=None):
             fp = self.files[lookup_file_combo.current()]
-            sheets = list(self.all_sheets[fp].keys())
+            sheets = self.all_sheets.sheet_names(fp)
             lookup_sheet_combo['values'] = sheets
             lookup_sheet_combo.current(0)
             update_lookup_cols()
@@ -358,11 +1076,14 @@ class ExcelToolApp:
         def update_lookup_cols(_e=None):
             fp = self.files[lookup_file_combo.current()]
             sh = lookup_sheet_combo.get()
-            df = self.all_sheets[fp][sh]
-            cols = list(df.columns)
-            lookup_key_combo['values'] = cols
+            self._with_columns(dlg, fp, sh, fill_lookup_cols)
+
+        def fill_lookup_cols(cols):
+            lookup_key_list.delete(0, tk.END)
+            for c in cols:
+                lookup_key_list.insert(tk.END, c)
             if cols:
-                lookup_key_combo.current(0)
+                lookup_key_list.selection_set(0)
             lookup_cols_list.delete(0, tk.END)
             for c in cols:
                 lookup_cols_list.insert(tk.END, c)
@@ -376,60 +1097,66 @@ class ExcelToolApp:
         update_lookup_sheets()
 
         def perform_vlookup():
-            try:
-
-                fp_main = self.files[main_file_combo.current()]
-                fp_lookup = self.files[lookup_file_combo.current()]
-                sh_main = main_sheet_combo.get()
-                sh_lookup = lookup_sheet_combo.get()
-                key_main = main_key_combo.get()
-                key_lookup = lookup_key_combo.get()
-                sel_idx = lookup_cols_list.curselection()
-                fetch_cols = [lookup_cols_list.get(i) for i in sel_idx]
-
-                if not key_main or not key_lookup:
-                    messagebox.showwarning("Warning", "Select key columns.")
-                    return
-
-                df_main = self.all_sheets[fp_main][sh_main]
-                df_lookup = self.all_sheets[fp_lookup][sh_lookup]
-
-                if unique_var.get():
-
-                    set_main = set(df_main[key_main].dropna().astype(str))
-                    set_lookup = set(df_lookup[key_lookup].dropna().astype(str))
-                    only_in_main = sorted(set_main - set_lookup)
-                    only_in_lookup = sorted(set_lookup - set_main)
-                    out_df = pd.DataFrame({
-                        f"Only in {os.path.basename(fp_main)}::{sh_main}": pd.Series(only_in_main),
-                        f"Only in {os.path.basename(fp_lookup)}::{sh_lookup}": pd.Series(only_in_lookup)
-                    })
-                else:
-
-                    if not fetch_cols:
-
-                        fetch_cols = [c for c in df_lookup.columns if c != key_lookup]
-
-                    cols = [key_lookup] + [c for c in fetch_cols if c != key_lookup]
-                    out_df = pd.merge(
-                        df_main,
-                        df_lookup[cols],
-                        left_on=key_main,
-                        right_on=key_lookup,
-                        how="left",
-                        suffixes=('', '_lk')
-                    )
+            fp_main = self.files[main_file_combo.current()]
+            fp_lookup = self.files[lookup_file_combo.current()]
+            sh_main = main_sheet_combo.get()
+            sh_lookup = lookup_sheet_combo.get()
+            keys_main = [main_key_list.get(i) for i in main_key_list.curselection()]
+            keys_lookup = [lookup_key_list.get(i) for i in lookup_key_list.curselection()]
+            sel_idx = lookup_cols_list.curselection()
+            fetch_cols = [lookup_cols_list.get(i) for i in sel_idx]
+            unique_only = unique_var.get()
+            mode = ("exact", "approximate", "nearest", "fuzzy")[mode_combo.current()]
+            policy = DUPLICATE_POLICIES[policy_combo.current()]
+            normalize = get_normalize()
+            threshold = self._threshold(threshold_entry)
+            if threshold is None:
+                return
+            # only a fuzzy match changes what the unique differences are
+            compare_mode = "fuzzy" if mode == "fuzzy" else "exact"
+            # unique differences always compare keys as text, so 1 and "1" are the same key
+            compare_normalize = tuple(dict.fromkeys(normalize + ("numeric_text",)))
 
-                    if key_main != key_lookup and key_lookup in out_df.columns:
-                        out_df.drop(columns=[key_lookup], inplace=True)
+            if not keys_main or not keys_lookup:
+                messagebox.showwarning("Warning", "Select key columns.")
+                return
+            if len(keys_main) != len(keys_lookup):
+                messagebox.showwarning("Warning", "Select the same number of key columns on both sides.")
+                return
 
-                self.result_df = out_df
-                self.current_preview_df = out_df
-                self._update_preview_tree(out_df)
-                self.set_status("VLOOKUP complete.")
-                dlg.destroy()
-            except Exception as e:
-                messagebox.showerror("Error", f"VLOOKUP failed:\n{e}")
+            # fuzzy matching works on the distinct keys in memory with either engine
+            ops = IN_MEMORY_OPS if mode == "fuzzy" else self.out_of_core or IN_MEMORY_OPS
+
+            def work(job):
+                if unique_only:
+                    return ops.run_compare(
+                        self.all_sheets, fp_main, sh_main, keys_main, fp_lookup, sh_lookup, keys_lookup,
+                        compare_normalize, progress=job.report, mode=compare_mode, threshold=threshold)
+                return ops.run_vlookup(
+                    self.all_sheets, fp_main, sh_main, keys_main, fp_lookup, sh_lookup, keys_lookup, fetch_cols,
+                    mode, policy, normalize, key_indexes=self.key_indexes, progress=job.report, threshold=threshold)
+
+            def done(result):
+                out_df, stats = result
+                sides = {"main": (fp_main, sh_main), "lookup": (fp_lookup, sh_lookup)}
+                if unique_only:
+                    step = self.pipeline.record(
+                        "compare", {"a": sides["main"], "b": sides["lookup"]}, cols_a=keys_main,
+                        cols_b=keys_lookup, normalize=compare_normalize, include_both=False, whole_rows=False,
+                        mode=compare_mode, threshold=threshold)
+                    self._show_result(out_df, f"Unique differences: {describe_compare(stats)}.", step, "Unique VLOOKUP")
+                else:
+                    step = self.pipeline.record(
+                        "vlookup", sides, keys_main=keys_main, keys_lookup=keys_lookup, fetch_cols=fetch_cols or None,
+                        mode=mode, policy=policy, normalize=normalize, threshold=threshold)
+                    self._show_result(out_df, f"VLOOKUP complete: {describe_match(stats)}.", step, "VLOOKUP")
+                if dlg.winfo_exists():
+                    dlg.destroy()
+
+            self.jobs.submit(
+                "VLOOKUP", work, on_done=done,
+                on_error=lambda e: messagebox.showerror("Error", f"VLOOKUP failed:\n{e}"),
+            )
 
         ttk.Button(dlg, text="Run VLOOKUP", command=perform_vlookup).pack(pady=15)
 
@@ -441,7 +1168,7 @@ class ExcelToolApp:
 
         dlg = tk.Toplevel(self.root)
         dlg.title("Compare Columns")
-        dlg.geometry("520x420")
+        dlg.geometry("540x720")
         dlg.configure(bg="#232946")
 
         fnames = [os.path.basename(p) for p in self.files]
@@ -456,9 +1183,12 @@ class ExcelToolApp:
         sheet_a_combo = ttk.Combobox(dlg, state="readonly")
         sheet_a_combo.pack(fill="x", padx=15, pady=5)
 
-        ttk.Label(dlg, text="Sheet A - Column:", style="TLabel").pack()
-        col_a_combo = ttk.Combobox(dlg, state="readonly")
-        col_a_combo.pack(fill="x", padx=15, pady=5)
+        ttk.Label(dlg, text="Sheet A - Column(s):", style="TLabel").pack()
+        col_a_list = tk.Listbox(
+            dlg, selectmode="multiple", height=4, exportselection=False,
+            bg="#232946", fg="#eebbc3", selectbackground="#b8c1ec", selectforeground="#232946"
+        )
+        col_a_list.pack(fill="x", padx=15, pady=5)
 
         # B
         ttk.Label(dlg, text="Sheet B - File:", style="TLabel").pack(pady=(15, 0))
@@ -470,13 +1200,43 @@ class ExcelToolApp:
         sheet_b_combo = ttk.Combobox(dlg, state="readonly")
         sheet_b_combo.pack(fill="x", padx=15, pady=5)
 
-        ttk.Label(dlg, text="Sheet B - Column:", style="TLabel").pack()
-        col_b_combo = ttk.Combobox(dlg, state="readonly")
-        col_b_combo.pack(fill="x", padx=15, pady=5)
+        ttk.Label(dlg, text="Sheet B - Column(s):", style="TLabel").pack()
+        col_b_list = tk.Listbox(
+            dlg, selectmode="multiple", height=4, exportselection=False,
+            bg="#232946", fg="#eebbc3", selectbackground="#b8c1ec", selectforeground="#232946"
+        )
+        col_b_list.pack(fill="x", padx=15, pady=5)
+
+        # text vs number mismatches ("1" vs 1) were equal in the old string-based compare
+        get_normalize = self._normalize_checks(dlg, checked=("numeric_text",))
+
+        opt_frame = ttk.Frame(dlg)
+        opt_frame.pack(pady=(5, 0))
+        both_var = tk.BooleanVar()
+        tk.Checkbutton(
+            opt_frame, text="Include values in both", variable=both_var,
+            bg="#232946", fg="#eebbc3", selectcolor="#232946", activebackground="#232946"
+        ).pack(side="left", padx=6)
+        rows_var = tk.BooleanVar()
+        tk.Checkbutton(
+            opt_frame, text="Show whole rows", variable=rows_var,
+            bg="#232946", fg="#eebbc3", selectcolor="#232946", activebackground="#232946"
+        ).pack(side="left", padx=6)
+
+        fuzzy_frame = ttk.Frame(dlg)
+        fuzzy_frame.pack(pady=(5, 0))
+        fuzzy_var = tk.BooleanVar()
+        tk.Checkbutton(
+            fuzzy_frame, text="Fuzzy match, lowest score (0-1):", variable=fuzzy_var,
+            bg="#232946", fg="#eebbc3", selectcolor="#232946", activebackground="#232946"
+        ).pack(side="left", padx=6)
+        threshold_entry = ttk.Entry(fuzzy_frame, width=6)
+        threshold_entry.insert(0, str(FUZZY_THRESHOLD))
+        threshold_entry.pack(side="left")
 
         def upd_a(_e=None):
             fp = self.files[file_a_combo.current()]
-            sheets = list(self.all_sheets[fp].keys())
+            sheets = self.all_sheets.sheet_names(fp)
             sheet_a_combo['values'] = sheets
             sheet_a_combo.current(0)
             upd_a_cols()
@@ -484,14 +1244,18 @@ class ExcelToolApp:
         def upd_a_cols(_e=None):
             fp = self.files[file_a_combo.current()]
             sh = sheet_a_combo.get()
-            df = self.all_sheets[fp][sh]
-            col_a_combo['values'] = list(df.columns)
-            if df.columns.size:
-                col_a_combo.current(0)
+            self._with_columns(dlg, fp, sh, fill_a_cols)
+
+        def fill_a_cols(cols):
+            col_a_list.delete(0, tk.END)
+            for c in cols:
+                col_a_list.insert(tk.END, c)
+            if cols:
+                col_a_list.selection_set(0)
 
         def upd_b(_e=None):
             fp = self.files[file_b_combo.current()]
-            sheets = list(self.all_sheets[fp].keys())
+            sheets = self.all_sheets.sheet_names(fp)
             sheet_b_combo['values'] = sheets
             sheet_b_combo.current(0)
             upd_b_cols()
@@ -499,10 +1263,14 @@ class ExcelToolApp:
         def upd_b_cols(_e=None):
             fp = self.files[file_b_combo.current()]
             sh = sheet_b_combo.get()
-            df = self.all_sheets[fp][sh]
-            col_b_combo['values'] = list(df.columns)
-            if df.columns.size:
-                col_b_combo.current(0)
+            self._with_columns(dlg, fp, sh, fill_b_cols)
+
+        def fill_b_cols(cols):
+            col_b_list.delete(0, tk.END)
+            for c in cols:
+                col_b_list.insert(tk.END, c)
+            if cols:
+                col_b_list.selection_set(0)
 
         file_a_combo.bind("<<ComboboxSelected>>", upd_a)
         sheet_a_combo.bind("<<ComboboxSelected>>", upd_a_cols)
@@ -511,37 +1279,156 @@ class ExcelToolApp:
 
         upd_a(); upd_b()
 
-        def run_compare():
-            try:
-                fp_a = self.files[file_a_combo.current()]
-                sh_a = sheet_a_combo.get()
-                col_a = col_a_combo.get()
-                fp_b = self.files[file_b_combo.current()]
-                sh_b = sheet_b_combo.get()
-                col_b = col_b_combo.get()
-
-                df_a = self.all_sheets[fp_a][sh_a]
-                df_b = self.all_sheets[fp_b][sh_b]
-
-                set_a = set(df_a[col_a].dropna().astype(str))
-                set_b = set(df_b[col_b].dropna().astype(str))
-
-                only_a = sorted(set_a - set_b)
-                only_b = sorted(set_b - set_a)
-
-                out_df = pd.DataFrame({
-                    f"Only in {os.path.basename(fp_a)}::{sh_a}": pd.Series(only_a),
-                    f"Only in {os.path.basename(fp_b)}::{sh_b}": pd.Series(only_b)
-                })
-                self.result_df = out_df
-                self.current_preview_df = out_df
-                self._update_preview_tree(out_df)
-                self.set_status("Column comparison complete.")
-                dlg.destroy()
-            except Exception as e:
-                messagebox.showerror("Error", f"Comparison failed:\n{e}")
+        def perform_compare():
+            fp_a = self.files[file_a_combo.current()]
+            sh_a = sheet_a_combo.get()
+            cols_a = [col_a_list.get(i) for i in col_a_list.curselection()]
+            fp_b = self.files[file_b_combo.current()]
+            sh_b = sheet_b_combo.get()
+            cols_b = [col_b_list.get(i) for i in col_b_list.curselection()]
+            normalize = get_normalize()
+            include_both = both_var.get()
+            whole_rows = rows_var.get()
+            mode = "fuzzy" if fuzzy_var.get() else "exact"
+            threshold = self._threshold(threshold_entry)
+
+            if not cols_a or len(cols_a) != len(cols_b):
+                messagebox.showwarning("Warning", "Select the same number of columns on both sides.")
+                return
+            if threshold is None:
+                return
+
+            # fuzzy matching works on the distinct keys in memory with either engine
+            ops = IN_MEMORY_OPS if mode == "fuzzy" else self.out_of_core or IN_MEMORY_OPS
+
+            def work(job):
+                return ops.run_compare(
+                    self.all_sheets, fp_a, sh_a, cols_a, fp_b, sh_b, cols_b, normalize,
+                    include_both, whole_rows, progress=job.report, mode=mode, threshold=threshold)
+
+            def done(result):
+                out_df, counts = result
+                step = self.pipeline.record(
+                    "compare", {"a": (fp_a, sh_a), "b": (fp_b, sh_b)}, cols_a=cols_a, cols_b=cols_b,
+                    normalize=normalize, include_both=include_both, whole_rows=whole_rows, mode=mode,
+                    threshold=threshold)
+                self._show_result(out_df, f"Column comparison complete: {describe_compare(counts)}.", step, "Compare")
+                if dlg.winfo_exists():
+                    dlg.destroy()
+
+            self.jobs.submit(
+                "Compare columns", work, on_done=done,
+                on_error=lambda e: messagebox.showerror("Error", f"Comparison failed:\n{e}"),
+            )
+
+        ttk.Button(dlg, text="Compare", command=perform_compare).pack(pady=15)
+
+    # two versions of a sheet matched on key columns: rows added, rows removed and changed cells
+    def compare_versions(self):
+        if not self.files:
+            messagebox.showwarning("Warning", "Load files first.")
+            return
+
+        dlg = tk.Toplevel(self.root)
+        dlg.title("Compare Versions")
+        dlg.geometry("500x620")
+        dlg.configure(bg="#232946")
+
+        fnames = [os.path.basename(p) for p in self.files]
+
+        ttk.Label(dlg, text="Old version - File:", style="TLabel").pack(pady=(10, 0))
+        file_a_combo = ttk.Combobox(dlg, values=fnames, state="readonly")
+        file_a_combo.pack(fill="x", padx=15, pady=5)
+        file_a_combo.current(0)
+
+        ttk.Label(dlg, text="Old version - Sheet:", style="TLabel").pack()
+        sheet_a_combo = ttk.Combobox(dlg, state="readonly")
+        sheet_a_combo.pack(fill="x", padx=15, pady=5)
 
-        ttk.Button(dlg, text="Compare", command=run_compare).pack(pady=15)
+        ttk.Label(dlg, text="New version - File:", style="TLabel").pack(pady=(15, 0))
+        file_b_combo = ttk.Combobox(dlg, values=fnames, state="readonly")
+        file_b_combo.pack(fill="x", padx=15, pady=5)
+        file_b_combo.current(1 if len(self.files) > 1 else 0)
+
+        ttk.Label(dlg, text="New version - Sheet:", style="TLabel").pack()
+        sheet_b_combo = ttk.Combobox(dlg, state="readonly")
+        sheet_b_combo.pack(fill="x", padx=15, pady=5)
+
+        ttk.Label(dlg, text="Key column(s), in both versions:", style="TLabel").pack(pady=(15, 0))
+        keys_list = tk.Listbox(
+            dlg, selectmode="multiple", height=6, exportselection=False,
+            bg="#232946", fg="#eebbc3", selectbackground="#b8c1ec", selectforeground="#232946"
+        )
+        keys_list.pack(fill="x", padx=15, pady=5)
+
+        get_normalize = self._normalize_checks(dlg)
+
+        ttk.Label(dlg, text="Report:", style="TLabel").pack(pady=(10, 0))
+        layout_combo = ttk.Combobox(
+            dlg, values=["One line per changed cell", "Whole rows with the changed columns"], state="readonly")
+        layout_combo.pack(fill="x", padx=15, pady=5)
+        layout_combo.current(0)
+
+        def upd_a(_e=None):
+            fp = self.files[file_a_combo.current()]
+            sheet_a_combo['values'] = self.all_sheets.sheet_names(fp)
+            sheet_a_combo.current(0)
+            upd_keys()
+
+        def upd_b(_e=None):
+            fp = self.files[file_b_combo.current()]
+            sheet_b_combo['values'] = self.all_sheets.sheet_names(fp)
+            sheet_b_combo.current(0)
+
+        def upd_keys(_e=None):
+            fp = self.files[file_a_combo.current()]
+            self._with_columns(dlg, fp, sheet_a_combo.get(), fill_keys)
+
+        def fill_keys(cols):
+            keys_list.delete(0, tk.END)
+            for c in cols:
+                keys_list.insert(tk.END, c)
+            if cols:
+                keys_list.selection_set(0)
+
+        file_a_combo.bind("<<ComboboxSelected>>", upd_a)
+        sheet_a_combo.bind("<<ComboboxSelected>>", upd_keys)
+        file_b_combo.bind("<<ComboboxSelected>>", upd_b)
+
+        upd_a(); upd_b()
+
+        def run_diff_job():
+            fp_a, sh_a = self.files[file_a_combo.current()], sheet_a_combo.get()
+            fp_b, sh_b = self.files[file_b_combo.current()], sheet_b_combo.get()
+            keys = [keys_list.get(i) for i in keys_list.curselection()]
+            normalize = get_normalize()
+            layout = DIFF_LAYOUTS[layout_combo.current()]
+            if not keys:
+                messagebox.showwarning("Warning", "Select at least one key column.")
+                return
+
+            # in memory with either engine: only rows whose hash changed are compared cell by cell
+            def work(job):
+                missing = [k for k in keys if k not in self.all_sheets.columns(fp_b, sh_b)]
+                if missing:
+                    raise ValueError(f"The new version has no column(s) {', '.join(map(str, missing))}")
+                return run_diff(self.all_sheets, fp_a, sh_a, keys, fp_b, sh_b, normalize=normalize,
+                                layout=layout, progress=job.report)
+
+            def done(result):
+                out_df, stats = result
+                step = self.pipeline.record(
+                    "diff", {"a": (fp_a, sh_a), "b": (fp_b, sh_b)}, keys_a=keys, normalize=normalize, layout=layout)
+                self._show_result(out_df, f"Version comparison complete: {describe_diff(stats)}.", step, "Diff")
+                if dlg.winfo_exists():
+                    dlg.destroy()
+
+            self.jobs.submit(
+                "Compare versions", work, on_done=done,
+                on_error=lambda e: messagebox.showerror("Error", f"Version comparison failed:\n{e}"),
+            )
+
+        ttk.Button(dlg, text="Compare", command=run_diff_job).pack(pady=15)
 
     def find_unique_values(self):
         if not self.files:
@@ -550,7 +1437,7 @@ class ExcelToolApp:
 
         dlg = tk.Toplevel(self.root)
         dlg.title("Find Unique Values")
-        dlg.geometry("420x300")
+        dlg.geometry("440x520")
         dlg.configure(bg="#232946")
 
         fnames = [os.path.basename(p) for p in self.files]
@@ -564,13 +1451,26 @@ class ExcelToolApp:
         sheet_combo = ttk.Combobox(dlg, state="readonly")
         sheet_combo.pack(fill="x", padx=15, pady=5)
 
-        ttk.Label(dlg, text="Column:", style="TLabel").pack()
-        col_combo = ttk.Combobox(dlg, state="readonly")
-        col_combo.pack(fill="x", padx=15, pady=5)
+        ttk.Label(dlg, text="Column(s) — several give distinct combinations:", style="TLabel").pack()
+        cols_list = tk.Listbox(
+            dlg, selectmode="multiple", height=8, exportselection=False,
+            bg="#232946", fg="#eebbc3", selectbackground="#b8c1ec", selectforeground="#232946"
+        )
+        cols_list.pack(fill="x", padx=15, pady=5)
+
+        counts_var = tk.BooleanVar()
+        tk.Checkbutton(
+            dlg, text="Count occurrences", variable=counts_var,
+            bg="#232946", fg="#eebbc3", selectcolor="#232946", activebackground="#232946"
+        ).pack()
+        ttk.Label(dlg, text="Order:", style="TLabel").pack()
+        sort_combo = ttk.Combobox(dlg, values=["First appearance", "Most frequent first"], state="readonly")
+        sort_combo.pack(fill="x", padx=15, pady=5)
+        sort_combo.current(0)
 
         def upd_s(_e=None):
             fp = self.files[file_combo.current()]
-            sheets = list(self.all_sheets[fp].keys())
+            sheets = self.all_sheets.sheet_names(fp)
             sheet_combo['values'] = sheets
             sheet_combo.current(0)
             upd_c()
@@ -578,33 +1478,180 @@ class ExcelToolApp:
         def upd_c(_e=None):
             fp = self.files[file_combo.current()]
             sh = sheet_combo.get()
-            df = self.all_sheets[fp][sh]
-            cols = list(df.columns)
-            col_combo['values'] = cols
+            self._with_columns(dlg, fp, sh, fill_c)
+
+        def fill_c(cols):
+            cols_list.delete(0, tk.END)
+            for c in cols:
+                cols_list.insert(tk.END, c)
             if cols:
-                col_combo.current(0)
+                cols_list.selection_set(0)
 
         file_combo.bind("<<ComboboxSelected>>", upd_s)
         sheet_combo.bind("<<ComboboxSelected>>", upd_c)
 
         upd_s()
 
-        def run_unique():
+        def selected():
+            cols = [cols_list.get(i) for i in cols_list.curselection()]
+            if not cols:
+                messagebox.showwarning("Warning", "Select at least one column.")
+            return cols
+
+        def find_unique():
+            fp = self.files[file_combo.current()]
+            sh = sheet_combo.get()
+            cols = selected()
+            if not cols:
+                return
+            col = cols[0] if len(cols) == 1 else cols
+            counts = counts_var.get()
+            sort = UNIQUE_SORTS[sort_combo.current()]
+            ops = self.out_of_core or IN_MEMORY_OPS
+
+            def work(job):
+                return ops.run_unique(self.all_sheets, fp, sh, col, progress=job.report, counts=counts, sort=sort)
+
+            def done(uniq):
+                step = self.pipeline.record("unique", {"sheet": (fp, sh)}, col=col, counts=counts, sort=sort)
+                what = "unique value(s)" if len(cols) == 1 else "distinct combination(s)"
+                self._show_result(uniq, f"Found {len(uniq):,} {what}.", step, "Find unique")
+                if dlg.winfo_exists():
+                    dlg.destroy()
+
+            self.jobs.submit(
+                "Find unique", work, on_done=done,
+                on_error=lambda e: messagebox.showerror("Error", f"Unique extraction failed:\n{e}"),
+            )
+
+        # every open sheet that has the selected columns, streamed; the counts are estimates
+        def estimate_all():
+            cols = selected()
+            if not cols:
+                return
             try:
-                fp = self.files[file_combo.current()]
-                sh = sheet_combo.get()
-                col = col_combo.get()
-                df = self.all_sheets[fp][sh]
-                uniq = pd.DataFrame(df[col].dropna().astype(str).unique(), columns=[f"Unique_{col}"])
-                self.result_df = uniq
-                self.current_preview_df = uniq
-                self._update_preview_tree(uniq)
-                self.set_status(f"Found {len(uniq)} unique value(s).")
-                dlg.destroy()
-            except Exception as e:
-                messagebox.showerror("Error", f"Unique extraction failed:\n{e}")
+                top_k = int(top_entry.get())
+            except ValueError:
+                messagebox.showwarning("Warning", "Top values must be a whole number.")
+                return
+            chunks = self.out_of_core.iter_chunks if self.out_of_core is not None else None
+
+            def work(job):
+                sources = [(fp, sh) for fp in self.files for sh in self.all_sheets.sheet_names(fp)
+                           if all(c in map(str, self.all_sheets.columns(fp, sh)) for c in cols)]
+                return run_distinct_stats(self.all_sheets, sources, cols, top_k, chunks=chunks, progress=job.report)
+
+            def done(result):
+                top, stats = result
+                self._show_result(top, f"Top {len(top):,}: {describe_distinct(stats)}.", label="Distinct estimate")
+                if dlg.winfo_exists():
+                    dlg.destroy()
+
+            self.jobs.submit(
+                "Estimate distinct values", work, on_done=done,
+                on_error=lambda e: messagebox.showerror("Error", f"Estimate failed:\n{e}"),
+            )
+
+        ttk.Button(dlg, text="Find Unique", command=find_unique).pack(pady=(15, 5))
+        across = ttk.Frame(dlg)
+        across.pack(pady=5)
+        ttk.Label(across, text="Top values:", style="TLabel").pack(side="left")
+        top_entry = ttk.Entry(across, width=6)
+        top_entry.insert(0, "20")
+        top_entry.pack(side="left", padx=5)
+        ttk.Button(across, text="Estimate Across All Open Sheets", command=estimate_all).pack(side="left")
+
+    # one sheet (or every sheet matching a pattern) of several workbooks appended into a new
+    # in-memory workbook, listed with the files so the other operations can read it
+    def stack_sheets(self):
+        if not self.files:
+            messagebox.showwarning("Warning", "Load files first.")
+            return
+
+        dlg = tk.Toplevel(self.root)
+        dlg.title("Stack Sheets")
+        dlg.geometry("460x560")
+        dlg.configure(bg="#232946")
+
+        ttk.Label(dlg, text="Files:", style="TLabel").pack(pady=(10, 0))
+        files_list = tk.Listbox(
+            dlg, selectmode="multiple", height=8, exportselection=False,
+            bg="#232946", fg="#eebbc3", selectbackground="#b8c1ec", selectforeground="#232946"
+        )
+        files_list.pack(fill="x", padx=15, pady=5)
+        for i, p in enumerate(self.files):
+            files_list.insert(tk.END, os.path.basename(p))
+            if os.path.isfile(p):   # earlier stacked results are left out unless picked
+                files_list.selection_set(i)
+
+        ttk.Label(dlg, text="Sheet name or pattern (* ? wildcards; empty = first sheet):", style="TLabel").pack()
+        names = list(dict.fromkeys(sh for p in self.files for sh in self.all_sheets.sheet_names(p)))
+        sheet_combo = ttk.Combobox(dlg, values=names)
+        sheet_combo.pack(fill="x", padx=15, pady=5)
+        if names:
+            sheet_combo.set(names[0])
+        match_var = tk.StringVar()
+        ttk.Label(dlg, textvariable=match_var, style="TLabel").pack()
+
+        ttk.Label(dlg, text="Source column:", style="TLabel").pack(pady=(10, 0))
+        source_entry = ttk.Entry(dlg)
+        source_entry.insert(0, STACK_SOURCE_COLUMN)
+        source_entry.pack(fill="x", padx=15, pady=5)
+        ttk.Label(dlg, text="Result name:", style="TLabel").pack()
+        name_entry = ttk.Entry(dlg)
+        name_entry.insert(0, "Stacked")
+        name_entry.pack(fill="x", padx=15, pady=5)
+
+        def sources():
+            paths = [self.files[i] for i in files_list.curselection()]
+            return match_sheets(self.all_sheets, paths, sheet_combo.get())
+
+        def upd_match(_e=None):
+            found = sources()
+            match_var.set(f"{len(found)} sheet(s) in {len({p for p, _sh in found})} file(s)")
+
+        files_list.bind("<<ListboxSelect>>", upd_match)
+        sheet_combo.bind("<<ComboboxSelected>>", upd_match)
+        sheet_combo.bind("<KeyRelease>", upd_match)
+        upd_match()
+
+        def stack():
+            found = sources()
+            if not found:
+                messagebox.showwarning("Warning", "No selected file has a matching sheet.")
+                return
+            source_col = source_entry.get().strip() or STACK_SOURCE_COLUMN
+            name = name_entry.get().strip().replace("/", "_").replace("\\", "_") or "Stacked"
+            path = f"<{name}>"
+
+            def work(job):
+                return run_stack(self.all_sheets, found, source_col, progress=job.report)
+
+            def done(result):
+                df, report = result
+                if path in self.all_sheets:
+                    self.all_sheets.remove(path)
+                self.all_sheets.attach(path, STACKED_SHEET, df)
+                self.pipeline.record("stack", {f"sheet{i}": src for i, src in enumerate(found, 1)},
+                                     replaces=(path, STACKED_SHEET), source_col=source_col)
+                if path not in self.files:
+                    self.files.append(path)
+                    self._refresh_file_list()
+                self.preview_file_combo['values'] = [os.path.basename(p) for p in self.files]
+                self.preview_file_combo.current(self.files.index(path))
+                self._update_preview_sheet_combo()
+                self._set_current_preview(path, STACKED_SHEET)
+                self._update_memory()
+                self.set_status(f"{describe_stack(report)} → {name}.")
+                if dlg.winfo_exists():
+                    dlg.destroy()
+
+            self.jobs.submit(
+                f"Stack {len(found)} sheets", work, on_done=done,
+                on_error=lambda e: messagebox.showerror("Error", f"Stacking failed:\n{e}"),
+            )
 
-        ttk.Button(dlg, text="Find Unique", command=run_unique).pack(pady=15)
+        ttk.Button(dlg, text="Stack", command=stack).pack(pady=15)
 
     def concat_columns(self):
         if not self.files:
@@ -615,7 +1662,7 @@ class ExcelToolApp:
     def _concat_dialog(self):
         dlg = tk.Toplevel(self.root)
         dlg.title("Concatenate Columns")
-        dlg.geometry("500x500")
+        dlg.geometry("500x700")
         dlg.configure(bg="#232946")
 
         fnames = [os.path.basename(p) for p in self.files]
@@ -633,7 +1680,7 @@ class ExcelToolApp:
         sheet_combo.pack(fill="x", padx=15, pady=5)
 
         cols_list = tk.Listbox(
-            dlg, selectmode="multiple", height=8,
+            dlg, selectmode="multiple", height=8, exportselection=False,
             bg="#232946", fg="#eebbc3", selectbackground="#b8c1ec", selectforeground="#232946"
         )
         cols_list.pack(fill="x", padx=15, pady=5)
@@ -656,9 +1703,39 @@ class ExcelToolApp:
         res_entry.insert(0, "Concatenated")
         res_entry.pack(fill="x", padx=15, pady=5)
 
+        # per-column formats: strftime for dates ("%d/%m/%Y"), "%.2f" / "{:,.2f}" for numbers
+        ttk.Label(dlg, text="Column Format (dates: %d/%m/%Y, numbers: {:,.2f}):", style="TLabel").pack(pady=(5, 0))
+        fmt_frame = ttk.Frame(dlg)
+        fmt_frame.pack(fill="x", padx=15, pady=5)
+        fmt_col_combo = ttk.Combobox(fmt_frame, state="readonly", width=20)
+        fmt_col_combo.pack(side="left")
+        fmt_entry = ttk.Entry(fmt_frame, width=16)
+        fmt_entry.pack(side="left", padx=5, fill="x", expand=True)
+        formats = {}
+        fmt_var = tk.StringVar(value="")
+        ttk.Label(dlg, textvariable=fmt_var, style="TLabel", font=("Segoe UI", 9, "italic")).pack()
+
+        def set_format():
+            col = fmt_col_combo.get()
+            if not col:
+                return
+            if fmt_entry.get().strip():
+                formats[col] = fmt_entry.get().strip()
+            else:
+                formats.pop(col, None)
+            fmt_var.set("; ".join(f"{c}: {f}" for c, f in formats.items()))
+
+        ttk.Button(fmt_frame, text="Set", command=set_format).pack(side="left")
+
+        skip_var = tk.BooleanVar()
+        tk.Checkbutton(
+            dlg, text="Skip empty values (no doubled separators)", variable=skip_var,
+            bg="#232946", fg="#eebbc3", selectcolor="#232946", activebackground="#232946"
+        ).pack(pady=4)
+
         def upd_sh(_e=None):
             fp = self.files[file_combo.current()]
-            sheets = list(self.all_sheets[fp].keys())
+            sheets = self.all_sheets.sheet_names(fp)
             sheet_combo['values'] = sheets
             if self.current_preview_file == fp and self.current_preview_sheet in sheets:
                 sheet_combo.set(self.current_preview_sheet)
@@ -669,10 +1746,15 @@ class ExcelToolApp:
         def upd_cols(_e=None):
             fp = self.files[file_combo.current()]
             sh = sheet_combo.get()
-            df = self.all_sheets[fp][sh]
+            self._with_columns(dlg, fp, sh, fill_cols)
+
+        def fill_cols(cols):
             cols_list.delete(0, tk.END)
-            for c in df.columns:
+            for c in cols:
                 cols_list.insert(tk.END, c)
+            fmt_col_combo['values'] = cols
+            formats.clear()
+            fmt_var.set("")
 
         file_combo.bind("<<ComboboxSelected>>", upd_sh)
         sheet_combo.bind("<<ComboboxSelected>>", upd_cols)
@@ -687,22 +1769,32 @@ class ExcelToolApp:
             cols = [cols_list.get(i) for i in sel_idx]
             fp = self.files[file_combo.current()]
             sh = sheet_combo.get()
-            df = self.all_sheets[fp][sh]
-            sep = sep_entry.get()
-            pre = pre_entry.get()
-            suf = suf_entry.get()
             res = res_entry.get().strip() or "Concatenated"
-            try:
-                preview_df = df.copy()
-                preview_df[res] = pre + df[cols].fillna("").astype(str).agg(sep.join, axis=1) + suf
-            except Exception as e:
-                messagebox.showerror("Error", f"Preview failed:\n{e}")
-                return
-            self._show_concat_preview_window(preview_df, fp, sh, cols, sep, pre, suf, res)
+            spec = {
+                "cols": cols, "sep": sep_entry.get(), "prefix": pre_entry.get(), "suffix": suf_entry.get(),
+                "formats": {c: f for c, f in formats.items() if c in cols}, "skip_empty": skip_var.get(),
+            }
+
+            ops = self.out_of_core
+
+            def work(job):
+                version = self.all_sheets.version(fp, sh)
+                if ops is not None:
+                    # spilled preview; applying it to the sheet recomputes it in memory
+                    return ops.run_concat(self.all_sheets, fp, sh, res_name=res, progress=job.report, **spec), version, None
+                base = self.all_sheets.get(fp, sh)     # kept for undo; shares buffers with the preview
+                return run_concat(self.all_sheets, fp, sh, res_name=res, progress=job.report, **spec), version, base
+
+            self.jobs.submit(
+                "Concatenate preview", work,
+                on_done=lambda result: self._show_concat_preview_window(
+                    result[0], fp, sh, spec, res, result[1], result[2]),
+                on_error=lambda e: messagebox.showerror("Error", f"Preview failed:\n{e}"),
+            )
 
         ttk.Button(dlg, text="Preview Result (Full Screen)", command=preview_concat).pack(pady=15)
 
-    def _show_concat_preview_window(self, preview_df, fp, sh, cols, sep, pre, suf, res_name):
+    def _show_concat_preview_window(self, preview_df, fp, sh, spec, res_name, version, base):
         win = tk.Toplevel(self.root)
         win.title("Concatenation Preview")
         try:
@@ -713,61 +1805,53 @@ class ExcelToolApp:
         lbl = ttk.Label(win, text=f"Preview: {os.path.basename(fp)} / {sh} → {res_name}", style="TLabel")
         lbl.pack(pady=5)
 
-        frame = ttk.Frame(win)
-        frame.pack(fill="both", expand=True, padx=10, pady=10)
-
-        tree = ttk.Treeview(frame, show="headings")
-        tree.pack(side="left", fill="both", expand=True)
-        vsb = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
-        vsb.pack(side="right", fill="y")
-        hsb = ttk.Scrollbar(win, orient="horizontal", command=tree.xview)
-        hsb.pack(fill="x")
-        tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-
-        tree["columns"] = list(preview_df.columns)
-        for c in preview_df.columns:
-            tree.heading(c, text=c)
-            tree.column(c, width=150, anchor="w")
-
-        for _, row in preview_df.head(1000).iterrows():
-            tree.insert("", "end", values=list(row))
-
         btn_frame = ttk.Frame(win)
-        btn_frame.pack(fill="x", pady=10, padx=10)
+        btn_frame.pack(side="bottom", fill="x", pady=10, padx=10)
+
+        grid = VirtualGrid(win, col_width=150)
+        grid.pack(fill="both", expand=True, padx=10, pady=10)
+        grid.set_data(preview_df)
 
         def apply_concat():
-            df = self.all_sheets[fp][sh].copy()
-            try:
-                df[res_name] = pre + df[cols].fillna("").astype(str).agg(sep.join, axis=1) + suf
-            except Exception as e:
-                messagebox.showerror("Error", f"Apply failed:\n{e}")
+            def work(job):
+                before = self.all_sheets.get(fp, sh)
+                return run_concat(self.all_sheets, fp, sh, res_name=res_name, progress=job.report, **spec), before
+
+            def done(result):
+                df, before = result
+                # Persist
+                self.all_sheets.set(fp, sh, df)
+                # later steps reading this sheet now depend on the concat step
+                producer = self.pipeline.producer(fp, sh)
+                step = self.pipeline.record("concat", {"sheet": (fp, sh)}, replaces=(fp, sh), res_name=res_name, **spec)
+                self.history.push(SheetChange(
+                    self.all_sheets, fp, sh, before, df, f"Concatenate → {res_name}", tag=(producer, step)))
+                self._update_history_menu()
+                if self.current_preview_file == fp and self.current_preview_sheet == sh:
+                    self.current_preview_df = df
+                    self.result_df = df
+                    self.result_ref = (fp, sh)
+                    self._update_preview_tree(df)
+                self.set_status(f"Concatenated → {res_name}")
+                messagebox.showinfo("Success", f"Column '{res_name}' added.")
+                if win.winfo_exists():
+                    win.destroy()
+
+            # the preview already is the sheet plus the new column unless the sheet changed since
+            if self.all_sheets.version(fp, sh) == version and isinstance(preview_df, pd.DataFrame):
+                done((preview_df, base))
                 return
-            # Persist
-            self.all_sheets[fp][sh] = df
-            if self.current_preview_file == fp and self.current_preview_sheet == sh:
-                self.current_preview_df = df
-                self.result_df = df
-                self._update_preview_tree(df)
-            self.set_status(f"Concatenated → {res_name}")
-            messagebox.showinfo("Success", f"Column '{res_name}' added.")
-            win.destroy()
+            self.jobs.submit(
+                "Apply concatenation", work, on_done=done,
+                on_error=lambda e: messagebox.showerror("Error", f"Apply failed:\n{e}"),
+            )
 
         def download_concat():
-            path = filedialog.asksaveasfilename(
-                defaultextension=".xlsx",
-                filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")],
-                title="Save Concatenated Result As"
-            )
-            if not path:
-                return
-            try:
-                if path.lower().endswith(".csv"):
-                    preview_df.to_csv(path, index=False)
-                else:
-                    preview_df.to_excel(path, index=False)
-                messagebox.showinfo("Saved", f"File saved:\n{path}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Save failed:\n{e}")
+            def saved(path):
+                step = self.pipeline.record("concat", {"sheet": (fp, sh)}, res_name=res_name, **spec)
+                self.pipeline.record("export", {"data": step}, output=path)
+
+            self._save_frame(preview_df, "Save Concatenated Result As", on_saved=saved)
 
         ttk.Button(btn_frame, text="Apply to Sheet", command=apply_concat).pack(side="right", padx=5)
         ttk.Button(btn_frame, text="Download Excel", command=download_concat).pack(side="right", padx=5)
@@ -785,27 +1869,11 @@ class ExcelToolApp:
         except Exception:
             win.geometry("1200x700")
 
-        frame = ttk.Frame(win)
-        frame.pack(fill="both", expand=True, padx=10, pady=10)
-
-        tree = ttk.Treeview(frame, show="headings")
-        tree.pack(side="left", fill="both", expand=True)
-
-        vsb = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
-        vsb.pack(side="right", fill="y")
-        hsb = ttk.Scrollbar(win, orient="horizontal", command=tree.xview)
-        hsb.pack(fill="x")
-        tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
-
-        tree["columns"] = list(df.columns)
-        for c in df.columns:
-            tree.heading(c, text=c)
-            tree.column(c, width=150, anchor="w")
-
-        for _, row in df.iterrows():
-            tree.insert("", "end", values=list(row))
+        ttk.Button(win, text="Download", command=self.export_result).pack(side="bottom", pady=8)
 
-        ttk.Button(win, text="Download", command=self.export_result).pack(pady=8)
+        grid = VirtualGrid(win, col_width=150)
+        grid.pack(fill="both", expand=True, padx=10, pady=10)
+        grid.set_data(df)
 
 
     def export_result(self):
@@ -814,30 +1882,414 @@ class ExcelToolApp:
             messagebox.showwarning("Warning", "No result data to export.")
             return
 
+        ref = self.result_ref
+        if self.result_df is None:
+            ref = (self.current_preview_file, self.current_preview_sheet) if self.current_preview_file else None
+
+        def saved(path):
+            if ref is not None:
+                self.pipeline.record("export", {"data": ref}, output=path)
+
+        self._save_frame(df, "Save Result As", on_saved=saved)
+
+    # on_saved(path) runs once the file is written
+    def _save_frame(self, df, title, on_saved=None):
         path = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
-            filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv")],
-            title="Save Result As"
+            filetypes=EXPORT_FILETYPES,
+            title=title
         )
         if not path:
             return
 
-        try:
-            if path.lower().endswith(".csv"):
-                df.to_csv(path, index=False)
-            else:
-                df.to_excel(path, index=False)
-            messagebox.showinfo("Export Complete", f"File saved:\n{path}")
+        def work(job):
+            return export_frame(df, path, progress=job.report)
+
+        def done(sheets):
+            msg = f"File saved:\n{path}"
+            if sheets > 1:
+                msg += f"\n\n{len(df):,} rows exceed one Excel sheet; split across {sheets} sheets."
+            if on_saved is not None:
+                on_saved(path)
+            messagebox.showinfo("Export Complete", msg)
             self.set_status(f"Exported to {path}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Export failed:\n{e}")
 
+        self.jobs.submit(
+            f"Export {os.path.basename(path)}", work, on_done=done,
+            on_error=lambda e: messagebox.showerror("Error", f"Export failed:\n{e}"),
+        )
+
+
+    # ---------- Pipelines ----------
+    def save_pipeline(self):
+        if not len(self.pipeline):
+            messagebox.showwarning("Warning", "No steps recorded yet. Run an operation first.")
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".json", filetypes=[("Pipeline files", "*.json")], title="Save Pipeline As")
+        if not path:
+            return
+        try:
+            self.pipeline.save(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save the pipeline:\n{e}")
+            return
+        self.set_status(f"Saved {len(self.pipeline)} step(s) to {path}")
+
+    def clear_pipeline(self):
+        self.pipeline.clear()
+        self.set_status("Recorded steps cleared.")
+
+    def run_pipeline(self):
+        path = filedialog.askopenfilename(filetypes=[("Pipeline files", "*.json")], title="Open Pipeline")
+        if not path:
+            return
+        try:
+            pipeline = Pipeline.load(path)
+        except PipelineError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
+        dlg = tk.Toplevel(self.root)
+        dlg.title(f"Run Pipeline - {os.path.basename(path)}")
+        dlg.geometry("640x520")
+        dlg.configure(bg="#232946")
+
+        ttk.Label(dlg, text="Steps:", style="TLabel").pack(pady=(10, 0))
+        steps_list = tk.Listbox(dlg, height=8, bg="#eebbc3", fg="#232946", font=("Segoe UI", 10))
+        steps_list.pack(fill="both", expand=True, padx=15, pady=5)
+        for step in pipeline.steps:
+            steps_list.insert(tk.END, pipeline.describe_step(step))
+
+        # each source can point at another workbook for this run
+        ttk.Label(dlg, text="Source workbooks:", style="TLabel").pack(pady=(10, 0))
+        entries = {}
+        for name, source in pipeline.sources.items():
+            row = ttk.Frame(dlg)
+            row.pack(fill="x", padx=15, pady=2)
+            ttk.Label(row, text=f"{name}:", style="TLabel", width=14).pack(side="left")
+            entry = ttk.Entry(row)
+            entry.insert(0, source)
+            entry.pack(side="left", fill="x", expand=True, padx=5)
+
+            def browse(entry=entry):
+                chosen = filedialog.askopenfilename(
+                    parent=dlg, filetypes=[("Excel files", "*.xlsx *.xlsm *.xlsb *.xls")])
+                if chosen:
+                    entry.delete(0, tk.END)
+                    entry.insert(0, chosen)
+
+            ttk.Button(row, text="...", width=3, command=browse).pack(side="left")
+            entries[name] = entry
+
+        def run():
+            sources = {name: entry.get().strip() for name, entry in entries.items()}
+            runner = self._runner()
+
+            def work(job):
+                return runner.run(pipeline, sources, progress=job.report)
+
+            def done(result):
+                lines = [f"{status:>6}  {pipeline.describe_step(step)}" + (f": {msg}" if msg else "")
+                         for step, status, msg in result.steps]
+                if result.result is not None:
+                    self._show_result(result.result, f"Pipeline complete: {result.describe()}.", label="Pipeline")
+                else:
+                    self.set_status(f"Pipeline complete: {result.describe()}.")
+                messagebox.showinfo("Pipeline Complete", result.describe() + "\n\n" + "\n".join(lines))
+                if dlg.winfo_exists():
+                    dlg.destroy()
+
+            self.jobs.submit(
+                f"Pipeline {os.path.basename(path)}", work, on_done=done,
+                on_error=lambda e: messagebox.showerror("Error", f"Pipeline failed:\n{e}"),
+            )
+
+        ttk.Button(dlg, text="Run", command=run).pack(pady=15)
+
+    def _runner(self):
+        if self.pipeline_runner is None:
+            self.pipeline_runner = PipelineRunner()
+            self.pipeline_runner.registry.parse_executor = self.jobs.processes
+        return self.pipeline_runner
+
+    # ---------- Undo / redo ----------
+    def undo(self):
+        self._step_history(self.history.undo, "Undid")
+
+    def redo(self):
+        self._step_history(self.history.redo, "Redid")
+
+    def _step_history(self, step, verb):
+        if self.jobs.jobs:
+            self.set_status("Wait for running jobs to finish before undo/redo.")
+            return
+        done = step()
+        if done is None:
+            return
+        change, df = done
+        if isinstance(change, SheetChange):
+            producer, step_id = change.tag
+            self.pipeline.set_producer(change.path, change.sheet, producer if verb == "Undid" else step_id)
+            if (self.current_preview_file, self.current_preview_sheet) == (change.path, change.sheet):
+                self.current_preview_df = df
+                self.result_df = df
+                self.result_ref = (change.path, change.sheet)
+                self._update_preview_tree(df)
+        self._update_history_menu()
+        self._update_memory()
+        self.set_status(f"{verb}: {change.label}")
+
+    def _update_history_menu(self):
+        for index, verb, label in ((0, "Undo", self.history.next_undo()), (1, "Redo", self.history.next_redo())):
+            self.edit_menu.entryconfig(
+                index, label=f"{verb} {label}" if label else verb, state="normal" if label else "disabled")
 
     def set_status(self, msg):
         self.status_var.set(msg)
-        self.root.update_idletasks()
+
+    def clear_cache(self):
+        if self._out_of_core_engine is not None:
+            self._out_of_core_engine.clear()
+        if self.all_sheets.disk_cache is None:
+            messagebox.showinfo("Cache", "The sheet cache is disabled.")
+            return
+        self.all_sheets.disk_cache.clear()
+        self._update_job_status(self.jobs.jobs)
+        self.set_status("Sheet cache cleared.")
+
+    def _update_job_status(self, jobs):
+        disk_cache = self.all_sheets.disk_cache
+        self.cache_var.set(disk_cache.describe() + "  " if disk_cache is not None else "")
+        if not jobs:
+            self.jobs_var.set("")
+            self.cancel_jobs_btn.pack_forget()
+            self._update_memory()
+            return
+        running = [j for j in jobs if j.state == "running"]
+        queued = len(jobs) - len(running)
+        parts = [j.describe() for j in running[:3]]
+        if len(running) > 3:
+            parts.append(f"+{len(running) - 3} running")
+        if queued:
+            parts.append(f"{queued} queued")
+        self.jobs_var.set("Jobs: " + " | ".join(parts) + "  ")
+        if not self.cancel_jobs_btn.winfo_ismapped():
+            self.cancel_jobs_btn.pack(side="right", padx=4)
+
+    # every frame the app holds: parsed sheets, the preview, the last result and pipeline steps
+    def _live_frames(self):
+        frames = {f"{os.path.basename(str(k[0]))} / {k[1]}" + (" (partial)" if len(k) > 2 else ""): df
+                  for k, df in self.all_sheets.frames().items()}
+        if self.pipeline_runner is not None:
+            for k, df in self.pipeline_runner.registry.frames().items():
+                frames[f"pipeline: {os.path.basename(str(k[0]))} / {k[1]}"] = df
+        frames["Preview"] = self.current_preview_df
+        frames["Result"] = self.result_df
+        return frames
+
+    # after every job, so only the buffers: the objects of object columns are left to Memory Usage
+    def _update_memory(self):
+        self.memory_var.set(describe_memory(memory_report(self._live_frames(), deep=False)) + "  ")
+
+    def show_memory(self):
+        report = memory_report(self._live_frames())
+        mb = 1024 ** 2
+        win = tk.Toplevel(self.root)
+        win.title("Memory Usage")
+        win.geometry("640x560")
+        ttk.Label(win, text=describe_memory(report), style="TLabel").pack(pady=(8, 0))
+        ttk.Label(win, text=f"Undo history: {self.history.describe()}", style="TLabel").pack(pady=(0, 8))
+        tree = ttk.Treeview(win, columns=("owned", "shared"), show="tree headings")
+        tree.heading("#0", text="Frame")
+        tree.heading("owned", text="Owned MB")
+        tree.heading("shared", text="Shared MB")
+        tree.column("owned", width=100, anchor="e")
+        tree.column("shared", width=100, anchor="e")
+        for name, usage in sorted(report["frames"].items(), key=lambda kv: -sum(kv[1].values())):
+            tree.insert("", "end", text=name, values=(f"{usage['owned'] / mb:,.1f}", f"{usage['shared'] / mb:,.1f}"))
+        tree.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+
+        ttk.Label(win, text="Compaction on load:", style="TLabel").pack()
+        sheets = ttk.Treeview(win, columns=("before", "after", "ratio"), show="tree headings", height=6)
+        sheets.heading("#0", text="Sheet")
+        for col, title in (("before", "Before MB"), ("after", "After MB"), ("ratio", "Saved")):
+            sheets.heading(col, text=title)
+            sheets.column(col, width=90, anchor="e")
+        for (path, sheet), (before, after) in self.all_sheets.compaction.items():
+            saved = 1 - after / before if before else 0
+            sheets.insert("", "end", text=f"{os.path.basename(path)} / {sheet}",
+                          values=(f"{before / mb:,.1f}", f"{after / mb:,.1f}", f"{saved:.0%}"))
+        sheets.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+
+    # timings of every operation and I/O step so far (engine.perf_log), refreshed while open
+    def show_performance(self):
+        if self._perf_win is not None and self._perf_win.winfo_exists():
+            self._perf_win.lift()
+            return
+        win = self._perf_win = tk.Toplevel(self.root)
+        win.title("Performance")
+        win.geometry("1100x680")
+        mb = 1024 ** 2
+
+        bar = ttk.Frame(win)
+        bar.pack(fill="x", padx=10, pady=8)
+        profile_var = tk.BooleanVar(value=perf_log.profile)
+        trace_var = tk.BooleanVar(value=perf_log.trace_memory)
+        auto_var = tk.BooleanVar(value=True)
+        for text, var, command in (
+                ("Profile operations (cProfile)", profile_var, lambda: setattr(perf_log, "profile", profile_var.get())),
+                ("Trace memory (tracemalloc)", trace_var,
+                 lambda: setattr(perf_log, "trace_memory", trace_var.get())),
+                ("Auto refresh", auto_var, None)):
+            tk.Checkbutton(
+                bar, text=text, variable=var, command=command,
+                bg="#232946", fg="#eebbc3", selectcolor="#232946", activebackground="#232946"
+            ).pack(side="left", padx=6)
+
+        ttk.Label(win, text="Totals per step:", style="TLabel").pack(anchor="w", padx=10)
+        totals = ttk.Treeview(win, columns=("calls", "total", "mean", "max", "rows"), show="tree headings", height=7)
+        totals.heading("#0", text="Step")
+        for col, title in (("calls", "Calls"), ("total", "Total s"), ("mean", "Mean ms"), ("max", "Max ms"),
+                           ("rows", "Rows")):
+            totals.heading(col, text=title)
+            totals.column(col, width=100, anchor="e")
+        totals.pack(fill="x", padx=10, pady=(0, 8))
+
+        ttk.Label(win, text="History (newest first; double-click for details or the profile):",
+                  style="TLabel").pack(anchor="w", padx=10)
+        cols = ("started", "seconds", "rows", "read", "written", "rss", "detail")
+        history = ttk.Treeview(win, columns=cols, show="tree headings")
+        history.heading("#0", text="Step")
+        history.column("#0", width=200)
+        for col, title, width in (("started", "Started", 80), ("seconds", "Seconds", 80), ("rows", "Rows", 90),
+                                  ("read", "Read MB", 80), ("written", "Written MB", 80), ("rss", "RSS Δ MB", 80),
+                                  ("detail", "Detail", 320)):
+            history.heading(col, text=title)
+            history.column(col, width=width, anchor="w" if col == "detail" else "e")
+        hsb = ttk.Scrollbar(win, orient="vertical", command=history.yview)
+        history.configure(yscrollcommand=hsb.set)
+        hsb.pack(side="right", fill="y", padx=(0, 10), pady=(0, 10))
+        history.pack(fill="both", expand=True, padx=(10, 0), pady=(0, 10))
+        records = {}
+
+        def megabytes(n):
+            return "" if n is None else f"{n / mb:,.1f}"
+
+        def refresh():
+            totals.delete(*totals.get_children())
+            for op, t in sorted(perf_log.totals().items(), key=lambda kv: -kv[1]["seconds"]):
+                totals.insert("", "end", text=op, values=(
+                    f"{t['calls']:,}", f"{t['seconds']:,.2f}", f"{1000 * t['seconds'] / t['calls']:,.1f}",
+                    f"{1000 * t['max']:,.1f}", f"{t['rows']:,}"))
+            history.delete(*history.get_children())
+            records.clear()
+            # spans finish inside out; by start (id) order a parent comes before its children
+            for rec in sorted(perf_log.records(), key=lambda r: r["id"]):
+                iid = str(rec["id"])
+                records[iid] = rec
+                parent = str(rec["parent"]) if rec["parent"] is not None else ""
+                if parent and not history.exists(parent):
+                    parent = ""     # dropped from the history (too quick, or too old)
+                detail = ", ".join(f"{k}: {v}" for k, v in rec.items() if k in ("sheet", "file", "source", "engine",
+                                                                                  "error", "columns"))
+                if "traced_peak" in rec:
+                    detail += f", traced peak {megabytes(rec['traced_peak'])} MB"
+                history.insert(parent, 0 if not parent else "end", iid, open=False,
+                               text=rec["op"] + ("  ⚠" if "error" in rec else "") + ("  ⏱" if "profile" in rec else ""),
+                               values=(time.strftime("%H:%M:%S", time.localtime(rec["started"])),
+                                       f"{rec['seconds']:,.3f}", f"{rec['rows']:,}" if "rows" in rec else "",
+                                       megabytes(rec.get("bytes_read")), megabytes(rec.get("bytes_written")),
+                                       megabytes(rec.get("rss_delta")), detail.lstrip(", ")))
+
+        def auto_refresh():
+            if not win.winfo_exists():
+                return
+            if auto_var.get():
+                refresh()
+            win.after(2000, auto_refresh)
+
+        def details(_e=None):
+            rec = records.get(history.focus())
+            if rec is None:
+                return
+            top = tk.Toplevel(win)
+            top.title(f"{rec['op']} — details")
+            top.geometry("900x600")
+            text = tk.Text(top, wrap="none", font=("Consolas", 10))
+            text.pack(fill="both", expand=True)
+            shown = {k: v for k, v in rec.items() if k != "profile"}
+            text.insert("end", json.dumps(shown, indent=2, default=str) + "\n\n")
+            text.insert("end", rec.get("profile") or "No profile: turn on Profile operations and run it again.")
+            text.configure(state="disabled")
+
+        def export():
+            path = filedialog.asksaveasfilename(
+                defaultextension=".json", filetypes=[("JSON", "*.json")], title="Export Performance Log", parent=win)
+            if not path:
+                return
+            try:
+                perf_log.save(path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Export failed:\n{e}", parent=win)
+                return
+            self.set_status(f"Performance log saved to {path}")
+
+        def clear():
+            perf_log.clear()
+            refresh()
+
+        history.bind("<Double-1>", details)
+        for text, command in (("Export JSON...", export), ("Clear", clear), ("Refresh", refresh)):
+            ttk.Button(bar, text=text, command=command).pack(side="right", padx=4)
+        auto_refresh()
+
+    # applies to sheets parsed from now on; loaded ones keep their dtypes
+    def _toggle_compaction(self):
+        self.all_sheets.compact = self.compact_var.get()
+        if self.pipeline_runner is not None:
+            self.pipeline_runner.registry.compact = self.compact_var.get()
+        self.set_status("Sheets will be compacted on load." if self.compact_var.get()
+                        else "Sheets will load with their parsed dtypes.")
+
+    def _toggle_out_of_core(self):
+        if not self.out_of_core_var.get():
+            self.out_of_core = None
+            self.set_status("Operations run in memory.")
+            return
+        if self._out_of_core_engine is None:
+            try:
+                self._out_of_core_engine = open_out_of_core()
+            except Exception as e:
+                self.out_of_core_var.set(False)
+                messagebox.showerror("Out-of-Core Engine", str(e))
+                return
+        self.out_of_core = self._out_of_core_engine
+        self.set_status("Operations run out of core: sheets spill to Parquet, results stay on disk.")
+
+    def _toggle_watching(self):
+        if not self.watch_var.get():
+            self.watcher.stop()
+            self.set_status("Open files are no longer watched for changes.")
+            return
+        if self.watcher.interval <= 0:
+            self.watcher.interval = 2.0     # ABG_WATCH_SECONDS=0 only turns it off at start
+        self.watcher.start()
+        self.set_status(f"Open files are reloaded when they change on disk (checked every {self.watcher.interval:g}s).")
+
+    def _cancel_jobs(self):
+        self.jobs.cancel_all()
+        self.set_status("Cancelling running jobs...")
+
+    def _on_close(self):
+        self.watcher.stop()
+        self.jobs.shutdown()
+        if self._out_of_core_engine is not None:
+            self._out_of_core_engine.close()
+        self.root.destroy()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # needed for the process pool in a frozen .exe
     root = tk.Tk()
     app = ExcelToolApp(root)
     root.mainloop()
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import DuplicateKeyError, approx_vlookup_frame
+
+
+def _bands(lower):
+    return pd.DataFrame({"from": lower, "band": ["low", "mid", "high"]})
+
+
+def test_approximate_takes_the_largest_key_not_above():
+    main = pd.DataFrame({"score": [5, 10, 49, 50, 120, -1]})
+    out, stats = approx_vlookup_frame(main, ["score"], _bands([0, 10, 50]), ["from"], ["band"])
+    assert out["band"].tolist()[:5] == ["low", "mid", "mid", "high", "high"]
+    assert pd.isna(out["band"].iloc[5])
+    assert stats["matched"] == 5
+
+
+def test_nearest():
+    main = pd.DataFrame({"score": [4, 6, 100]})
+    out, _ = approx_vlookup_frame(main, ["score"], _bands([0, 10, 50]), ["from"], ["band"], mode="nearest")
+    assert out["band"].tolist() == ["low", "mid", "high"]
+
+
+def test_int_keys_against_float_bands():
+    main = pd.DataFrame({"score": np.array([3, 12, 60], dtype=np.int64)})
+    out, _ = approx_vlookup_frame(main, ["score"], _bands([0.0, 10.5, 50.0]), ["from"], ["band"])
+    assert out["band"].tolist() == ["low", "mid", "high"]
+
+
+def test_narrow_int_keys_against_wider_ints():
+    main = pd.DataFrame({"score": np.array([3, 12, 60], dtype=np.int8)})
+    bands = _bands(np.array([0, 10, 50], dtype=np.int16))
+    out, _ = approx_vlookup_frame(main, ["score"], bands, ["from"], ["band"])
+    assert out["band"].tolist() == ["low", "mid", "high"]
+
+
+def test_nullable_keys_with_blanks():
+    main = pd.DataFrame({"score": pd.array([3, None, 60], dtype="Int64")})
+    out, stats = approx_vlookup_frame(main, ["score"], _bands([0.0, 10.0, 50.0]), ["from"], ["band"])
+    assert out["band"].iloc[0] == "low" and out["band"].iloc[2] == "high"
+    assert pd.isna(out["band"].iloc[1])
+    assert stats["matched"] == 2
+
+
+def test_dates_of_different_resolutions():
+    main = pd.DataFrame({"day": pd.to_datetime(["2024-01-15", "2024-03-02"]).as_unit("s")})
+    rates = pd.DataFrame({"from": pd.to_datetime(["2024-01-01", "2024-03-01"]).as_unit("ns"), "rate": [1.5, 2.0]})
+    out, _ = approx_vlookup_frame(main, ["day"], rates, ["from"], ["rate"])
+    assert out["rate"].tolist() == [1.5, 2.0]
+
+
+def test_text_keys_are_converted():
+    main = pd.DataFrame({"day": ["2024-02-10"]})
+    rates = pd.DataFrame({"from": pd.to_datetime(["2024-01-01", "2024-03-01"]), "rate": [1.5, 2.0]})
+    out, _ = approx_vlookup_frame(main, ["day"], rates, ["from"], ["rate"])
+    assert out["rate"].tolist() == [1.5]
+
+
+def test_date_against_number_is_refused():
+    main = pd.DataFrame({"day": pd.to_datetime(["2024-02-10"])})
+    with pytest.raises(ValueError, match="two numeric or two date keys"):
+        approx_vlookup_frame(main, ["day"], _bands([0, 10, 50]), ["from"], ["band"])
+
+
+def test_text_that_is_neither_is_refused():
+    main = pd.DataFrame({"score": ["high"]})
+    with pytest.raises(ValueError, match="numeric or date key"):
+        approx_vlookup_frame(main, ["score"], _bands([0, 10, 50]), ["from"], ["band"])
+
+
+def test_exact_keys_before_the_range_key():
+    main = pd.DataFrame({"region": ["N", "S", "N", "W"], "score": [15, 15, 5, 15]})
+    bands = pd.DataFrame({"region": ["N", "N", "S", "S"], "from": [0, 10, 0, 20], "band": ["n0", "n10", "s0", "s20"]})
+    out, stats = approx_vlookup_frame(main, ["region", "score"], bands, ["region", "from"], ["band"])
+    assert out["band"].tolist()[:3] == ["n10", "s0", "n0"]
+    assert pd.isna(out["band"].iloc[3])
+    assert stats["matched"] == 3
+
+
+def test_int_by_keys_against_float_by_keys():
+    main = pd.DataFrame({"grp": np.array([1, 2], dtype=np.int64), "score": [15, 15]})
+    bands = pd.DataFrame({"grp": [1.0, 2.0], "from": [10, 10], "band": ["one", "two"]})
+    out, _ = approx_vlookup_frame(main, ["grp", "score"], bands, ["grp", "from"], ["band"])
+    assert out["band"].tolist() == ["one", "two"]
+
+
+def test_duplicate_policies():
+    bands = pd.DataFrame({"from": [0, 10, 10], "band": ["low", "mid-1", "mid-2"]})
+    main = pd.DataFrame({"score": [12]})
+    first, stats = approx_vlookup_frame(main, ["score"], bands, ["from"], ["band"])
+    last, _ = approx_vlookup_frame(main, ["score"], bands, ["from"], ["band"], policy="last")
+    assert first["band"].tolist() == ["mid-1"]
+    assert last["band"].tolist() == ["mid-2"]
+    assert stats["duplicates"] == 1
+    with pytest.raises(DuplicateKeyError):
+        approx_vlookup_frame(main, ["score"], bands, ["from"], ["band"], policy="error")
+    with pytest.raises(ValueError):
+        approx_vlookup_frame(main, ["score"], bands, ["from"], ["band"], policy="aggregate")
+
+
+def test_keeps_main_order_and_index():
+    main = pd.DataFrame({"score": [60, 3, 12]}, index=[7, 8, 9])
+    out, _ = approx_vlookup_frame(main, ["score"], _bands([0, 10, 50]), ["from"], ["band"])
+    assert out.index.tolist() == [7, 8, 9]
+    assert out["band"].tolist() == ["high", "low", "mid"]
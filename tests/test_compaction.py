@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+from engine import (KeyIndex, SheetCache, SheetRegistry, approx_vlookup_frame, compact_column, compact_frame,
+                    compare_sets, normalize_frame, vlookup_frame)
+
+
+def _sheet(n=40):
+    return pd.DataFrame({
+        "id": np.arange(n, dtype=np.int64),
+        "qty": np.arange(n, dtype=np.int64) * 1000,
+        "price": np.arange(n) / 4,
+        "ratio": np.arange(n) / 3,
+        "region": ["North", "South"] * (n // 2),
+        "day": ["2024-01-%02d" % (i % 28 + 1) for i in range(n)],
+        "flag": [True, False] * (n // 2),
+    })
+
+
+def test_compact_frame_narrows_columns():
+    df = _sheet()
+    out, before, after = compact_frame(df)
+    assert out["id"].dtype == np.int8
+    assert out["qty"].dtype == np.int32
+    assert out["price"].dtype == np.float32     # quarters are exact in float32
+    assert out["ratio"].dtype == np.float64     # thirds are not
+    assert isinstance(out["region"].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_any_dtype(out["day"].dtype)
+    assert out["flag"].dtype == bool
+    assert after < before
+    assert list(out.columns) == list(df.columns)
+
+
+def test_compacted_values_are_unchanged():
+    df = _sheet()
+    out = compact_frame(df)[0]
+    for c in ("id", "qty", "price", "ratio", "flag"):
+        assert (out[c].astype(df[c].dtype) == df[c]).all()
+    assert out["region"].astype(object).tolist() == df["region"].tolist()
+    assert (out["day"] == pd.to_datetime(df["day"])).all()
+
+
+def test_text_left_alone():
+    mixed = pd.Series(["a", 1, "b", 2], dtype=object)
+    assert compact_column(mixed) is mixed
+    ambiguous = pd.Series(["03/04/2020", "03/04/2020", "05/06/2020"])
+    assert not pd.api.types.is_datetime64_any_dtype(compact_column(ambiguous).dtype)
+    blank = pd.Series([None, None], dtype=object)
+    assert compact_column(blank) is blank
+
+
+def test_duplicate_column_names_survive():
+    df = pd.DataFrame([[1, 2], [3, 4]], columns=["a", "a"])
+    out = compact_frame(df)[0]
+    assert list(out.columns) == ["a", "a"]
+    assert out.iloc[:, 1].tolist() == [2, 4]
+
+
+def test_registry_compacts_parsed_sheets(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    _sheet().to_excel(path, index=False)
+    registry = SheetRegistry(SheetCache(1 << 26), compact=True)
+    registry.open(path)
+    df = registry.get(path, "Sheet1")
+    assert df["id"].dtype == np.int8
+    before, after = registry.compaction[(path, "Sheet1")]
+    assert after < before
+
+
+# two sheets compacted apart end up with different dtypes for the same keys
+def _mismatched():
+    main = compact_frame(pd.DataFrame({"id": [3, 120, 7, 3], "region": ["N", "S", "N", "N"]}))[0]
+    lookup = compact_frame(pd.DataFrame({
+        "id": [3, 7, 120, 300, 3],
+        "region": ["N", "N", "S", "W", "E"],
+        "v": ["three", "seven", "big", "bigger", "dup"],
+    }))[0]
+    return main, lookup
+
+
+def test_mismatched_dtypes_after_compaction():
+    main, lookup = _mismatched()
+    assert main["id"].dtype == np.int8 and lookup["id"].dtype == np.int16
+    assert isinstance(main["region"].dtype, pd.CategoricalDtype)
+    assert not isinstance(lookup["region"].dtype, pd.CategoricalDtype)
+
+
+def test_exact_lookup_on_compacted_sheets():
+    main, lookup = _mismatched()
+    index = KeyIndex(normalize_frame(lookup, ["id"]), "first")
+    out, stats = vlookup_frame(main, ["id"], lookup, ["v"], index)
+    assert out["v"].tolist() == ["three", "big", "seven", "three"]
+    index = KeyIndex(normalize_frame(lookup, ["region", "id"]), "first")
+    out, _ = vlookup_frame(main, ["region", "id"], lookup, ["v"], index)
+    assert out["v"].tolist() == ["three", "big", "seven", "three"]
+
+
+def test_approximate_lookup_on_compacted_sheets():
+    main, lookup = _mismatched()
+    lookup = lookup.iloc[:4]
+    out, _ = approx_vlookup_frame(main, ["id"], lookup, ["id"], ["v"])
+    assert out["v"].tolist() == ["three", "big", "seven", "three"]
+    # categorical first key against text, then against categories of its own
+    out, _ = approx_vlookup_frame(main, ["region", "id"], lookup, ["region", "id"], ["v"])
+    assert out["v"].tolist() == ["three", "big", "seven", "three"]
+    categories = lookup.assign(region=lookup["region"].astype("category"))
+    out, _ = approx_vlookup_frame(main, ["region", "id"], categories, ["region", "id"], ["v"])
+    assert out["v"].tolist() == ["three", "big", "seven", "three"]
+
+
+def test_compare_on_compacted_sheets():
+    main, lookup = _mismatched()
+    assert compare_sets(main, ["id"], lookup, ["id"]).counts() == {"only_a": 0, "only_b": 1, "both": 3}
+    assert compare_sets(main, ["region", "id"], lookup, ["region", "id"]).counts()["both"] == 3
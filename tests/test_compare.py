@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from engine import compare_sets
+
+
+def test_counts_and_sorted_keys():
+    a = pd.DataFrame({"id": ["c", "a", "b", "a", None]})
+    b = pd.DataFrame({"code": ["b", "d", "e"]})
+    result = compare_sets(a, ["id"], b, ["code"])
+    assert result.counts() == {"only_a": 2, "only_b": 2, "both": 1}
+    assert list(result.only_a) == ["a", "c"]
+    assert list(result.only_b) == ["d", "e"]
+    assert list(result.both) == ["b"]
+
+
+def test_to_frame_lists_each_side():
+    a = pd.DataFrame({"id": ["a", "b", "c"]})
+    b = pd.DataFrame({"id": ["b"]})
+    out = compare_sets(a, ["id"], b, ["id"]).to_frame("A", "B", include_both=True)
+    assert list(out.columns) == ["Only in A", "Only in B", "In both"]
+    assert out["Only in A"].tolist() == ["a", "c"]
+    assert out["Only in B"].isna().all()
+    assert out["In both"].dropna().tolist() == ["b"]
+
+
+def test_composite_keys():
+    a = pd.DataFrame({"k1": ["x", "x", "y"], "k2": [1, 2, 1]})
+    b = pd.DataFrame({"k1": ["x", "y"], "k2": [2, 2]})
+    result = compare_sets(a, ["k1", "k2"], b, ["k1", "k2"])
+    assert result.counts() == {"only_a": 2, "only_b": 1, "both": 1}
+    out = result.to_frame("A", "B")
+    assert list(out.columns) == ["Only in A [k1]", "Only in A [k2]", "Only in B [k1]", "Only in B [k2]"]
+    assert out["Only in B [k2]"].dropna().tolist() == [2]
+
+
+def test_normalize_matches_case_spaces_and_number_text():
+    a = pd.DataFrame({"id": [" Acme", 12, 7.0]})
+    b = pd.DataFrame({"id": ["ACME ", "12", "7"]})
+    assert compare_sets(a, ["id"], b, ["id"]).counts()["both"] == 0
+    result = compare_sets(a, ["id"], b, ["id"], ("trim", "casefold", "numeric_text"))
+    assert result.counts() == {"only_a": 0, "only_b": 0, "both": 3}
+
+
+def test_mixed_numbers_and_text_sort():
+    a = pd.DataFrame({"id": ["b", 2, "a", 10]})
+    b = pd.DataFrame({"id": []}, dtype=object)
+    assert list(compare_sets(a, ["id"], b, ["id"]).only_a) == [10, 2, "a", "b"]
+
+
+def test_whole_rows_of_each_side():
+    a = pd.DataFrame({"id": ["a", "b", "a"], "v": [1, 2, 3]})
+    b = pd.DataFrame({"id": ["b", "c"], "w": [4, 5]})
+    result = compare_sets(a, ["id"], b, ["id"])
+    assert result.rows_a(a)["v"].tolist() == [1, 3]
+    assert result.rows_a(a, present=True)["v"].tolist() == [2]
+    rows = result.to_rows(a, b, "A", "B")
+    assert rows["Side"].tolist() == ["Only in A", "Only in A", "Only in B"]
+    assert rows["w"].dropna().tolist() == [5]
+
+
+def test_key_column_counts_must_agree():
+    a = pd.DataFrame({"k1": [1], "k2": [2]})
+    with pytest.raises(ValueError):
+        compare_sets(a, ["k1", "k2"], a, ["k1"])
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import compact_frame, describe_diff, diff_frames
+
+
+def _versions():
+    a = pd.DataFrame({"id": [1, 2, 3, 4], "name": ["a", "b", "c", "d"], "qty": [10, 20, 30, 40]})
+    b = pd.DataFrame({"id": [4, 2, 1, 5], "name": ["d", "B", "a", "e"], "qty": [40, 21, 10, 50]})
+    return a, b
+
+
+def test_counts():
+    a, b = _versions()
+    counts = diff_frames(a, ["id"], b).counts()
+    assert {k: counts[k] for k in ("added", "removed", "changed", "unchanged", "cells")} == \
+        {"added": 1, "removed": 1, "changed": 1, "unchanged": 2, "cells": 2}
+    assert counts["columns"] == 2
+
+
+def test_cells_report():
+    a, b = _versions()
+    out = diff_frames(a, ["id"], b).to_cells(a, b)
+    assert list(out.columns) == ["Change", "id", "Column", "Old", "New"]
+    assert out["Change"].tolist() == ["added", "removed", "changed", "changed"]
+    assert out["id"].tolist() == [5, 3, 2, 2]
+    changed = out[out["Change"] == "changed"]
+    assert changed[["Column", "Old", "New"]].values.tolist() == [["name", "b", "B"], ["qty", 20, 21]]
+    assert out.loc[out["Change"] != "changed", "Column"].isna().all()
+
+
+def test_rows_report():
+    a, b = _versions()
+    out = diff_frames(a, ["id"], b).to_rows(a, b)
+    assert out["Change"].tolist() == ["added", "removed", "changed"]
+    assert out["Changed Columns"].tolist() == ["", "", "name, qty"]
+    assert out["qty"].tolist() == [50, 30, 21]
+
+
+def test_keys_named_differently_and_composite():
+    a = pd.DataFrame({"k1": ["x", "x"], "k2": [1, 2], "v": [1, 2]})
+    b = pd.DataFrame({"c1": ["x", "x"], "c2": [2, 1], "v": [2, 5]})
+    diff = diff_frames(a, ["k1", "k2"], b, ["c1", "c2"])
+    assert diff.counts()["changed"] == 1
+    out = diff.to_cells(a, b)
+    assert out[["k1", "k2", "Old", "New"]].values.tolist() == [["x", 1, 1, 5]]
+
+
+def test_type_changes_that_keep_the_value():
+    a = pd.DataFrame({"id": [1, 2], "v": np.array([1, 2], dtype=np.int8), "t": ["x", "y"]})
+    b = pd.DataFrame({"id": [1, 2], "v": [1.0, 2.0], "t": pd.Categorical(["x", "y"])})
+    assert diff_frames(a, ["id"], b).counts()["changed"] == 0
+    # a number that became text is a change
+    c = a.assign(v=["1", "2"])
+    assert diff_frames(a, ["id"], c).counts()["changed"] == 2
+
+
+def test_versions_compacted_to_different_dtypes():
+    a = compact_frame(pd.DataFrame({"id": [1, 2], "v": [10, 20]}))[0]
+    b = compact_frame(pd.DataFrame({"id": [1, 2], "v": [10, 2000]}))[0]
+    assert a["v"].dtype != b["v"].dtype
+    counts = diff_frames(a, ["id"], b).counts()
+    assert (counts["added"], counts["removed"], counts["changed"]) == (0, 0, 1)
+
+
+def test_blanks_on_both_sides_are_equal():
+    a = pd.DataFrame({"id": [1, 2], "v": [np.nan, 1.0]})
+    b = pd.DataFrame({"id": [1, 2], "v": [np.nan, np.nan]})
+    counts = diff_frames(a, ["id"], b).counts()
+    assert (counts["changed"], counts["cells"]) == (1, 1)
+
+
+def test_duplicate_keys_pair_in_order_and_blank_keys_are_left_out():
+    a = pd.DataFrame({"id": [1, 1, None], "v": [1, 2, 3]})
+    b = pd.DataFrame({"id": [1, 1, 1], "v": [1, 9, 4]})
+    counts = diff_frames(a, ["id"], b).counts()
+    assert (counts["changed"], counts["added"], counts["removed"]) == (1, 1, 0)
+    assert counts["duplicates"] == 3
+    assert counts["blank_keys"] == 1
+
+
+def test_normalized_keys():
+    a = pd.DataFrame({"id": [" Acme", "Beta"], "v": [1, 2]})
+    b = pd.DataFrame({"id": ["acme", "BETA "], "v": [1, 3]})
+    assert diff_frames(a, ["id"], b).counts()["added"] == 2
+    counts = diff_frames(a, ["id"], b, normalize=("trim", "casefold")).counts()
+    assert (counts["added"], counts["changed"]) == (0, 1)
+
+
+def test_columns_on_one_side_only():
+    a = pd.DataFrame({"id": [1], "old": [1], "v": [1]})
+    b = pd.DataFrame({"id": [1], "new": [1], "v": [1]})
+    counts = diff_frames(a, ["id"], b).counts()
+    assert (counts["only_a"], counts["only_b"], counts["columns"]) == (["old"], ["new"], 1)
+    assert "columns dropped: old" in describe_diff(counts)
+    with pytest.raises(ValueError, match="Not in both versions"):
+        diff_frames(a, ["id"], b, cols=["old"])
+
+
+def test_key_column_counts_must_agree():
+    a, b = _versions()
+    with pytest.raises(ValueError):
+        diff_frames(a, ["id", "name"], b, ["id"])
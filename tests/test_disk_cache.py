@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from engine import DiskCache, SheetCache, SheetRegistry, file_fingerprint
+
+
+def _frame(n=200):
+    return pd.DataFrame({"id": np.arange(n), "name": [f"n{i}" for i in range(n)]})
+
+
+def _files(cache):
+    return sorted(e.name for e in os.scandir(cache.dir))
+
+
+def test_fingerprint_changes_when_the_file_is_touched(tmp_path):
+    path = tmp_path / "book.xlsx"
+    path.write_bytes(b"data")
+    first = file_fingerprint(str(path))
+    assert file_fingerprint(str(path)) == first
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    touched = file_fingerprint(str(path))
+    assert touched != first
+    path.write_bytes(b"datb")
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert file_fingerprint(str(path)) not in (first, touched)
+
+
+def test_sheets_and_meta_round_trip(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), 1 << 30)
+    assert cache.load("fp", "Sheet1") is None
+    cache.save("fp", "Sheet1", _frame())
+    cache.save_meta("fp", {"Sheet1": (201, 2)})
+    pd.testing.assert_frame_equal(cache.load("fp", "Sheet1"), _frame())
+    assert cache.load("fp", "Sheet2") is None
+    assert cache.load("other", "Sheet1") is None
+    assert cache.load_meta("fp") == {"Sheet1": (201, 2)}
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert cache.size == sum(os.path.getsize(os.path.join(cache.dir, f)) for f in _files(cache))
+    # a new instance picks up what is on disk
+    assert DiskCache(cache.dir, 1 << 30).size == cache.size
+
+
+def test_evicts_the_least_recently_used_files(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), 1 << 30)
+    for i, fp in enumerate(("a", "b", "c")):
+        cache.save(fp, "Sheet1", _frame())
+        # mtime is the LRU clock; space the writes out
+        os.utime(cache._base(fp, "Sheet1") + ".arrow", (1_000_000 + i, 1_000_000 + i))
+    cache.load("a", "Sheet1")   # touches a
+    one = os.path.getsize(cache._base("a", "Sheet1") + ".arrow")
+    cache.budget = one * 3
+    cache.save("d", "Sheet1", _frame())
+    assert cache.load("b", "Sheet1") is None
+    assert all(cache.load(fp, "Sheet1") is not None for fp in ("a", "c", "d"))
+    assert cache.size <= cache.budget
+
+
+def test_clear(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"), 1 << 30)
+    cache.save("a", "Sheet1", _frame())
+    cache.clear()
+    assert _files(cache) == [] and cache.size == 0
+
+
+def test_registry_reuses_parsed_sheets_until_the_workbook_changes(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    _frame(20).to_excel(path, index=False)
+    cache = DiskCache(str(tmp_path / "cache"), 1 << 30)
+    first = SheetRegistry(SheetCache(1 << 30), cache)
+    first.open(path)
+    df = first.get(path, "Sheet1")
+    hits = cache.hits
+    second = SheetRegistry(SheetCache(1 << 30), cache)
+    second.open(path)
+    pd.testing.assert_frame_equal(second.get(path, "Sheet1"), df)
+    assert cache.hits == hits + 1
+    # rewritten workbook: a new fingerprint, parsed again
+    _frame(5).to_excel(path, index=False)
+    third = SheetRegistry(SheetCache(1 << 30), cache)
+    third.open(path)
+    assert len(third.get(path, "Sheet1")) == 5
+    assert cache.hits == hits + 1
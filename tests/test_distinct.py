@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import engine
+from engine import HyperLogLog, SheetCache, SheetRegistry, TopK, distinct_frame, run_distinct_stats, run_unique
+
+
+def _values(n, distinct, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"v": rng.integers(0, distinct, n)})
+
+
+@pytest.mark.parametrize("distinct", [50, 5_000, 200_000])
+def test_hll_estimate_within_the_error_bound(distinct):
+    hll = HyperLogLog()
+    hll.add(pd.DataFrame({"v": np.arange(distinct)}))
+    assert abs(hll.estimate() - distinct) <= 3 * hll.relative_error * distinct
+    assert hll.relative_error == pytest.approx(0.0081, abs=1e-4)
+
+
+def test_hll_chunks_merge_and_repeats_dont_count():
+    whole, chunked = HyperLogLog(), HyperLogLog()
+    df = _values(50_000, 20_000)
+    whole.add(df)
+    for start in range(0, len(df), 7_000):
+        chunked.add(df.iloc[start:start + 7_000])
+    chunked.add(df)
+    assert np.array_equal(whole.registers, chunked.registers)
+    empty = HyperLogLog()
+    empty.add(df.iloc[:0])
+    assert empty.estimate() == 0
+
+
+def test_hll_counts_combinations_and_numbers_by_value():
+    hll = HyperLogLog()
+    hll.add(pd.DataFrame({"a": [1, 1, 2], "b": ["x", "y", "x"]}))
+    assert hll.estimate() == 3
+    ints, floats = HyperLogLog(), HyperLogLog()
+    ints.add(pd.DataFrame({"v": [1, 2, 3]}))
+    floats.add(pd.DataFrame({"v": [1.0, 2.0, 3.0]}))
+    assert np.array_equal(ints.registers, floats.registers)
+
+
+def test_topk_exact_while_nothing_is_dropped():
+    top = TopK(2)
+    top.add(pd.DataFrame({"v": ["a", "b", "a", "c"]}))
+    top.add(pd.DataFrame({"v": ["b", "b"]}))
+    out = top.result()
+    assert out.values.tolist() == [["b", 3, 0], ["a", 2, 0]]
+    assert top.floor == 0
+
+
+def test_topk_counts_are_upper_bounds_within_error():
+    df = _values(20_000, 500, seed=1)
+    true = df["v"].value_counts()
+    top = TopK(5, capacity=40)
+    for start in range(0, len(df), 1_000):
+        top.add(df.iloc[start:start + 1_000])
+    assert top.floor > 0
+    out = top.result()
+    assert len(out) == 5
+    for value, count, error in out.values.tolist():
+        assert count - error <= true[value] <= count
+
+
+def test_topk_finds_heavy_hitters_across_chunks():
+    rng = np.random.default_rng(2)
+    noise = rng.integers(100, 10_000, 30_000)
+    df = pd.DataFrame({"v": np.concatenate([noise, np.repeat([1, 2, 3], [3_000, 2_000, 1_000])])})
+    df = df.sample(frac=1, random_state=3).reset_index(drop=True)
+    top = TopK(3, capacity=30)
+    for start in range(0, len(df), 2_000):
+        top.add(df.iloc[start:start + 2_000])
+    assert top.result()["v"].tolist() == [1, 2, 3]
+
+
+def test_topk_empty():
+    out = TopK(3).result()
+    assert list(out.columns) == ["Count", "Error"] and not len(out)
+
+
+def test_distinct_frame_orders():
+    df = pd.DataFrame({"a": ["x", "y", "y", None, "z", "y", "z"], "b": [1, 2, 2, None, 3, 2, 3]})
+    assert distinct_frame(df, "a")["a"].tolist() == ["x", "y", "z"]
+    out = distinct_frame(df, "a", counts=True, sort="frequency")
+    assert out.values.tolist() == [["y", 3], ["z", 2], ["x", 1]]
+    both = distinct_frame(df, ["a", "b"], counts=True)
+    assert both.values.tolist() == [["x", 1.0, 1], ["y", 2.0, 3], ["z", 3.0, 2]]
+    with pytest.raises(ValueError):
+        distinct_frame(df, "a", sort="alphabetical")
+
+
+def test_distinct_frame_keeps_partly_blank_combinations():
+    df = pd.DataFrame({"a": ["x", "x", None], "b": [None, None, None]})
+    assert distinct_frame(df, ["a", "b"], counts=True)["Count"].tolist() == [2]
+
+
+def _registry():
+    registry = SheetRegistry(SheetCache(1 << 28))
+    registry.attach("a", "Sheet1", pd.DataFrame({"v": ["x"] * 5 + ["y"] * 3 + [None]}))
+    registry.attach("b", "Sheet1", pd.DataFrame({"v": ["y"] * 4 + ["z"]}))
+    return registry
+
+
+def test_run_unique_names_the_column():
+    out = run_unique(_registry(), "a", "Sheet1", "v", counts=True, sort="frequency")
+    assert out.values.tolist() == [["x", 5], ["y", 3]]
+    assert list(out.columns) == ["Unique_v", "Count"]
+
+
+def test_run_distinct_stats_streams_across_sheets(monkeypatch):
+    monkeypatch.setattr(engine, "DISTINCT_CHUNK_ROWS", 2)
+    out, stats = run_distinct_stats(_registry(), [("a", "Sheet1"), ("b", "Sheet1")], "v", top_k=2)
+    assert out.values.tolist() == [["y", 7, 0], ["x", 5, 0]]
+    assert stats == {"rows": 13, "distinct": 3, "error": stats["error"], "sheets": 2, "exact_top": True}
+    # one counter per value asked for: values get dropped and counts become bounds
+    monkeypatch.setattr(engine, "TOPK_CAPACITY", 1)
+    out, stats = run_distinct_stats(_registry(), [("a", "Sheet1"), ("b", "Sheet1")], "v", top_k=1)
+    assert stats["exact_top"] is False
+    assert "upper bounds" in engine.describe_distinct(stats)
+    assert out["Error"].iloc[0] > 0
@@ -0,0 +1,105 @@
+import bz2
+import gc
+import gzip
+import lzma
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import engine
+from engine import export_frame
+
+
+class Cancelled(Exception):
+    pass
+
+
+def _frame(n=25):
+    return pd.DataFrame({
+        "id": np.arange(n),
+        "name": [f"row {i}" for i in range(n)],
+        "price": np.arange(n) / 4,
+        "day": pd.date_range("2024-01-01", periods=n, freq="D"),
+    })
+
+
+@pytest.mark.parametrize("suffix, opener", [
+    (".csv", open), (".csv.gz", gzip.open), (".csv.bz2", bz2.open), (".csv.xz", lzma.open),
+])
+def test_csv_round_trips(tmp_path, suffix, opener):
+    df = _frame()
+    path = str(tmp_path / f"out{suffix}")
+    assert export_frame(df, path, chunk_rows=7) == 1
+    with opener(path, "rt", encoding="utf-8") as fh:
+        back = pd.read_csv(fh, parse_dates=["day"])
+    pd.testing.assert_frame_equal(back, df, check_dtype=False)
+    assert os.listdir(tmp_path) == [f"out{suffix}"]
+
+
+def test_zip_holds_one_csv_member(tmp_path):
+    df = _frame()
+    path = str(tmp_path / "out.csv.zip")
+    export_frame(df, path, chunk_rows=7)
+    with zipfile.ZipFile(path) as archive:
+        assert archive.namelist() == ["out.csv"]
+        with archive.open("out.csv") as fh:
+            back = pd.read_csv(fh)
+    assert back["name"].tolist() == df["name"].tolist()
+
+
+def test_xlsx_splits_past_the_row_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(engine, "EXCEL_MAX_ROWS", 11)     # 10 rows and a header per sheet
+    df = _frame()
+    path = str(tmp_path / "out.xlsx")
+    assert export_frame(df, path, chunk_rows=4) == 3
+    sheets = pd.read_excel(path, sheet_name=None)
+    assert list(sheets) == ["Result", "Result_2", "Result_3"]
+    assert [len(s) for s in sheets.values()] == [10, 10, 5]
+    back = pd.concat(sheets.values(), ignore_index=True)
+    assert back["id"].tolist() == df["id"].tolist()
+    assert back["day"].tolist() == df["day"].tolist()
+
+
+def test_progress_reaches_every_row(tmp_path):
+    seen = []
+    export_frame(_frame(), str(tmp_path / "out.csv"), lambda f, msg: seen.append((f, msg)), chunk_rows=10)
+    assert [f for f, _ in seen] == [0.4, 0.8, 1.0]
+    assert seen[-1][1] == "25/25 rows"
+
+
+@pytest.mark.parametrize("name", ["out.csv.gz", "out.xlsx"])
+def test_cancel_removes_the_partial_file(tmp_path, name):
+    def progress(fraction, msg):
+        if fraction > 0.3:
+            raise Cancelled()
+    path = str(tmp_path / name)
+    with pytest.raises(Cancelled):
+        export_frame(_frame(), path, progress, chunk_rows=10)
+    assert os.listdir(tmp_path) == []
+
+
+def test_cancel_keeps_an_older_file(tmp_path):
+    path = tmp_path / "out.csv"
+    path.write_text("old")
+
+    def progress(fraction, msg):
+        raise Cancelled()
+    with pytest.raises(Cancelled):
+        export_frame(_frame(), str(path), progress, chunk_rows=10)
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["out.csv"]
+
+
+def test_cancelled_xlsx_leaves_no_temp_files(tmp_path):
+    def progress(fraction, msg):
+        if fraction > 0.3:
+            raise Cancelled()
+    before = set(os.listdir(tempfile.gettempdir()))
+    with pytest.raises(Cancelled):
+        export_frame(_frame(), str(tmp_path / "out.xlsx"), progress, chunk_rows=10)
+    gc.collect()
+    assert set(os.listdir(tempfile.gettempdir())) - before == set()
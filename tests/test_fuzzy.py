@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import (FUZZY_KEY_COLUMN, FUZZY_SCORE_COLUMN, DuplicateKeyError, FuzzyIndex, compact_frame,
+                    fuzzy_clean, fuzzy_compare_sets, fuzzy_match, fuzzy_vlookup_frame)
+
+
+def _customers():
+    return pd.DataFrame({"name": ["Acme Corporation", "Globex Ltd", "Initech", "Umbrella plc"],
+                         "city": ["Springfield", "Cypress Creek", "Austin", "Raccoon City"]})
+
+
+def test_clean_drops_case_punctuation_and_company_words():
+    assert fuzzy_clean(["ACME Corp.", "The Acme, Inc", "  Globex   Ltd "]).tolist() == ["acme", "acme", "globex"]
+    # all stop words: kept rather than left empty
+    assert fuzzy_clean(["The Company"]).tolist() == ["the company"]
+
+
+def test_match_exact_after_cleaning_scores_one():
+    best, score = fuzzy_match(np.array(["ACME Corp"], dtype=object), np.array(["Acme Corporation"], dtype=object),
+                              workers=1)
+    assert best.tolist() == [0] and score.tolist() == [1.0]
+
+
+def test_match_misspelling_and_threshold():
+    main = np.array(["Initek", "Globeks", "Nothing Alike"], dtype=object)
+    lookup = np.array(["Acme", "Globex", "Initech"], dtype=object)
+    best, score = fuzzy_match(main, lookup, threshold=0.3, workers=1)
+    assert best.tolist() == [2, 1, -1]
+    assert np.all(score[:2] < 1) and np.isnan(score[2])
+    strict, _ = fuzzy_match(main, lookup, threshold=0.99, workers=1)
+    assert strict.tolist() == [-1, -1, -1]
+
+
+def test_equal_lookup_keys_take_the_first():
+    best, _ = fuzzy_match(np.array(["Acme"], dtype=object), np.array(["x", "Acme Inc", "ACME ltd"], dtype=object),
+                          workers=1)
+    assert best.tolist() == [1]
+
+
+def test_index_match():
+    index = FuzzyIndex(np.array(["globex", "initech"], dtype=object))
+    best, score = index.match(np.array(["globex", "zzz"], dtype=object), threshold=0.5)
+    assert best.tolist() == [0, -1]
+    assert score[0] == pytest.approx(1.0)
+
+
+def test_vlookup_adds_matched_key_and_score():
+    main = pd.DataFrame({"customer": ["ACME Corp", "Initech Inc", "Hooli", None]})
+    out, stats = fuzzy_vlookup_frame(main, ["customer"], _customers(), ["name"], ["city"], workers=1)
+    assert list(out.columns) == ["customer", "city", FUZZY_KEY_COLUMN, FUZZY_SCORE_COLUMN]
+    assert out["city"].tolist()[:2] == ["Springfield", "Austin"]
+    assert out[FUZZY_KEY_COLUMN].tolist()[:2] == ["Acme Corporation", "Initech"]
+    assert out[FUZZY_SCORE_COLUMN].tolist()[:2] == [1.0, 1.0]
+    assert out.iloc[2:][["city", FUZZY_KEY_COLUMN, FUZZY_SCORE_COLUMN]].isna().all().all()
+    assert stats["matched"] == 2
+
+
+def test_vlookup_duplicate_policies():
+    lookup = pd.DataFrame({"name": ["Acme", "Acme Inc", "acme"], "v": [1, 2, 3]})
+    main = pd.DataFrame({"name": ["ACME"]})
+    first, stats = fuzzy_vlookup_frame(main, ["name"], lookup, ["name"], ["v"], workers=1)
+    last, _ = fuzzy_vlookup_frame(main, ["name"], lookup, ["name"], ["v"], policy="last", workers=1)
+    assert first["v"].tolist() == [1]
+    # three distinct keys that clean to one text: the first of them, whatever the policy
+    assert last["v"].tolist() == [1]
+    assert stats["duplicates"] == 0
+    dup = pd.DataFrame({"name": ["Acme", "Acme"], "v": [1, 2]})
+    out, _ = fuzzy_vlookup_frame(main, ["name"], dup, ["name"], ["v"], policy="last", workers=1)
+    assert out["v"].tolist() == [2]
+    with pytest.raises(DuplicateKeyError):
+        fuzzy_vlookup_frame(main, ["name"], dup, ["name"], ["v"], policy="error", workers=1)
+    with pytest.raises(ValueError):
+        fuzzy_vlookup_frame(main, ["name"], dup, ["name"], ["v"], policy="aggregate", workers=1)
+
+
+def test_vlookup_on_compacted_keys():
+    lookup = compact_frame(pd.DataFrame({"name": ["Acme Corporation", "Globex"] * 3, "v": range(6)}))[0]
+    assert isinstance(lookup["name"].dtype, pd.CategoricalDtype)
+    main = pd.DataFrame({"name": ["acme corp", "GLOBEX LTD"]})
+    out, stats = fuzzy_vlookup_frame(main, ["name"], lookup, ["name"], ["v"], workers=1)
+    assert out["v"].tolist() == [0, 1]
+    assert stats["duplicates"] == 4
+
+
+def test_compare_sets_pairs_close_keys():
+    a = pd.DataFrame({"name": ["ACME Corp", "Initech", "Hooli"]})
+    result = fuzzy_compare_sets(a, ["name"], _customers(), ["name"], workers=1)
+    assert result.counts() == {"only_a": 1, "only_b": 2, "both": 2}
+    assert list(result.only_a) == ["Hooli"]
+    assert sorted(result.both) == ["Acme Corporation", "Initech"]
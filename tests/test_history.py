@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+from engine import History, SheetCache, SheetChange, SheetRegistry, StateChange
+
+
+def _registry(n=1000):
+    registry = SheetRegistry(SheetCache(1 << 28))
+    registry.attach("book", "Sheet1", pd.DataFrame({"a": np.arange(n), "b": np.arange(n) * 2.0}))
+    return registry
+
+
+# sets the edited sheet and records it, like the window's edits
+def _edit(registry, history, fn, label):
+    before = registry.get("book", "Sheet1")
+    after = fn(before.copy(deep=False))
+    registry.set("book", "Sheet1", after)
+    history.push(SheetChange(registry, "book", "Sheet1", before, after, label))
+    return after
+
+
+def _add(name, value):
+    def fn(df):
+        df[name] = value
+        return df
+    return fn
+
+
+def test_edit_undo_redo_round_trip():
+    registry, history = _registry(), History()
+    original = registry.get("book", "Sheet1")
+    _edit(registry, history, _add("c", 1), "add c")
+    _edit(registry, history, lambda df: df.drop(columns=["a"]), "drop a")
+    assert list(registry.get("book", "Sheet1").columns) == ["b", "c"]
+    assert history.next_undo() == "drop a"
+
+    change, df = history.undo()
+    assert change.label == "drop a"
+    assert list(df.columns) == ["a", "b", "c"] and registry.get("book", "Sheet1") is df
+    history.undo()
+    pd.testing.assert_frame_equal(registry.get("book", "Sheet1"), original)
+    assert history.undo() is None
+    assert history.next_redo() == "add c"
+
+    history.redo()
+    _change, df = history.redo()
+    assert list(df.columns) == ["b", "c"] and (df["c"] == 1).all()
+    assert history.redo() is None
+
+
+def test_a_change_keeps_only_the_columns_it_touched():
+    registry, history = _registry(), History()
+    _edit(registry, history, _add("b", 0.0), "replace b")
+    change = history._undo[-1]
+    assert list(change.before) == ["b"] and list(change.after) == ["b"]
+
+
+def test_duplicate_column_names_keep_whole_frames():
+    registry, history = _registry(), History()
+    before = registry.get("book", "Sheet1")
+    after = pd.concat([before, before[["a"]]], axis=1)
+    registry.set("book", "Sheet1", after)
+    history.push(SheetChange(registry, "book", "Sheet1", before, after))
+    assert history.undo()[1] is before
+    assert history.redo()[1] is after
+
+
+def test_a_new_push_clears_redo():
+    registry, history = _registry(), History()
+    _edit(registry, history, _add("c", 1), "add c")
+    history.undo()
+    assert history.next_redo() == "add c"
+    _edit(registry, history, _add("d", 2), "add d")
+    assert history.next_redo() is None and history.redo() is None
+    assert history.next_undo() == "add d"
+
+
+def test_depth_drops_the_oldest_steps():
+    registry, history = _registry(), History(depth=2)
+    for name in "cde":
+        _edit(registry, history, _add(name, 1), f"add {name}")
+    assert history.undo()[0].label == "add e"
+    assert history.undo()[0].label == "add d"
+    assert history.undo() is None
+
+
+def test_byte_budget_evicts_but_keeps_the_newest():
+    n = 1000
+    registry = _registry(n)
+    column = n * 8
+    history = History(budget_bytes=column * 3)
+    # each step adds one new int64 column and keeps nothing else
+    for i in range(5):
+        _edit(registry, history, _add(f"c{i}", np.arange(n)), f"add c{i}")
+    assert history.used <= history.budget
+    assert len(history._undo) == 3
+    tiny = History(budget_bytes=1)
+    _edit(registry, tiny, _add("big", np.arange(n)), "big")
+    assert tiny.next_undo() == "big" and tiny.used > tiny.budget
+
+
+def test_shared_columns_count_once():
+    n = 1000
+    registry, history = _registry(n), History()
+    _edit(registry, history, _add("c", np.arange(n)), "add c")
+    used = history.used
+    # the next step's "before" holds the same column the last one added
+    _edit(registry, history, lambda df: df.drop(columns=["c"]), "drop c")
+    assert history.used == used
+
+
+def test_state_changes_and_forget():
+    state = {}
+
+    def apply(value):
+        state["v"] = value
+    history = History()
+    history.push(StateChange(None, "x", apply, "set x"))
+    registry = _registry()
+    _edit(registry, history, _add("c", np.arange(1000)), "add c")
+    history.undo()
+    history.undo()
+    assert state == {"v": None}
+    history.redo()
+    assert state == {"v": "x"}
+    history.forget(lambda c: isinstance(c, SheetChange) and c.path == "book")
+    assert history.next_redo() is None and history.next_undo() == "set x"
+    assert history.used == 0
+    history.clear()
+    assert history.undo() is None
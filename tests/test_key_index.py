@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import (DuplicateKeyError, KeyIndex, KeyIndexCache, SheetCache, SheetRegistry, normalize_frame,
+                    normalize_keys, vlookup_frame)
+
+
+def _lookup():
+    return pd.DataFrame({"id": ["a", "b", "a", "c"], "qty": [1, 2, 3, 4], "city": ["X", "Y", "Z", "X"]})
+
+
+def _index(df, policy, normalize=()):
+    return KeyIndex(normalize_frame(df, ["id"], normalize), policy)
+
+
+def test_first_and_last_policies():
+    df = _lookup()
+    main = pd.DataFrame({"id": ["a", "c", "zz"]})
+    first, stats = vlookup_frame(main, ["id"], df, ["qty"], _index(df, "first"))
+    last, _ = vlookup_frame(main, ["id"], df, ["qty"], _index(df, "last"))
+    assert first["qty"].tolist()[:2] == [1, 4]
+    assert last["qty"].tolist()[:2] == [3, 4]
+    assert np.isnan(first["qty"].iloc[2])
+    assert stats == {"rows": 3, "matched": 2, "duplicates": 1, "policy": "first"}
+
+
+def test_error_policy_raises_on_duplicates():
+    with pytest.raises(DuplicateKeyError, match="1 duplicate"):
+        _index(_lookup(), "error")
+    # unique keys are fine
+    assert len(_index(_lookup().drop_duplicates("id"), "error")) == 3
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        _index(_lookup(), "middle")
+
+
+def test_aggregate_sums_numbers_and_joins_text():
+    df = _lookup()
+    out, stats = vlookup_frame(pd.DataFrame({"id": ["a", "b"]}), ["id"], df, ["qty", "city"],
+                               _index(df, "aggregate"))
+    assert out["qty"].tolist() == [4, 2]
+    assert out["city"].tolist() == ["X, Z", "Y"]
+    assert stats["duplicates"] == 1
+
+
+def test_composite_keys_and_null_keys_never_match():
+    df = pd.DataFrame({"k1": ["a", "a", None], "k2": [1, 2, 1], "v": [10, 20, 30]})
+    index = KeyIndex(normalize_frame(df, ["k1", "k2"]), "first")
+    main = pd.DataFrame({"k1": ["a", "a", None], "k2": [2, 3, 1]})
+    out, stats = vlookup_frame(main, ["k1", "k2"], df, ["v"], index)
+    assert out["v"].iloc[0] == 20
+    assert out["v"].iloc[1:].isna().all()
+    assert stats["matched"] == 1
+
+
+def test_fetched_columns_colliding_with_main_get_a_suffix():
+    df = _lookup()
+    main = pd.DataFrame({"id": ["b"], "qty": [99]})
+    out, _ = vlookup_frame(main, ["id"], df, ["qty"], _index(df, "first"))
+    assert list(out.columns) == ["id", "qty", "qty_lk"]
+    assert out["qty_lk"].iloc[0] == 2
+
+
+def test_normalize_options():
+    s = pd.Series([" Acme ", "ACME", 7.0, "7", None])
+    assert normalize_keys(s, ("trim", "casefold")).tolist()[:2] == ["acme", "acme"]
+    numbers = normalize_keys(s, ("numeric_text",))
+    assert numbers.iloc[2] == numbers.iloc[3] == "7"
+    assert normalize_keys(s, ("trim",)).isna().iloc[4]
+    assert normalize_keys(s) is s
+
+
+def test_normalized_lookup_matches_across_case_and_type():
+    df = pd.DataFrame({"id": ["  Acme", 12], "v": [1, 2]})
+    main = pd.DataFrame({"id": ["acme ", "12"]})
+    normalize = ("trim", "casefold", "numeric_text")
+    out, stats = vlookup_frame(main, ["id"], df, ["v"], _index(df, "first", normalize), normalize)
+    assert out["v"].tolist() == [1, 2]
+    assert stats["matched"] == 2
+
+
+def _registry(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    _lookup().to_excel(path, sheet_name="Sheet1", index=False)
+    registry = SheetRegistry(SheetCache(1 << 26))
+    registry.open(path)
+    return registry, path
+
+
+def test_cache_reuses_an_index_until_the_sheet_changes(tmp_path):
+    registry, book = _registry(tmp_path)
+    cache = KeyIndexCache()
+    first = cache.get(registry, book, "Sheet1", ["id"])
+    assert cache.get(registry, book, "Sheet1", ["id"]) is first
+    assert (cache.builds, cache.hits) == (1, 1)
+    # another policy or normalization is another index
+    cache.get(registry, book, "Sheet1", ["id"], policy="last")
+    cache.get(registry, book, "Sheet1", ["id"], normalize=("casefold",))
+    assert cache.builds == 3
+    registry.set(book, "Sheet1", _lookup().iloc[:2])
+    assert cache.get(registry, book, "Sheet1", ["id"]) is not first
+    assert cache.builds == 4
+
+
+def test_cache_evicts_the_least_recently_used(tmp_path):
+    registry, book = _registry(tmp_path)
+    cache = KeyIndexCache(max_entries=2)
+    a = cache.get(registry, book, "Sheet1", ["id"])
+    cache.get(registry, book, "Sheet1", ["city"])
+    cache.get(registry, book, "Sheet1", ["id"])
+    cache.get(registry, book, "Sheet1", ["qty"])
+    assert cache.get(registry, book, "Sheet1", ["id"]) is a
+    cache.get(registry, book, "Sheet1", ["city"])
+    assert cache.builds == 4
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from engine import column_buffers, frame_nbytes, memory_report
+
+
+def _objects(rows=1000, cols=5):
+    # one consolidated object block
+    values = np.array([f"value {i}" for i in range(rows * cols)], dtype=object).reshape(rows, cols)
+    return pd.DataFrame(values, dtype=object)
+
+
+def test_object_block_counts_every_column():
+    df = _objects()
+    report = memory_report({"a": df})
+    assert report["total"] == frame_nbytes(df) - df.index.memory_usage()
+    assert report["owned"] == report["total"] and report["shared"] == 0
+
+
+def test_columns_of_one_block_have_their_own_buffers():
+    df = pd.DataFrame(np.zeros((100, 3)))
+    buffers = [column_buffers(df.iloc[:, i]) for i in range(3)]
+    assert len({b[0][0] for b in buffers}) == 3
+    assert all(b[0][1] == 800 for b in buffers)
+
+
+def test_column_picked_from_a_block_is_charged_one_column():
+    for df in (_objects(), pd.DataFrame(np.arange(5000.0).reshape(1000, 5))):
+        one = frame_nbytes(df[[0]]) - df.index.memory_usage()
+        report = memory_report({"a": df, "g": df[[0]]})
+        assert report["frames"]["g"] == {"owned": 0, "shared": one}
+        assert report["frames"]["a"]["shared"] == one
+        assert report["total"] == frame_nbytes(df) - df.index.memory_usage()
+
+
+def test_shallow_copy_plus_a_column():
+    df = pd.DataFrame({"a": np.arange(100), "b": np.arange(100.0)})
+    out = df.copy(deep=False)
+    out["c"] = np.ones(100)
+    report = memory_report({"sheet": df, "result": out})
+    assert report["frames"]["sheet"] == {"owned": 0, "shared": 1600}
+    assert report["frames"]["result"] == {"owned": 800, "shared": 1600}
+
+
+def test_shallow_report_leaves_out_the_objects():
+    df = _objects()
+    report = memory_report({"a": df, "g": df[[0]]}, deep=False)
+    assert report["total"] == df.size * 8
+    assert report["frames"]["g"] == {"owned": 0, "shared": len(df) * 8}
@@ -0,0 +1,188 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("duckdb")
+pytest.importorskip("pyarrow")
+
+import engine
+from engine import DuplicateKeyError, SheetCache, SheetRegistry, iter_sheet_chunks, run_distinct_stats
+from outofcore import OutOfCoreEngine
+
+
+@pytest.fixture
+def book(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame({
+            "id": [1, 2, 3, 4, 5, None, 2],
+            "name": [" Acme", "beta", "Gamma ", "delta", "Acme", "eps", "BETA"],
+            "score": [5, 15, 25, 50, 120, 7, -3],
+            "region": ["N", "S", "N", "S", "N", "S", "N"],
+        }).to_excel(writer, sheet_name="Main", index=False)
+        pd.DataFrame({
+            "id": [1, 1, 2, 4, 6, "7"],
+            "name": ["acme", "ACME", "Beta", "Delta", "zeta", "eta"],
+            "qty": [10, 20, 30, 40, 50, 60],
+            "city": ["X", "Y", "Z", "X", None, "W"],
+        }).to_excel(writer, sheet_name="Lookup", index=False)
+        pd.DataFrame({
+            "region": ["N", "N", "S", "S"],
+            "from": [0, 20, 0, 30],
+            "band": ["n-low", "n-high", "s-low", "s-high"],
+        }).to_excel(writer, sheet_name="Bands", index=False)
+    return path
+
+
+@pytest.fixture
+def registry(book):
+    registry = SheetRegistry(SheetCache(1 << 28))
+    registry.open(book)
+    return registry
+
+
+@pytest.fixture
+def ooc(tmp_path):
+    ooc = OutOfCoreEngine(str(tmp_path / "spill"))
+    yield ooc
+    ooc.close()
+
+
+def _cell(v):
+    if v is None or (isinstance(v, float) and np.isnan(v)) or v is pd.NA or v is pd.NaT:
+        return None
+    if isinstance(v, (bool, np.bool_)):
+        return bool(v)
+    if isinstance(v, (int, float, np.integer, np.floating)):
+        return float(v)
+    return str(v)
+
+
+# same columns and the same values, whatever dtypes either side chose
+def _same(in_memory, spilled):
+    spilled = spilled.to_pandas()
+    assert [str(c) for c in in_memory.columns] == [str(c) for c in spilled.columns]
+    rows = [[_cell(v) for v in row] for row in in_memory.astype(object).itertuples(index=False)]
+    assert rows == [[_cell(v) for v in row] for row in spilled.astype(object).itertuples(index=False)]
+
+
+@pytest.mark.parametrize("policy", ["first", "last", "aggregate"])
+@pytest.mark.parametrize("normalize", [(), ("trim", "casefold")])
+def test_exact_vlookup(book, registry, ooc, policy, normalize):
+    args = (registry, book, "Main", ["name"], book, "Lookup", ["name"], ["qty", "city"])
+    out, stats = engine.run_vlookup(*args, policy=policy, normalize=normalize)
+    spilled, spilled_stats = ooc.run_vlookup(*args, policy=policy, normalize=normalize)
+    _same(out, spilled)
+    assert stats == spilled_stats
+
+
+def test_numbers_as_text(book, registry, ooc):
+    args = (registry, book, "Main", ["id"], book, "Lookup", ["id"], ["name"])
+    out, stats = engine.run_vlookup(*args, normalize=("numeric_text",))
+    spilled, spilled_stats = ooc.run_vlookup(*args, normalize=("numeric_text",))
+    _same(out, spilled)
+    assert stats == spilled_stats and stats["matched"] == 4
+
+
+def test_duplicate_error(book, registry, ooc):
+    args = (registry, book, "Main", ["id"], book, "Lookup", ["id"], ["qty"])
+    with pytest.raises(DuplicateKeyError):
+        engine.run_vlookup(*args, policy="error")
+    with pytest.raises(DuplicateKeyError):
+        ooc.run_vlookup(*args, policy="error")
+
+
+@pytest.mark.parametrize("mode", ["approximate", "nearest"])
+@pytest.mark.parametrize("keys", [["score"], ["region", "score"]])
+def test_approximate_vlookup(book, registry, ooc, mode, keys):
+    lookup_keys = ["from"] if len(keys) == 1 else ["region", "from"]
+    args = (registry, book, "Main", keys, book, "Bands", lookup_keys, ["band"])
+    out, stats = engine.run_vlookup(*args, mode=mode)
+    spilled, spilled_stats = ooc.run_vlookup(*args, mode=mode)
+    _same(out, spilled)
+    assert stats == spilled_stats
+
+
+@pytest.mark.parametrize("include_both, whole_rows", [(False, False), (True, False), (False, True)])
+@pytest.mark.parametrize("normalize", [(), ("trim", "casefold")])
+def test_compare(book, registry, ooc, include_both, whole_rows, normalize):
+    args = (registry, book, "Main", ["name"], book, "Lookup", ["name"], normalize, include_both, whole_rows)
+    out, counts = engine.run_compare(*args)
+    spilled, spilled_counts = ooc.run_compare(*args)
+    _same(out, spilled)
+    assert counts == spilled_counts
+
+
+def test_compare_composite_keys(book, registry, ooc):
+    args = (registry, book, "Main", ["id", "region"], book, "Bands", ["from", "region"])
+    out, counts = engine.run_compare(*args, include_both=True)
+    spilled, spilled_counts = ooc.run_compare(*args, include_both=True)
+    _same(out, spilled)
+    assert counts == spilled_counts
+
+
+@pytest.mark.parametrize("col", ["region", ["region", "name"]])
+@pytest.mark.parametrize("counts, sort", [(False, "appearance"), (True, "frequency")])
+def test_unique(book, registry, ooc, col, counts, sort):
+    _same(engine.run_unique(registry, book, "Main", col, counts=counts, sort=sort),
+          ooc.run_unique(registry, book, "Main", col, counts=counts, sort=sort))
+
+
+@pytest.mark.parametrize("sheet, cols, spec", [
+    ("Lookup", ["name", "city"], {"sep": "-"}),
+    ("Lookup", ["name", "city"], {"sep": " / ", "prefix": "[", "suffix": "]", "skip_empty": True}),
+    ("Main", ["name", "score"], {"formats": {"score": "{:05d}"}}),
+])
+def test_concat(book, registry, ooc, sheet, cols, spec):
+    _same(engine.run_concat(registry, book, sheet, cols, "Joined", **spec),
+          ooc.run_concat(registry, book, sheet, cols, "Joined", **spec))
+
+
+def test_distinct_stats_over_spilled_chunks(book, registry, ooc):
+    sources = [(book, "Main"), (book, "Lookup")]
+    out, stats = run_distinct_stats(registry, sources, ["name"], top_k=3, chunks=iter_sheet_chunks)
+    spilled, spilled_stats = run_distinct_stats(registry, sources, ["name"], top_k=3, chunks=ooc.iter_chunks)
+    assert out.values.tolist() == spilled.values.tolist()
+    assert stats == spilled_stats
+
+
+def test_spilled_sheet_round_trips(book, registry, ooc):
+    sheet = ooc.sheet(registry, book, "Main")
+    assert sheet.shape == (7, 4)
+    _same(registry.get(book, "Main"), sheet)
+    assert sheet.slice(5, 100)["name"].tolist() == ["eps", "BETA"]
+    # spilled once: a second engine on the same directory reuses the files
+    again = OutOfCoreEngine(ooc.dir)
+    try:
+        assert again.source(registry, book, "Main").files == ooc.source(registry, book, "Main").files
+    finally:
+        again.close()
+
+
+def test_edited_sheet_is_spilled_from_the_frame(book, registry, ooc):
+    registry.set(book, "Main", pd.DataFrame({"name": ["only"], "score": [1]}))
+    _same(registry.get(book, "Main"), ooc.sheet(registry, book, "Main"))
+
+
+def test_spills_lock_per_sheet(book, registry, ooc):
+    release, calls = threading.Event(), []
+    spill = ooc._spill
+
+    def slow_spill(registry, path, sheet, folder, progress):
+        calls.append(sheet)
+        if sheet == "Main":
+            assert release.wait(10)
+        spill(registry, path, sheet, folder, progress)
+
+    ooc._spill = slow_spill
+    with ThreadPoolExecutor(3) as pool:
+        main = [pool.submit(ooc.source, registry, book, "Main") for _ in range(2)]
+        # another sheet spills while Main is still being written
+        assert pool.submit(ooc.source, registry, book, "Lookup").result(10).columns == ["id", "name", "qty", "city"]
+        assert not any(f.done() for f in main)
+        release.set()
+        assert main[0].result(10) is main[1].result(10)
+    assert sorted(calls) == ["Lookup", "Main"]
@@ -0,0 +1,144 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import cli
+import engine
+from engine import SheetCache, SheetRegistry
+from pipeline import Pipeline, PipelineError, PipelineRunner
+
+
+def _write(path, df):
+    df.to_excel(path, sheet_name="Sheet1", index=False)
+    # keep fingerprints apart even on filesystems with coarse mtimes
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def _books(tmp_path):
+    orders, customers = str(tmp_path / "orders.xlsx"), str(tmp_path / "customers.xlsx")
+    _write(orders, pd.DataFrame({"id": [1, 2, 3], "qty": [5, 6, 7]}))
+    _write(customers, pd.DataFrame({"id": [1, 2, 4], "name": ["Ann", "Bob", "Dee"]}))
+    return orders, customers
+
+
+# unique on customers alone; concat on orders -> VLOOKUP into customers -> export
+def _pipeline(tmp_path, orders, customers):
+    pipeline = Pipeline()
+    s1 = pipeline.record("concat", {"sheet": (orders, "Sheet1")}, replaces=(orders, "Sheet1"),
+                         cols=["id", "qty"], res_name="Label", sep="-")
+    pipeline.record("unique", {"sheet": (customers, "Sheet1")}, col="name")
+    s3 = pipeline.record("vlookup", {"main": (orders, "Sheet1"), "lookup": (customers, "Sheet1")},
+                         keys_main=["id"], keys_lookup=["id"], fetch_cols=["name"])
+    pipeline.record("export", {"data": s3}, output=str(tmp_path / "out" / "joined.csv"))
+    assert s1 == "s1"
+    return pipeline
+
+
+def _statuses(run):
+    return {step["id"]: status for step, status, _msg in run.steps}
+
+
+def _runner():
+    return PipelineRunner(SheetRegistry(SheetCache(1 << 28)))
+
+
+def test_recording_names_sources_and_chains_steps(tmp_path):
+    orders, customers = _books(tmp_path)
+    pipeline = _pipeline(tmp_path, orders, customers)
+    assert pipeline.sources == {"orders": orders, "customers": customers}
+    # the VLOOKUP read the sheet the concat replaced
+    assert pipeline.steps[2]["inputs"]["main"] == {"step": "s1"}
+    assert pipeline.describe_step(pipeline.steps[2]) == "s3 vlookup(s1, customers::Sheet1)"
+    assert pipeline.downstream({"customers"}) == {"s2", "s3", "s4"}
+    assert pipeline.downstream({"orders"}) == {"s1", "s3", "s4"}
+    with pytest.raises(PipelineError):
+        pipeline.record("compare", {"a": (orders, "Sheet1")})
+
+
+def test_only_steps_downstream_of_a_changed_input_rerun(tmp_path):
+    orders, customers = _books(tmp_path)
+    pipeline = _pipeline(tmp_path, orders, customers)
+    runner = _runner()
+    first = runner.run(pipeline)
+    assert set(_statuses(first).values()) == {"ran"}
+    assert first.result["name"].tolist()[:2] == ["Ann", "Bob"]
+    assert first.result["Label"].tolist() == ["1-5", "2-6", "3-7"]
+    assert pd.read_csv(tmp_path / "out" / "joined.csv")["name"].tolist()[:2] == ["Ann", "Bob"]
+
+    assert set(_statuses(runner.run(pipeline)).values()) == {"cached"}
+
+    _write(customers, pd.DataFrame({"id": [3], "name": ["Cy"]}))
+    run = runner.run(pipeline)
+    assert _statuses(run) == {"s1": "cached", "s2": "ran", "s3": "ran", "s4": "ran"}
+    assert run.result["name"].tolist()[2] == "Cy"
+
+    _write(orders, pd.DataFrame({"id": [3], "qty": [1]}))
+    run = runner.run(pipeline)
+    assert _statuses(run) == {"s1": "ran", "s2": "cached", "s3": "ran", "s4": "ran"}
+    assert run.counts() == (3, 1)
+
+
+def test_replay_on_another_workbook(tmp_path):
+    orders, customers = _books(tmp_path)
+    pipeline = _pipeline(tmp_path, orders, customers)
+    other = str(tmp_path / "other.xlsx")
+    _write(other, pd.DataFrame({"id": [2], "name": ["Zed"]}))
+    runner = _runner()
+    runner.run(pipeline)
+    run = runner.run(pipeline, {"customers": other})
+    assert _statuses(run)["s1"] == "cached"
+    assert run.result["name"].tolist()[1] == "Zed"
+
+
+def test_save_and_load_round_trip(tmp_path):
+    orders, customers = _books(tmp_path)
+    pipeline = _pipeline(tmp_path, orders, customers)
+    path = str(tmp_path / "p.json")
+    pipeline.save(path)
+    loaded = Pipeline.load(path)
+    assert loaded.to_dict() == pipeline.to_dict()
+    assert _statuses(_runner().run(loaded)) == {"s1": "ran", "s2": "ran", "s3": "ran", "s4": "ran"}
+
+
+@pytest.mark.parametrize("edit, message", [
+    (lambda d: d.update(version=99), "Not a pipeline file"),
+    (lambda d: d["steps"][0].update(op="explode"), "Unknown step op"),
+    (lambda d: d["steps"][0]["inputs"].update(extra={"step": "s1"}), "concat reads sheet"),
+    (lambda d: d["steps"][2]["inputs"].update(main={"step": "s4"}), "before it runs"),
+    (lambda d: d["sources"].pop("customers"), "unknown source"),
+    (lambda d: d["steps"][3]["params"].pop("output"), "export needs an output"),
+])
+def test_load_rejects_broken_files(tmp_path, edit, message):
+    orders, customers = _books(tmp_path)
+    data = _pipeline(tmp_path, orders, customers).to_dict()
+    edit(data)
+    path = tmp_path / "p.json"
+    path.write_text(json.dumps(data))
+    with pytest.raises(PipelineError, match=message):
+        Pipeline.load(str(path))
+
+
+def test_missing_source_file(tmp_path):
+    orders, customers = _books(tmp_path)
+    pipeline = _pipeline(tmp_path, orders, customers)
+    with pytest.raises(PipelineError, match="file not found"):
+        _runner().run(pipeline, {"customers": str(tmp_path / "gone.xlsx")})
+
+
+def test_cli_replays_a_saved_pipeline(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(engine, "DISK_CACHE_MB", 0)
+    orders, customers = _books(tmp_path)
+    path = str(tmp_path / "p.json")
+    _pipeline(tmp_path, orders, customers).save(path)
+    other = str(tmp_path / "other.xlsx")
+    _write(other, pd.DataFrame({"id": [1], "name": ["Zed"]}))
+    assert cli.main(["pipeline", path, "--source", f"customers={other}"]) == cli.EXIT_OK
+    out = capsys.readouterr().out
+    assert "4 step(s) ran, 0 served from cache" in out
+    assert pd.read_csv(tmp_path / "out" / "joined.csv")["name"].tolist()[0] == "Zed"
+    assert cli.main(["pipeline", path, "--source", f"customers={tmp_path / 'gone.xlsx'}"]) == cli.EXIT_INPUT
+    with pytest.raises(SystemExit):
+        cli.main(["pipeline", path, "--source", "nobody=x.xlsx"])
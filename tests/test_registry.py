@@ -0,0 +1,147 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import SheetCache, SheetRegistry, frame_nbytes
+
+
+def _frame(n=1000):
+    return pd.DataFrame({"a": np.arange(n, dtype=np.int64), "b": np.arange(n, dtype=np.float64) / 2})
+
+
+def _workbook(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame({"id": [1, 2, 3], "name": ["x", "y", "z"], "qty": [1.5, 2.5, 3.5]}).to_excel(
+            writer, sheet_name="Data", index=False)
+        pd.DataFrame({"k": ["a", "b"]}).to_excel(writer, sheet_name="Other", index=False)
+    return path
+
+
+def test_cache_evicts_the_least_recently_used_past_the_budget():
+    size = frame_nbytes(_frame())
+    cache = SheetCache(size * 2)
+    cache.put("a", _frame())
+    cache.put("b", _frame())
+    cache.get("a")
+    cache.put("c", _frame())
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.used == size * 2
+
+
+def test_cache_keeps_a_sheet_larger_than_the_budget():
+    cache = SheetCache(1)
+    cache.put("a", _frame())
+    cache.put("b", _frame())
+    assert "b" in cache and "a" not in cache
+    assert cache.used == frame_nbytes(_frame())
+
+
+def test_cache_replace_and_discard_keep_the_byte_count():
+    cache = SheetCache(1 << 30)
+    cache.put(("p", "s1"), _frame(10))
+    cache.put(("p", "s1"), _frame(100))
+    cache.put(("q", "s1"), _frame(10))
+    assert cache.used == frame_nbytes(_frame(100)) + frame_nbytes(_frame(10))
+    cache.discard_where(lambda k: k[0] == "p")
+    assert cache.used == frame_nbytes(_frame(10))
+    cache.clear()
+    assert cache.used == 0 and ("q", "s1") not in cache
+
+
+def test_registry_opens_without_parsing(tmp_path):
+    path = _workbook(tmp_path)
+    registry = SheetRegistry(SheetCache(1 << 30))
+    registry.open(path)
+    assert path in registry
+    assert registry.sheet_names(path) == ["Data", "Other"]
+    assert registry.dimensions(path, "Data") == (4, 3)     # header row included
+    assert not registry.is_loaded(path, "Data")
+    df = registry.get(path, "Data")
+    assert df["name"].tolist() == ["x", "y", "z"]
+    assert registry.is_loaded(path, "Data") and not registry.is_loaded(path, "Other")
+    assert registry.get(path, "Data") is df
+
+
+def test_registry_pins_edits_past_eviction(tmp_path):
+    path = _workbook(tmp_path)
+    registry = SheetRegistry(SheetCache(1))
+    registry.open(path)
+    registry.get(path, "Data")
+    edited = pd.DataFrame({"id": [9], "name": ["w"]})
+    registry.set(path, "Data", edited)
+    registry.get(path, "Other")
+    registry.get(path, "Other")
+    assert registry.get(path, "Data") is edited
+    assert registry.dimensions(path, "Data") == (1, 2)
+    registry.remove(path)
+    assert path not in registry
+    assert not registry.is_loaded(path, "Data")
+
+
+def test_projections_are_read_alone_and_cached(tmp_path):
+    path = _workbook(tmp_path)
+    registry = SheetRegistry(SheetCache(1 << 30))
+    registry.open(path)
+    assert registry.columns(path, "Data") == ["id", "name", "qty"]
+    part = registry.get(path, "Data", usecols=["qty", "id"])
+    assert list(part.columns) == ["qty", "id"]
+    assert part["id"].tolist() == [1, 2, 3]
+    assert not registry.is_loaded(path, "Data")
+    assert registry.get(path, "Data", usecols=["qty", "id"]) is part
+    assert registry.get(path, "Data", nrows=2)["name"].tolist() == ["x", "y"]
+    # once the whole sheet is parsed, projections are cut from it
+    df = registry.get(path, "Data")
+    assert registry.get(path, "Data", usecols=["name"])["name"].tolist() == df["name"].tolist()
+
+
+def _slow_parses(registry):
+    release, calls = threading.Event(), []
+    parse = registry._parse
+
+    def slow_parse(path, sheet, usecols=None, nrows=None):
+        calls.append(sheet)
+        assert release.wait(10)
+        return parse(path, sheet, usecols, nrows)
+
+    registry._parse = slow_parse
+    return release, calls
+
+
+def test_concurrent_gets_share_one_parse(tmp_path):
+    path = _workbook(tmp_path)
+    registry = SheetRegistry(SheetCache(1 << 26))
+    registry.open(path)
+    release, calls = _slow_parses(registry)
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(registry.get, path, "Data") for _ in range(3)]
+        while not registry._loading:
+            time.sleep(0.01)
+        release.set()
+        frames = [f.result(10) for f in futures]
+    assert calls == ["Data"]
+    assert all(df is frames[0] for df in frames)
+    assert not registry._loading
+
+
+def test_failed_parse_reaches_waiters_and_is_retried(tmp_path):
+    path = _workbook(tmp_path)
+    registry = SheetRegistry(SheetCache(1 << 26))
+    registry.open(path)
+    release, calls = _slow_parses(registry)
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(registry.get, path, "Missing") for _ in range(2)]
+        while not registry._loading:
+            time.sleep(0.01)
+        time.sleep(0.2)     # the second caller is waiting on the first one's parse
+        release.set()
+        for f in futures:
+            with pytest.raises(Exception):
+                f.result(10)
+    assert calls == ["Missing"]
+    assert not registry._loading
+    assert registry.get(path, "Data")["id"].tolist() == [1, 2, 3]
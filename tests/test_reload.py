@@ -0,0 +1,111 @@
+import os
+
+import pandas as pd
+
+from engine import DiskCache, FileWatcher, SheetCache, SheetRegistry, file_stamp
+
+
+def _save(path, sheets, bump=1):
+    with pd.ExcelWriter(path) as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name, index=False)
+    # a new stamp even where mtimes are coarse
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + bump * 1_000_000_000))
+
+
+def _sheets():
+    return {
+        "Same": pd.DataFrame({"a": [1, 2]}),
+        "Changes": pd.DataFrame({"a": [1, 2]}),
+        "Goes": pd.DataFrame({"a": [1]}),
+        "Edited": pd.DataFrame({"a": [1]}),
+        "Unread": pd.DataFrame({"a": [1]}),
+    }
+
+
+def _opened(tmp_path, disk_cache=None):
+    path = str(tmp_path / "book.xlsx")
+    _save(path, _sheets())
+    registry = SheetRegistry(SheetCache(1 << 28), disk_cache)
+    registry.open(path)
+    for sheet in ("Same", "Changes", "Goes"):
+        registry.get(path, sheet)
+    registry.set(path, "Edited", pd.DataFrame({"a": [9]}))
+    return registry, path
+
+
+def _rewrite(path):
+    sheets = _sheets()
+    sheets["Changes"] = pd.DataFrame({"a": [1, 3]})
+    sheets["Edited"] = pd.DataFrame({"a": [2]})
+    del sheets["Goes"]
+    sheets["New"] = pd.DataFrame({"b": ["x"]})
+    _save(path, sheets, bump=2)
+
+
+def test_reload_classifies_sheets(tmp_path):
+    registry, path = _opened(tmp_path)
+    same = registry.get(path, "Same")
+    versions = {s: registry.version(path, s) for s in ("Same", "Changes", "Edited")}
+    _rewrite(path)
+    report = registry.reload(path)
+    # a sheet never parsed can't be compared, so it counts as changed
+    assert report == {"changed": ["Changes", "Unread"], "added": ["New"], "removed": ["Goes"], "edited": ["Edited"]}
+    assert registry.get(path, "Same") is same
+    assert registry.version(path, "Same") == versions["Same"]
+    assert registry.get(path, "Changes")["a"].tolist() == [1, 3]
+    assert registry.version(path, "Changes") != versions["Changes"]
+    # edits survive the reload
+    assert registry.get(path, "Edited")["a"].tolist() == [9]
+    assert registry.version(path, "Edited") == versions["Edited"]
+    assert registry.sheet_names(path) == ["Same", "Changes", "Edited", "Unread", "New"]
+
+
+def test_reload_with_the_disk_cache(tmp_path):
+    registry, path = _opened(tmp_path, DiskCache(str(tmp_path / "cache"), 1 << 30))
+    same = registry.get(path, "Same")
+    _rewrite(path)
+    report = registry.reload(path)
+    assert report["changed"] == ["Changes", "Unread"]
+    assert registry.get(path, "Same") is same
+    assert registry.get(path, "Changes")["a"].tolist() == [1, 3]
+
+
+def test_reload_of_a_closed_workbook(tmp_path):
+    registry, path = _opened(tmp_path)
+    registry.remove(path)
+    assert registry.reload(path) is None
+
+
+def test_watcher_reports_a_change_once_it_settles(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    _save(path, {"Sheet1": pd.DataFrame({"a": [1]})})
+    seen = []
+    watcher = FileWatcher(seen.append, interval=0)
+    watcher.watch(path)
+    assert watcher.check() == []
+    _save(path, {"Sheet1": pd.DataFrame({"a": [2]})}, bump=2)
+    # first sighting of the new stamp: the save may still be going on
+    assert watcher.check() == []
+    assert watcher.check() == [path]
+    assert seen == [path]
+    assert watcher.check() == []
+
+
+def test_watcher_ignores_a_briefly_missing_file_and_unwatched_paths(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    _save(path, {"Sheet1": pd.DataFrame({"a": [1]})})
+    stamp = file_stamp(path)
+    watcher = FileWatcher(interval=0)
+    watcher.watch(path, stamp)
+    moved = path + ".bak"
+    os.replace(path, moved)
+    assert watcher.check() == [] and watcher.check() == []
+    os.replace(moved, path)
+    assert watcher.check() == []
+    _save(path, {"Sheet1": pd.DataFrame({"a": [2]})}, bump=2)
+    watcher.check()
+    watcher.unwatch(path)
+    assert watcher.check() == []
+    assert not watcher.running
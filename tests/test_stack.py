@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from engine import (STACK_SOURCE_COLUMN, SheetCache, SheetRegistry, StackError, describe_stack, match_sheets,
+                    run_stack, stack_frames)
+
+
+def test_headers_match_ignoring_case_and_spaces():
+    a = pd.DataFrame({"Region": ["N"], "Qty": [1]})
+    b = pd.DataFrame({" qty ": [2], "REGION": ["S"]})
+    out, report = stack_frames([a, b], ["a.xlsx", "b.xlsx"])
+    assert list(out.columns) == [STACK_SOURCE_COLUMN, "Region", "Qty"]
+    assert out.values.tolist() == [["a.xlsx", "N", 1], ["b.xlsx", "S", 2]]
+    assert report == {"sheets": 2, "rows": 2, "columns": 2, "missing": {}, "retyped": {}}
+
+
+def test_missing_columns_are_blank_and_reported():
+    a = pd.DataFrame({"id": [1, 2], "note": ["x", "y"], "when": pd.to_datetime(["2024-01-01", "2024-01-02"])})
+    b = pd.DataFrame({"id": [3]})
+    out, report = stack_frames([a, b], ["a", "b"])
+    assert report["missing"] == {"note": ["b"], "when": ["b"]}
+    assert out["note"].isna().tolist() == [False, False, True]
+    # the blanks take the column's dtype rather than turning it into object
+    assert pd.api.types.is_datetime64_any_dtype(out["when"].dtype)
+    assert out["id"].tolist() == [1, 2, 3]
+    assert "2 column(s) blank in some sheets" in describe_stack(report)
+
+
+def test_categoricals_stack_over_the_union_of_categories():
+    a = pd.DataFrame({"c": pd.Categorical(["x", "y"])})
+    b = pd.DataFrame({"c": pd.Categorical(["y", "z"])})
+    c = pd.DataFrame({"other": [1]})
+    out, _ = stack_frames([a, b, c], ["a", "b", "c"])
+    assert isinstance(out["c"].dtype, pd.CategoricalDtype)
+    assert sorted(out["c"].cat.categories) == ["x", "y", "z"]
+    assert out["c"].tolist()[:4] == ["x", "y", "y", "z"] and pd.isna(out["c"].iloc[4])
+
+
+def test_mixed_types_are_reported():
+    a = pd.DataFrame({"v": np.array([1, 2], dtype=np.int8), "w": [1, 2]})
+    b = pd.DataFrame({"v": np.array([3], dtype=np.int32), "w": ["three"]})
+    out, report = stack_frames([a, b], ["a", "b"])
+    assert list(report["retyped"]) == ["w"]
+    assert out["v"].tolist() == [1, 2, 3]
+    assert out["w"].tolist() == [1, 2, "three"]
+    assert "mixed types in w" in describe_stack(report)
+
+
+@pytest.mark.parametrize("columns", [["id", "ID"], ["id", " id"]])
+def test_duplicate_headers_are_refused(columns):
+    bad = pd.DataFrame([[1, 2]], columns=columns)
+    with pytest.raises(StackError, match="bad.xlsx has duplicate column names"):
+        stack_frames([pd.DataFrame({"id": [0]}), bad], ["ok.xlsx", "bad.xlsx"])
+    with pytest.raises(StackError):
+        stack_frames([], [])
+
+
+def test_source_column_gets_a_suffix_on_collision():
+    a = pd.DataFrame({STACK_SOURCE_COLUMN: ["kept"], f"{STACK_SOURCE_COLUMN}_": ["also kept"]})
+    out, _ = stack_frames([a], ["a"])
+    assert list(out.columns) == [f"{STACK_SOURCE_COLUMN}__", STACK_SOURCE_COLUMN, f"{STACK_SOURCE_COLUMN}_"]
+    assert out.iloc[0].tolist() == ["a", "kept", "also kept"]
+    out, _ = stack_frames([a], ["a"], source_col="From")
+    assert out.columns[0] == "From"
+
+
+
+def test_repeated_labels_share_a_category():
+    a, b = pd.DataFrame({"x": [1, 2]}), pd.DataFrame({"x": [3]})
+    out, _ = stack_frames([a, b, a], ["one", "two", "one"])
+    assert out[STACK_SOURCE_COLUMN].tolist() == ["one", "one", "two", "one", "one"]
+    assert list(out[STACK_SOURCE_COLUMN].cat.categories) == ["one", "two"]
+
+def _books(tmp_path):
+    paths = []
+    for i, region in enumerate(["North", "South"]):
+        path = str(tmp_path / f"{region}.xlsx")
+        with pd.ExcelWriter(path) as writer:
+            pd.DataFrame({"Qty": [i, i + 10]}).to_excel(writer, sheet_name="Sales 2024", index=False)
+            pd.DataFrame({"qty": [i + 100]}).to_excel(writer, sheet_name="sales 2023", index=False)
+            pd.DataFrame({"x": [0]}).to_excel(writer, sheet_name="Notes", index=False)
+        paths.append(path)
+    return paths
+
+
+def test_run_stack_over_workbooks(tmp_path):
+    registry = SheetRegistry(SheetCache(1 << 28))
+    paths = _books(tmp_path)
+    for path in paths:
+        registry.open(path)
+    assert match_sheets(registry, paths) == [(paths[0], "Sales 2024"), (paths[1], "Sales 2024")]
+    sources = match_sheets(registry, paths, "SALES*")
+    assert len(sources) == 4
+    out, report = run_stack(registry, match_sheets(registry, paths), workers=2)
+    assert out[STACK_SOURCE_COLUMN].tolist() == ["North.xlsx"] * 2 + ["South.xlsx"] * 2
+    assert out["Qty"].tolist() == [0, 10, 1, 11]
+    # several sheets of one workbook are told apart by sheet name
+    out, report = run_stack(registry, sources, workers=1)
+    assert report["sheets"] == 4 and list(out.columns) == [STACK_SOURCE_COLUMN, "Qty"]
+    assert out[STACK_SOURCE_COLUMN].iloc[2] == "North.xlsx::sales 2023"
+    # the same sheet listed twice is stacked twice
+    out, report = run_stack(registry, [sources[0], sources[0]], workers=2)
+    assert report["sheets"] == 2 and out["Qty"].tolist() == [0, 10, 0, 10]